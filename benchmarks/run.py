@@ -0,0 +1,468 @@
+"""
+Benchmark suite for the JokeMachine hot paths.
+
+Each benchmark runs against synthetic corpora and favorites files of the
+requested sizes and reports the best and median time per call. Results are
+written as JSON and can be compared against a stored baseline::
+
+    python benchmarks/run.py                              # default sizes
+    python benchmarks/run.py --sizes 10,1e4,1e6,1e7       # up to 10M entries
+    python benchmarks/run.py --save-baseline              # store a baseline
+    python benchmarks/run.py --threshold 0.1 --threshold list_favorites=0.5
+
+The run exits with status 1 if any benchmark is slower than its baseline by
+more than the threshold (a fraction, 0.25 means 25% slower).
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from joke_machine import app
+from joke_machine.corpus import PackedCorpus, compile_corpus, write_packed_corpus
+from joke_machine.delivery import plan_delivery
+from joke_machine.favorites_db import SQLiteFavorites
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_SIZES = [10, 1_000, 100_000]
+DEFAULT_THRESHOLD = 0.25
+CATEGORIES = ["programming", "dad", "puns"]
+
+BENCHMARKS = {}
+
+
+def benchmark(name, sized=True):
+    """Register a benchmark; ``sized`` ones run once per corpus size."""
+
+    def register(setup):
+        BENCHMARKS[name] = (setup, sized)
+        return setup
+
+    return register
+
+
+# Synthetic data -------------------------------------------------------------
+
+
+def synthetic_joke(i):
+    """Return a deterministic joke of one of the three delivery shapes."""
+    kind = i % 3
+    if kind == 0:
+        return f"Why did joke {i} cross the road? To reach punchline {i}!"
+    if kind == 1:
+        return f"I told joke {i} to a friend. They groaned {i % 7} times."
+    return f"Joke {i} has no punchline break at all"
+
+
+def synthetic_jokes(size):
+    """Return ``{category: [joke, ...]}`` with ``size`` jokes in total."""
+    jokes = {category: [] for category in CATEGORIES}
+    for i in range(size):
+        jokes[CATEGORIES[i % len(CATEGORIES)]].append(synthetic_joke(i))
+    return jokes
+
+
+def synthetic_favorites(size):
+    """Yield ``size`` favorites entries in save order."""
+    for i in range(size):
+        day = 1 + i % 28
+        yield {"joke": synthetic_joke(i), "saved_at": f"2024-02-{day:02d} 12:00:00"}
+
+
+def cached_file(workdir, name, build):
+    """Return workdir/name, calling ``build(path)`` first if it is missing."""
+    path = os.path.join(workdir, name)
+    if not os.path.exists(path):
+        build(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def write_favorites(path, size):
+    """Write ``size`` JSON Lines favorites to ``path``."""
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        for entry in synthetic_favorites(size):
+            f.write(json.dumps(entry) + "\n")
+
+
+def write_sqlite_favorites(path, size):
+    """Write ``size`` favorites to a SQLite store at ``path``."""
+    with SQLiteFavorites(path) as store:
+        store.extend(synthetic_favorites(size))
+
+
+@contextmanager
+def favorites_copy(workdir, source):
+    """Point $JOKE_MACHINE_FAVORITES at a scratch copy of ``source``."""
+    suffix = os.path.splitext(source)[1]
+    scratch = os.path.join(workdir, f"scratch{suffix}")
+    shutil.copyfile(source, scratch)
+    try:
+        with patch.dict(os.environ, {"JOKE_MACHINE_FAVORITES": scratch}):
+            yield scratch
+    finally:
+        for path in (scratch, scratch + ".lock", scratch + "-wal", scratch + "-shm"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+# Benchmarks -----------------------------------------------------------------
+#
+# Each setup function is a generator that yields the callable to time; code
+# after the yield is the teardown.
+
+
+@benchmark("get_joke")
+def bench_get_joke(size, workdir):
+    with patch.object(app, "JOKES", synthetic_jokes(size)):
+        app.get_catalog()
+        yield app.get_joke
+
+
+@benchmark("get_joke_category")
+def bench_get_joke_category(size, workdir):
+    with patch.object(app, "JOKES", synthetic_jokes(size)):
+        yield lambda: app.get_joke("dad")
+
+
+@benchmark("get_jokes_100")
+def bench_get_jokes(size, workdir):
+    with patch.object(app, "JOKES", synthetic_jokes(size)):
+        app.get_catalog()
+        yield lambda: app.get_jokes(100)
+
+
+@benchmark("get_joke_corpus")
+def bench_get_joke_corpus(size, workdir):
+    path = cached_file(
+        workdir,
+        f"corpus-{size}.jpk",
+        lambda path: write_packed_corpus(path, synthetic_jokes(size)),
+    )
+    with PackedCorpus(path) as corpus:
+        previous = app.use_corpus(corpus)
+        try:
+            yield app.get_joke
+        finally:
+            app.use_corpus(previous)
+
+
+@benchmark("load_corpus_cached")
+def bench_load_corpus_cached(size, workdir):
+    def write_source(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(synthetic_jokes(size), f)
+
+    source = cached_file(workdir, f"corpus-{size}.json", write_source)
+    directory = os.path.join(workdir, "cache")
+    compile_corpus(source, app.FUN_FACTS, directory=directory).close()
+    yield lambda: compile_corpus(source, app.FUN_FACTS, directory=directory).close()
+
+
+@benchmark("split")
+def bench_split(size, workdir):
+    jokes = [synthetic_joke(i) for i in range(min(size, 10_000))]
+    position = iter(range(sys.maxsize))
+
+    def split():
+        plan_delivery(jokes[next(position) % len(jokes)], 0)
+
+    yield split
+
+
+@benchmark("split_catalog")
+def bench_split_catalog(size, workdir):
+    with patch.object(app, "JOKES", synthetic_jokes(size)):
+        jokes = app.get_catalog().texts
+        app.get_catalog().position(jokes[0])
+        position = iter(range(sys.maxsize))
+
+        def split():
+            joke = jokes[next(position) % len(jokes)]
+            plan_delivery(joke, 0, parts=app._split(joke))
+
+        yield split
+
+
+@benchmark("tell_joke_with_delay", sized=False)
+def bench_tell_joke(size, workdir):
+    sink = io.StringIO()
+    with patch("time.sleep"), redirect_stdout(sink):
+        yield lambda: app.tell_joke_with_delay(synthetic_joke(0))
+
+
+@benchmark("save_favorite")
+def bench_save_favorite(size, workdir):
+    source = cached_file(
+        workdir, f"favorites-{size}.json", lambda path: write_favorites(path, size)
+    )
+    counter = iter(range(size, sys.maxsize))
+    with favorites_copy(workdir, source), redirect_stdout(io.StringIO()):
+        yield lambda: app.save_favorite(synthetic_joke(next(counter)))
+
+
+@benchmark("save_favorite_sqlite")
+def bench_save_favorite_sqlite(size, workdir):
+    source = cached_file(
+        workdir,
+        f"favorites-{size}.db",
+        lambda path: write_sqlite_favorites(path, size),
+    )
+    counter = iter(range(size, sys.maxsize))
+    with favorites_copy(workdir, source), redirect_stdout(io.StringIO()):
+        yield lambda: app.save_favorite(synthetic_joke(next(counter)))
+
+
+@benchmark("list_favorites")
+def bench_list_favorites(size, workdir):
+    source = cached_file(
+        workdir, f"favorites-{size}.json", lambda path: write_favorites(path, size)
+    )
+    with favorites_copy(workdir, source), open(os.devnull, "w") as devnull:
+        with redirect_stdout(devnull):
+            yield lambda: app.list_favorites(pager=False)
+
+
+@benchmark("list_favorites_page")
+def bench_list_favorites_page(size, workdir):
+    source = cached_file(
+        workdir,
+        f"favorites-{size}.db",
+        lambda path: write_sqlite_favorites(path, size),
+    )
+    with favorites_copy(workdir, source), open(os.devnull, "w") as devnull:
+        with redirect_stdout(devnull):
+            yield lambda: app.list_favorites(limit=20, offset=size // 2, pager=False)
+
+
+def _cold_start(*args):
+    command = [sys.executable, "-m", "joke_machine", *args]
+    return lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+
+
+@benchmark("cold_start_version", sized=False)
+def bench_cold_start_version(size, workdir):
+    yield _cold_start("--version")
+
+
+@benchmark("cold_start_fact", sized=False)
+def bench_cold_start_fact(size, workdir):
+    yield _cold_start("--fact")
+
+
+# Runner ---------------------------------------------------------------------
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """
+    Time ``func`` and return ``(best, median, calls)`` in seconds per call.
+
+    The loop count is grown until one repetition takes at least ``min_time``.
+    Slow functions that take longer than a second per call are only repeated
+    twice.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    times = [elapsed / number]
+    if elapsed / number > 1:
+        repeat = min(repeat, 2)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return min(times), statistics.median(times), number * len(times)
+
+
+def run(names, sizes, workdir, min_time=0.2, repeat=5, log=print):
+    """Run the selected benchmarks and return ``{key: result}``."""
+    results = {}
+    for name in names:
+        setup, sized = BENCHMARKS[name]
+        for size in sizes if sized else [None]:
+            key = f"{name}[{size}]" if sized else name
+            # Seed the global RNG so every run draws the same jokes
+            random.seed(0)
+            steps = setup(size or 0, workdir)
+            func = next(steps)
+            try:
+                best, median, calls = measure(func, min_time, repeat)
+            finally:
+                steps.close()
+            results[key] = {
+                "benchmark": name,
+                "size": size,
+                "best": best,
+                "median": median,
+                "calls": calls,
+            }
+            log(f"{key:40} {format_time(best):>10} {format_time(median):>10}")
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, overrides=None):
+    """
+    Compare results against a baseline.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        ``{key: result}`` mappings as returned by :func:`run`.
+    threshold : float, optional
+        Allowed slowdown as a fraction of the baseline time.
+    overrides : dict, optional
+        Per-benchmark thresholds keyed by benchmark name or result key.
+
+    Returns
+    -------
+    list of tuple
+        ``(key, baseline, current, change, regressed)`` for every key present
+        in both mappings, where ``change`` is the relative change of the best
+        time.
+    """
+    overrides = overrides or {}
+    rows = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["best"], result["best"]
+        change = after / before - 1 if before else 0.0
+        limit = overrides.get(key, overrides.get(result["benchmark"], threshold))
+        rows.append((key, before, after, change, change > limit))
+    return rows
+
+
+def format_time(seconds):
+    """Format a duration with a readable unit."""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def parse_size(text):
+    """Parse a size such as ``1000``, ``1e6`` or ``10M``."""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    if scale > 1:
+        text = text[:-1]
+    return int(float(text) * scale)
+
+
+def parse_thresholds(values):
+    """Split ``--threshold`` values into a default and per-benchmark limits."""
+    default, overrides = DEFAULT_THRESHOLD, {}
+    for value in values:
+        name, sep, limit = value.rpartition("=")
+        if sep:
+            overrides[name] = float(limit)
+        else:
+            default = float(limit)
+    return default, overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the JokeMachine.")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="Comma-separated corpus and favorites sizes, e.g. 10,1e4,10M",
+    )
+    parser.add_argument(
+        "--only", action="append", choices=sorted(BENCHMARKS), metavar="NAME"
+    )
+    parser.add_argument("--output", "-o", help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        action="append",
+        default=[],
+        metavar="[NAME=]FRACTION",
+        help=f"Allowed slowdown, overall or per benchmark "
+        f"(default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--workdir", help="Keep generated corpora here between runs (default: temp)"
+    )
+    parser.add_argument("--list", action="store_true", help="List the benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(sorted(BENCHMARKS)))
+        return 0
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    default, overrides = parse_thresholds(args.threshold)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="joke-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    print(f"{'benchmark':40} {'best':>10} {'median':>10}")
+    try:
+        results = run(
+            args.only or list(BENCHMARKS), sizes, workdir, args.min_time, args.repeat
+        )
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+
+    rows = compare(results, baseline, default, overrides)
+    print(f"\n{'benchmark':40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(
+            f"{key:40} {format_time(before):>10} {format_time(after):>10}"
+            f" {change:>+8.1%}{flag}"
+        )
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
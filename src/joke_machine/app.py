@@ -1,17 +1,22 @@
 """
 JokeMachine - A fun tool that generates jokes, puns, and programming humor
 using Python's standard library.
+
+The CLI is started from shell prompts and cron jobs many times an hour, so
+only what every invocation needs is imported here. Modules used by a single
+feature (argument parsing, favorites, corpus files, paging) are imported in
+the functions that use them.
 """
 # ruff: noqa: W291
 
-import argparse
-import json
 import os
 import random
 import sys
-import textwrap
 import time
-from datetime import datetime
+from array import array
+
+from joke_machine.catalog import JokeCatalog, sample_spans
+from joke_machine.delivery import deliver, plan_delivery
 
 __version__ = "0.1.0"
 
@@ -55,6 +60,43 @@ JOKES = {
     ],
 }
 
+# Flat index over JOKES, rebuilt only when the categories change
+_catalog = None
+
+# Optional on-disk corpus served instead of JOKES and FUN_FACTS, see use_corpus()
+_corpus = None
+
+# Per-session memory of recently told jokes, see get_unseen_joke()
+_sampler = None
+
+# Favorite-weighted sampler over get_catalog().texts, see get_popular_joke()
+_popularity = None
+
+# Extra weight a joke gets each time it is saved as a favorite
+FAVORITE_BOOST = 1.0
+
+# Inverted index over jokes and fun facts, see search_jokes()
+_search_index = None
+
+# Sharded per-user favorites, opened once per directory, see open_favorites_store()
+_user_favorites = None
+
+# In-memory favorites with write-behind saving, see use_favorites_cache()
+_favorites_cache = None
+
+# Counters and latency histograms, see use_metrics()
+_metrics = None
+
+# Active profiler, whose clock stops during pauses and prompts, see use_profiler()
+_profiler = None
+
+# Output formats of stream_batch(), and records drawn per written chunk
+BATCH_FORMATS = ("jsonl", "tsv")
+BATCH_CHUNK_SIZE = 64 * 1024
+
+# Encoded lines stream_batch() remembers for records drawn again
+BATCH_MEMO_SIZE = 64 * 1024
+
 # Collection of fun facts
 FUN_FACTS = [
     "A day on Venus is longer than a year on Venus.",
@@ -122,14 +164,103 @@ def get_joke(category=None):
     >>> any(joke in jokes for jokes in JOKES.values())
     True
     """
+    if _metrics is not None:
+        next(_metrics.draws[category])
+
+    if _corpus is not None:
+        return _corpus.get_joke(category)
+
     if category and category in JOKES:
         return random.choice(JOKES[category])
 
     # If no category specified or invalid category, choose from all jokes
-    all_jokes = []
-    for jokes in JOKES.values():
-        all_jokes.extend(jokes)
-    return random.choice(all_jokes)
+    return random.choice(get_catalog().texts)
+
+
+def get_jokes(
+    n, category=None, unique=False, weights=None, seed=None, as_indices=False
+):
+    """
+    Get ``n`` random jokes in a single sampling pass.
+
+    Parameters
+    ----------
+    n : int
+        Number of jokes to draw.
+    category : str, optional
+        The joke category to select from. If None or invalid, jokes from any
+        category will be returned.
+    unique : bool, optional
+        Draw without replacement, so no joke appears twice. Default is False.
+    weights : dict, optional
+        Relative share of draws per category, e.g. ``{"dad": 2, "puns": 1}``.
+        Only used when no category is given.
+    seed : int, optional
+        Seed for a dedicated random number generator, making the batch
+        reproducible. If None, the global ``random`` state is used.
+    as_indices : bool, optional
+        Return positions into ``get_catalog().texts`` (or record numbers of
+        the active corpus) as a compact ``array.array`` instead of a list of
+        strings. Default is False.
+
+    Returns
+    -------
+    list of str or array.array
+        The drawn jokes, or their positions if ``as_indices`` is set.
+
+    Examples
+    --------
+    >>> jokes = get_jokes(5, category='dad', seed=42)
+    >>> len(jokes)
+    5
+    >>> all(joke in JOKES['dad'] for joke in jokes)
+    True
+    >>> get_jokes(5, seed=1) == get_jokes(5, seed=1)
+    True
+    >>> len(set(get_jokes(10, category='puns', unique=True)))
+    10
+    """
+    rng = random.Random(seed) if seed is not None else None
+    if _metrics is not None:
+        _metrics.count("draws_total", n, category)
+    if _corpus is not None:
+        indices = sample_spans(
+            _corpus.spans, len(_corpus), n, category, unique, weights, rng
+        )
+        return indices if as_indices else [_corpus.text(i) for i in indices]
+
+    catalog = get_catalog()
+    indices = catalog.sample(n, category, unique=unique, weights=weights, rng=rng)
+    if as_indices:
+        return indices
+    texts = catalog.texts
+    return [texts[i] for i in indices]
+
+
+def get_catalog():
+    """
+    Get the flat joke index for the current ``JOKES`` collection.
+
+    The index is shared between calls and rebuilt only when ``JOKES`` is
+    replaced or one of its categories is added, removed or resized.
+
+    Returns
+    -------
+    JokeCatalog
+        The catalog indexing every joke in ``JOKES``.
+
+    Examples
+    --------
+    >>> catalog = get_catalog()
+    >>> len(catalog) == sum(len(jokes) for jokes in JOKES.values())
+    True
+    >>> get_catalog() is catalog
+    True
+    """
+    global _catalog
+    if _catalog is None or _catalog.source is not JOKES:
+        _catalog = JokeCatalog(JOKES)
+    return _catalog
 
 
 def get_fun_fact():
@@ -149,9 +280,558 @@ def get_fun_fact():
     >>> fact in FUN_FACTS
     True
     """
+    if _corpus is not None:
+        return _corpus.get_fun_fact()
     return random.choice(FUN_FACTS)
 
 
+def get_fun_facts(n, unique=False, seed=None, as_indices=False):
+    """
+    Get ``n`` random fun facts in a single sampling pass.
+
+    Parameters
+    ----------
+    n : int
+        Number of facts to draw.
+    unique : bool, optional
+        Draw without replacement. Default is False.
+    seed : int, optional
+        Seed for a dedicated random number generator. If None, the global
+        ``random`` state is used.
+    as_indices : bool, optional
+        Return positions into ``FUN_FACTS`` (or record numbers of the active
+        corpus) as a compact ``array.array`` instead of a list of strings.
+        Default is False.
+
+    Returns
+    -------
+    list of str or array.array
+        The drawn facts, or their positions if ``as_indices`` is set.
+
+    Examples
+    --------
+    >>> facts = get_fun_facts(3, seed=42)
+    >>> all(fact in FUN_FACTS for fact in facts)
+    True
+    >>> sorted(get_fun_facts(len(FUN_FACTS), unique=True)) == sorted(FUN_FACTS)
+    True
+    """
+    rng = random.Random(seed) if seed is not None else random
+    if _corpus is not None:
+        population = range(*_corpus.fact_span)
+    else:
+        population = range(len(FUN_FACTS))
+    if unique:
+        indices = array("I", rng.sample(population, n))
+    else:
+        indices = array("I", rng.choices(population, k=n))
+    if as_indices:
+        return indices
+    if _corpus is not None:
+        return [_corpus.text(i) for i in indices]
+    return [FUN_FACTS[i] for i in indices]
+
+
+def stream_batch(
+    count, facts=False, category=None, fmt="jsonl", header=False, stream=None
+):
+    """
+    Write ``count`` random jokes or fun facts to a stream, one per line.
+
+    Records are drawn in chunks with :func:`get_jokes` or
+    :func:`get_fun_facts`, records drawn again are not encoded again (up to
+    ``BATCH_MEMO_SIZE`` of them are remembered), and every chunk is joined
+    and written in one call. This keeps the output rate in
+    the millions of lines per second for pipelines.
+
+    Parameters
+    ----------
+    count : int
+        Number of lines to write.
+    facts : bool, optional
+        Write fun facts instead of jokes. Default is False.
+    category : str, optional
+        The joke category to draw from. If None or invalid, jokes from any
+        category are drawn.
+    fmt : {'jsonl', 'tsv'}, optional
+        ``jsonl`` writes ``{"category": ..., "joke": ...}`` (or
+        ``{"fact": ...}``) objects. ``tsv`` writes the same fields separated
+        by a tab, with backslash, tab and line breaks escaped as ``\\``,
+        ``\t``, ``\n`` and ``\r``. Default is 'jsonl'.
+    header : bool, optional
+        Start TSV output with a line of column names. Default is False.
+    stream : binary file-like, optional
+        Where to write UTF-8 lines. Defaults to ``sys.stdout.buffer``.
+
+    Returns
+    -------
+    int
+        Number of lines written, which is less than ``count`` if the reader
+        closed the pipe early.
+
+    Examples
+    --------
+    >>> import io
+    >>> out = io.BytesIO()
+    >>> stream_batch(2, category="dad", stream=out)
+    2
+    >>> lines = out.getvalue().decode().splitlines()
+    >>> all(line.startswith('{"category": "dad", "joke": ') for line in lines)
+    True
+    """
+    import json
+
+    if fmt not in BATCH_FORMATS:
+        raise ValueError(f"unknown format {fmt!r}, expected one of {BATCH_FORMATS}")
+
+    if _corpus is not None:
+        from bisect import bisect_right
+
+        text = _corpus.text
+        # Empty categories may share their start with the next one
+        spans = sorted(
+            (start, name)
+            for name, (start, stop) in _corpus.spans.items()
+            if stop > start
+        )
+        starts = [start for start, _ in spans]
+
+        def category_of(position):
+            return spans[bisect_right(starts, position) - 1][1]
+
+    else:
+        catalog = get_catalog()
+        text = (FUN_FACTS if facts else catalog.texts).__getitem__
+        names, ids = catalog.categories, catalog.category_ids
+
+        def category_of(position):
+            return names[ids[position]]
+
+    if fmt == "jsonl":
+        if facts:
+
+            def render(position):
+                return json.dumps({"fact": text(position)}, ensure_ascii=False)
+
+        else:
+
+            def render(position):
+                record = {"category": category_of(position), "joke": text(position)}
+                return json.dumps(record, ensure_ascii=False)
+
+    else:
+        escapes = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+        if facts:
+
+            def render(position):
+                return text(position).translate(escapes)
+
+        else:
+
+            def render(position):
+                return f"{category_of(position)}\t{text(position).translate(escapes)}"
+
+    class Lines(dict):
+        # Encoded line of each drawn position, built on first use. Starting
+        # over when full bounds memory on large corpora, where repeats are
+        # rare anyway.
+        def __missing__(self, position):
+            if len(self) >= BATCH_MEMO_SIZE:
+                self.clear()
+            self[position] = line = (render(position) + "\n").encode("utf-8")
+            return line
+
+    lines = Lines()
+    to_stdout = stream is None
+    if to_stdout:
+        sys.stdout.flush()
+        stream = sys.stdout.buffer
+    written = 0
+    try:
+        if header and fmt == "tsv":
+            stream.write(b"fact\n" if facts else b"category\tjoke\n")
+        while written < count:
+            n = min(BATCH_CHUNK_SIZE, count - written)
+            if facts:
+                positions = get_fun_facts(n, as_indices=True)
+            else:
+                positions = get_jokes(n, category, as_indices=True)
+            stream.write(b"".join(map(lines.__getitem__, positions)))
+            written += n
+        stream.flush()
+    except BrokenPipeError:
+        if to_stdout:
+            # The reader is gone; keep the interpreter from failing on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return written
+
+
+def use_corpus(corpus):
+    """
+    Serve jokes and fun facts from ``corpus`` instead of the built-in lists.
+
+    Parameters
+    ----------
+    corpus : PackedCorpus or None
+        The corpus backend to draw from. Any object providing the
+        ``PackedCorpus`` interface can be plugged in. Pass None to go back
+        to ``JOKES`` and ``FUN_FACTS``.
+
+    Returns
+    -------
+    PackedCorpus or None
+        The previously active corpus.
+
+    Examples
+    --------
+    >>> use_corpus(None) is None
+    True
+    """
+    global _corpus
+    previous, _corpus = _corpus, corpus
+    return previous
+
+
+def use_metrics(metrics):
+    """
+    Collect counters and latencies into ``metrics``.
+
+    Parameters
+    ----------
+    metrics : joke_machine.metrics.Metrics or None
+        The collector to update from now on. Pass None to stop collecting.
+
+    Returns
+    -------
+    joke_machine.metrics.Metrics or None
+        The previously active collector.
+
+    Examples
+    --------
+    >>> from joke_machine.metrics import Metrics
+    >>> metrics = Metrics()
+    >>> use_metrics(metrics) is None
+    True
+    >>> joke = get_joke('dad')
+    >>> use_metrics(None) is metrics
+    True
+    >>> metrics.draw_counts()
+    {'dad': 1}
+    """
+    global _metrics
+    previous, _metrics = _metrics, metrics
+    return previous
+
+
+def use_profiler(profiler):
+    """
+    Keep delivery pauses and prompts off the clock of ``profiler``.
+
+    Parameters
+    ----------
+    profiler : joke_machine.profiling.Profiler or None
+        The profiler to pause while the CLI waits on purpose. Pass None to
+        sleep and prompt without one.
+
+    Returns
+    -------
+    joke_machine.profiling.Profiler or None
+        The previously active profiler.
+    """
+    global _profiler
+    previous, _profiler = _profiler, profiler
+    return previous
+
+
+def start_profiling():
+    """
+    Start profiling the current thread.
+
+    Returns
+    -------
+    joke_machine.profiling.Profiler
+        The running profiler, to pass to :func:`stop_profiling`.
+    """
+    from joke_machine.profiling import Profiler
+
+    profiler = Profiler()
+    use_profiler(profiler)
+    profiler.enable()
+    return profiler
+
+
+def stop_profiling(profiler, path=None, stream=None):
+    """
+    Stop a profiler, write its profile and print a summary.
+
+    Parameters
+    ----------
+    profiler : joke_machine.profiling.Profiler
+        The profiler returned by :func:`start_profiling`.
+    path : str, optional
+        File to write the profile to. Default is ``joke-machine.prof``.
+    stream : file, optional
+        Where to print the summary. Default is stdout.
+    """
+    from joke_machine.profiling import PROFILE_FILE
+
+    profiler.disable()
+    if _profiler is profiler:
+        use_profiler(None)
+    path = path or PROFILE_FILE
+    profiler.dump(path)
+    stream = stream or sys.stdout
+    stream.write(profiler.summary())
+    stream.write(f"Profile written to {path}\n")
+
+
+def get_metrics():
+    """
+    Get the active metrics collector.
+
+    Returns
+    -------
+    joke_machine.metrics.Metrics or None
+        The collector installed by :func:`use_metrics`, if any.
+    """
+    return _metrics
+
+
+def load_corpus(path):
+    """
+    Open a corpus file and serve jokes and fun facts from it.
+
+    Parameters
+    ----------
+    path : str
+        Path of a corpus written by ``joke_machine.corpus.write_packed_corpus``,
+        or of a JSON file of ``{category: [joke, ...]}``. JSON corpora are
+        compiled once into a cached packed corpus, which is reused until the
+        file changes; their fun facts are the built-in ``FUN_FACTS``.
+
+    Returns
+    -------
+    PackedCorpus
+        The opened corpus.
+    """
+    from joke_machine.corpus import open_corpus
+
+    corpus = open_corpus(path, FUN_FACTS, __version__)
+    use_corpus(corpus)
+    return corpus
+
+
+def get_categories():
+    """
+    Get the available joke categories and their sizes.
+
+    Returns
+    -------
+    dict
+        Mapping of category name to the number of jokes in it, taken from
+        the active corpus if one is loaded and from ``JOKES`` otherwise.
+
+    Examples
+    --------
+    >>> get_categories()
+    {'programming': 10, 'dad': 10, 'puns': 10}
+    """
+    if _corpus is not None:
+        return {name: _corpus.count(name) for name in _corpus.categories}
+    return {name: len(jokes) for name, jokes in JOKES.items()}
+
+
+def get_popular_joke(category=None):
+    """
+    Get a random joke, favoring jokes that were saved as favorites.
+
+    Every joke has weight 1, plus ``FAVORITE_BOOST`` for each time it is in
+    the favorites store. Draws take O(log n) time, and saving a favorite with
+    :func:`add_favorite` updates its weight in place instead of rebuilding.
+
+    Parameters
+    ----------
+    category : str, optional
+        The joke category to select from. If None or invalid, a joke from
+        any category will be returned.
+
+    Returns
+    -------
+    str
+        The drawn joke. When a packed corpus is active, jokes are drawn
+        uniformly as by :func:`get_joke`.
+
+    Examples
+    --------
+    >>> get_popular_joke("dad") in JOKES["dad"]
+    True
+    """
+    if _corpus is not None:
+        return _corpus.get_joke(category)
+    catalog = get_catalog()
+    texts = catalog.texts
+    start, stop = catalog.spans.get(category, (0, len(texts)))
+    return texts[_popularity_sampler(catalog).sample(start, stop)]
+
+
+def _popularity_sampler(catalog):
+    """Return the weighted sampler for a catalog, building it on first use."""
+    global _popularity
+    texts = catalog.texts
+    if _popularity is None or _popularity[0] is not texts:
+        from joke_machine.sampling import WeightedSampler
+
+        weights = array("d", [1.0]) * len(texts)
+        favorites = open_favorites_store()
+        if favorites.exists():
+            try:
+                for entry in favorites:
+                    position = catalog.position(entry["joke"])
+                    if position is not None:
+                        weights[position] += FAVORITE_BOOST
+            except ValueError:
+                pass  # a damaged store only costs the popularity signal
+        _popularity = (texts, WeightedSampler(weights))
+    return _popularity[1]
+
+
+def search_jokes(query, limit=10, category=None):
+    """
+    Find jokes and fun facts by keyword.
+
+    Every word of the query must appear in a result, either whole or as the
+    start of a longer word. Results are ranked by relevance. The index is
+    built on the first search and reused until the jokes, the fun facts or
+    the active corpus change.
+
+    Parameters
+    ----------
+    query : str
+        The words to look for.
+    limit : int, optional
+        Maximum number of results. Default is 10.
+    category : str, optional
+        Only search this joke category. If None, every joke and fun fact is
+        searched.
+
+    Returns
+    -------
+    list of tuple
+        ``(category, text)`` pairs, best match first. The category is None
+        for fun facts.
+
+    Examples
+    --------
+    >>> search_jokes("hokey pok")
+    [('puns', 'I was addicted to the hokey pokey... but then I turned myself around.')]
+    """
+    index = get_search_index()
+    if category is None:
+        span = (0, len(index))
+    else:
+        span = index.spans.get(category, (0, 0))
+    return [
+        (index.label(position), index.texts[position])
+        for position in index.search(query, limit, *span)
+    ]
+
+
+def get_search_index():
+    """
+    Get the search index for the active jokes and fun facts.
+
+    Returns
+    -------
+    joke_machine.search.SearchIndex
+        An index over every joke followed by every fun fact, with the joke
+        categories as spans.
+    """
+    global _search_index
+    if _corpus is not None:
+        key = (_corpus,)
+    else:
+        texts = get_catalog().texts
+        # The facts are few, so their contents are part of the key and edits
+        # made in place are picked up as well
+        key = (texts, FUN_FACTS, tuple(FUN_FACTS))
+    if _search_index is None or not _same_key(_search_index[0], key):
+        from joke_machine.search import SearchIndex
+
+        if _corpus is not None:
+            index = SearchIndex(_corpus.records, _corpus.spans)
+        else:
+            index = SearchIndex(texts + FUN_FACTS, get_catalog().spans)
+        _search_index = (key, index)
+    return _search_index[1]
+
+
+def _same_key(a, b):
+    """Compare cache keys by identity, and plain numbers and tuples by value."""
+    return len(a) == len(b) and all(
+        x is y or (type(x) in (int, tuple) and x == y) for x, y in zip(a, b)
+    )
+
+
+def get_unseen_joke(session, category=None, sampler=None, popular=False):
+    """
+    Get a random joke that a session has not been told recently.
+
+    Parameters
+    ----------
+    session : hashable
+        The user or session the joke is for.
+    category : str, optional
+        The joke category to select from. If None or invalid, a joke from
+        any category will be returned.
+    sampler : joke_machine.sampling.NoRepeatSampler, optional
+        The sampler holding the session history. Defaults to one shared
+        in-process sampler that remembers the last 50 jokes per session.
+    popular : bool, optional
+        Draw with :func:`get_popular_joke` instead of :func:`get_joke`.
+        Default is False.
+
+    Returns
+    -------
+    str
+        A joke the session has not seen within the sampler's window, or
+        within the category size if that is smaller.
+
+    Examples
+    --------
+    >>> first, second = get_unseen_joke("doc", "dad"), get_unseen_joke("doc", "dad")
+    >>> first != second
+    True
+    """
+    global _sampler
+    if sampler is None:
+        if _sampler is None:
+            from joke_machine.sampling import NoRepeatSampler
+
+            _sampler = NoRepeatSampler()
+        sampler = _sampler
+    categories = get_categories()
+    if category in categories:
+        population = categories[category]
+    else:
+        population = sum(categories.values())
+    draw = get_popular_joke if popular else get_joke
+    return sampler.draw(session, lambda: draw(category), population)
+
+
+def _session_joke(session, category=None, window=None, popular=False):
+    """Draw an unseen joke for a CLI session, keeping its history on disk."""
+    from joke_machine.favorites import file_lock
+    from joke_machine.sampling import DEFAULT_WINDOW, SESSIONS_FILE, NoRepeatSampler
+
+    path = os.path.expanduser(os.environ.get("JOKE_MACHINE_SESSIONS", SESSIONS_FILE))
+    with file_lock(path + ".lock"):
+        sampler = NoRepeatSampler(window or DEFAULT_WINDOW)
+        sampler.load(path)
+        joke = get_unseen_joke(session, category, sampler, popular)
+        sampler.save(path)
+    return joke
+
+
 def generate_dad_joke_response():
     """
     Generate a typical humorous response to a dad joke.
@@ -192,6 +872,9 @@ def tell_joke_with_delay(joke, delay=1.5):
 
     This function splits the joke at a natural break point (either after a question
     mark or after the first sentence) and adds a pause before delivering the punchline.
+    Built-in jokes use the split precomputed by the catalog.
+    It blocks the calling thread; use ``deliver_joke`` or
+    ``joke_machine.delivery.tell`` from asyncio code.
 
     Parameters
     ----------
@@ -210,72 +893,298 @@ def tell_joke_with_delay(joke, delay=1.5):
     I'm reading a book about anti-gravity.
     It's impossible to put down!
     """
-    if "?" in joke:
-        setup, punchline = joke.split("?", 1)
-        print(f"{setup}?")
-        time.sleep(delay)
-        print(f"{punchline}")
+    _perform(plan_delivery(joke, delay, parts=_split(joke)))
+
+
+def plan_joke(joke, category=None, delay=1.5, parts=None):
+    """
+    Plan the delivery of a joke, with a groan after dad jokes.
+
+    Parameters
+    ----------
+    joke : str
+        The joke text.
+    category : str, optional
+        The category the joke was drawn from, if one was asked for.
+    delay : float, optional
+        The pause in seconds between setup and punchline. Default is 1.5.
+    parts : tuple, optional
+        A known ``(setup, punchline)`` split. Defaults to the one
+        precomputed by the catalog.
+
+    Returns
+    -------
+    list of joke_machine.delivery.DeliveryEvent
+        The events in delivery order.
+
+    Examples
+    --------
+    >>> [event.kind for event in plan_joke("Why? Because.", "dad")]
+    ['setup', 'punchline', 'response']
+    """
+    response = generate_dad_joke_response() if _is_dad_joke(joke, category) else None
+    return plan_delivery(joke, delay, response, parts or _split(joke))
+
+
+def _split(joke):
+    """Return the precomputed setup/punchline split of ``joke``."""
+    return get_catalog().split(joke)
+
+
+def _perform(events):
+    """Print delivery events, sleeping through their pauses."""
+    start = time.perf_counter_ns()
+    for event in events:
+        if event.pause:
+            _pause(event.pause)
+        print(event.text)
+    # Interactive sessions show all their output as events; count only jokes
+    if _metrics is not None and events and events[0].kind in ("joke", "setup"):
+        _metrics.count("deliveries_total")
+        _metrics.since("delivery_seconds", start)
+
+
+def _pause(seconds):
+    """Sleep through a delivery pause, off the clock of an active profiler."""
+    if _profiler is not None:
+        _profiler.sleep(seconds)
     else:
-        parts = joke.split(". ")
-        if len(parts) > 1:
-            print(f"{parts[0]}.")
-            time.sleep(delay)
-            print(f"{'. '.join(parts[1:])}")
-        else:
-            print(joke)
+        time.sleep(seconds)
+
+
+def _prompt(text):
+    """Read a line from the user, off the clock of an active profiler."""
+    if _profiler is None:
+        return input(text)
+    with _profiler.paused():
+        return input(text)
+
+
+def _is_dad_joke(joke, category=None):
+    """Return True if ``joke`` deserves a dad joke response."""
+    return category == "dad" or (
+        not category and get_catalog().category_of(joke) == "dad"
+    )
+
+
+async def deliver_joke(category=None, delay=1.5):
+    """
+    Draw a joke and yield its delivery as timed events without blocking.
+
+    This is the asyncio counterpart of telling a joke on the command line:
+    the punchline and, for dad jokes, the groan that follows are yielded once
+    their pause has passed, while the event loop keeps serving other work.
+
+    Parameters
+    ----------
+    category : str, optional
+        The joke category to select from. If None or invalid, a joke from
+        any category will be delivered.
+    delay : float, optional
+        The pause in seconds between setup and punchline. Default is 1.5.
+
+    Yields
+    ------
+    joke_machine.delivery.DeliveryEvent
+        The setup, punchline and response events, in order.
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> async def collect():
+    ...     return [event.kind async for event in deliver_joke('puns', delay=0)]
+    >>> asyncio.run(collect())[0] in ('joke', 'setup')
+    True
+    """
+    joke = get_joke(category)
+    response = generate_dad_joke_response() if _is_dad_joke(joke, category) else None
+    async for event in deliver(joke, delay, response, _split(joke)):
+        yield event
 
 
-def save_favorite(joke):
+def save_favorite(joke, user=None):
     """
     Save a joke to the user's favorites file.
 
-    This function saves the provided joke to a JSON file in the user's home directory
-    along with a timestamp of when it was saved.
+    This function appends the provided joke to a JSON Lines file in the user's home
+    directory along with a timestamp of when it was saved. Only the new entry is
+    written, so saving does not get slower as the favorites file grows.
 
     Parameters
     ----------
     joke : str
         The joke text to save to favorites.
+    user : str, optional
+        Save to the favorites of this user ID instead, see
+        :func:`open_favorites_store`.
 
     Notes
     -----
-    The favorites are stored in ~/.joke_machine_favorites.json
+    The favorites are stored in ~/.joke_machine_favorites.json unless
+    $JOKE_MACHINE_FAVORITES points elsewhere. A path ending in ``.db`` selects
+    the SQLite store, which ignores jokes that are already saved.
 
     Examples
     --------
     >>> save_favorite("Why do programmers prefer dark mode? Because light attracts bugs!")  # doctest: +SKIP
     Joke saved to favorites at ~/.joke_machine_favorites.json
     """
-    favorites_file = os.path.expanduser("~/.joke_machine_favorites.json")
+    favorites = open_favorites_store(user)
+    if add_favorite(joke, store=favorites) is None:
+        print("That joke is already in your favorites.")
+        return
 
-    # Create or load existing favorites
-    if os.path.exists(favorites_file):
-        with open(favorites_file) as f:
-            try:
-                favorites = json.load(f)
-            except json.JSONDecodeError:
-                favorites = []
-    else:
-        favorites = []
+    print(f"Joke saved to favorites at {favorites.path}")
 
-    # Add the new favorite with timestamp
-    favorites.append(
-        {"joke": joke, "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-    )
 
-    # Save back to file
-    with open(favorites_file, "w") as f:
-        json.dump(favorites, f, indent=2)
+def add_favorite(joke, saved_at=None, store=None):
+    """
+    Add a joke to the favorites store and raise its popularity weight.
 
-    print(f"Joke saved to favorites at {favorites_file}")
+    Parameters
+    ----------
+    joke : str
+        The joke text to save.
+    saved_at : str, optional
+        Timestamp to record. Defaults to the current local time.
+    store : FavoritesLog or joke_machine.favorites_db.SQLiteFavorites, optional
+        The store to append to. Defaults to :func:`open_favorites_store`.
 
+    Returns
+    -------
+    dict or None
+        The saved entry, or None if the store already holds the joke.
+    """
+    if saved_at is None:
+        from datetime import datetime
+
+        saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    start = time.perf_counter_ns()
+    if store is None:
+        store = open_favorites_store()
+    entry = store.append(joke, saved_at)
+    if _metrics is not None:
+        _metrics.count(
+            "favorites_saved_total"
+            if entry is not None
+            else "favorites_duplicate_total"
+        )
+        _metrics.since("favorite_save_seconds", start)
+    # Update the weight in place; an outdated sampler is rebuilt on next use
+    if entry is not None and _popularity is not None:
+        catalog = get_catalog()
+        texts, sampler = _popularity
+        position = catalog.position(joke)
+        if position is not None and texts is catalog.texts:
+            sampler.add(position, FAVORITE_BOOST)
+    return entry
+
+
+def open_favorites_store(user=None):
+    """
+    Open the user's favorites store.
 
-def list_favorites():
+    Parameters
+    ----------
+    user : str, optional
+        Open the favorites of this user ID instead of the local user's. They
+        are kept in the sharded store at $JOKE_MACHINE_FAVORITES_DIR, or at
+        ~/.joke_machine_favorites.d if the variable is not set.
+
+    Returns
+    -------
+    FavoritesLog or joke_machine.favorites_db.SQLiteFavorites or UserFavorites
+        The store at $JOKE_MACHINE_FAVORITES, or at
+        ~/.joke_machine_favorites.json if the variable is not set.
+    """
+    global _user_favorites
+    if user is not None:
+        from joke_machine.favorites_db import FAVORITES_DIR, ShardedFavorites
+
+        directory = os.path.expanduser(
+            os.environ.get("JOKE_MACHINE_FAVORITES_DIR", FAVORITES_DIR)
+        )
+        # Shared by all users and threads, so open shards are reused
+        if _user_favorites is None or _user_favorites.directory != directory:
+            if _user_favorites is not None:
+                _user_favorites.close()
+            _user_favorites = ShardedFavorites(directory)
+        return _user_favorites.user(user)
+
+    if _favorites_cache is not None:
+        return _favorites_cache
+
+    from joke_machine.favorites import open_favorites
+
+    return open_favorites(favorites_path())
+
+
+def favorites_path():
+    """Return the path of the local user's favorites store."""
+    from joke_machine.favorites import FAVORITES_FILE
+
+    path = os.environ.get("JOKE_MACHINE_FAVORITES", FAVORITES_FILE)
+    return os.path.expanduser(path)
+
+
+def use_favorites_cache(cache):
+    """
+    Keep the local user's favorites in ``cache`` instead of reading the disk.
+
+    Parameters
+    ----------
+    cache : joke_machine.favorites_cache.CachedFavorites or None
+        The cache :func:`open_favorites_store` returns from now on. Pass None
+        to go back to the store on disk.
+
+    Returns
+    -------
+    joke_machine.favorites_cache.CachedFavorites or None
+        The previously active cache. It is not flushed or closed.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> from joke_machine.favorites_cache import CachedFavorites
+    >>> cache = CachedFavorites(os.path.join(tempfile.mkdtemp(), "f.json"), "exit")
+    >>> use_favorites_cache(cache) is None
+    True
+    >>> open_favorites_store() is cache
+    True
+    >>> use_favorites_cache(None) is cache
+    True
+    >>> cache.close()
+    """
+    global _favorites_cache
+    previous, _favorites_cache = _favorites_cache, cache
+    return previous
+
+
+def list_favorites(limit=None, offset=0, since=None, grep=None, pager=None, user=None):
     """
-    List all jokes saved in the user's favorites file.
+    List the jokes saved in the user's favorites file.
 
-    This function reads the favorites file from the user's home directory
-    and displays all saved jokes along with their save timestamps.
+    This function streams the favorites file from the user's home directory
+    and displays the saved jokes along with their save timestamps. Entries are
+    shown as soon as they are read, and memory use does not depend on the size
+    of the file.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Show at most this many favorites.
+    offset : int, optional
+        Skip this many matching favorites first. Default is 0.
+    since : str, optional
+        Only show favorites saved on or after this date, e.g. "2023-01-31".
+    grep : str, optional
+        Only show favorites containing this text.
+    pager : bool, optional
+        Show the list through $PAGER. If None (the default), a pager is used
+        when stdout is a terminal.
+    user : str, optional
+        List the favorites of this user ID instead, see
+        :func:`open_favorites_store`.
 
     Notes
     -----
@@ -286,37 +1195,141 @@ def list_favorites():
     >>> list_favorites()
     You haven't saved any favorites yet.
     """
-    favorites_file = os.path.expanduser("~/.joke_machine_favorites.json")
+    import json
+
+    from joke_machine.output import OutputBuffer
 
-    if not os.path.exists(favorites_file):
+    favorites = open_favorites_store(user)
+
+    if not favorites.exists():
         print("You haven't saved any favorites yet.")
         return
 
-    with open(favorites_file) as f:
+    count = offset
+    start = time.perf_counter_ns()
+    with OutputBuffer(pager) as out:
         try:
-            favorites = json.load(f)
-            if not favorites:
-                print("Your favorites list is empty.")
-                return
-
-            print("\n=== Your Favorite Jokes ===\n")
-            for i, fav in enumerate(favorites, 1):
-                joke = fav["joke"]
-                saved_at = fav["saved_at"]
-                print(f"{i}. {joke}")
-                print(f"   Saved on: {saved_at}")
-                print()
-
+            entries = favorites.query(limit, offset, since, grep)
+            for count, fav in enumerate(entries, offset + 1):
+                if count == offset + 1:
+                    out.write("\n=== Your Favorite Jokes ===\n\n")
+                out.write(
+                    f"{count}. {fav['joke']}\n"
+                    f"   Saved on: {fav.get('saved_at', 'unknown')}\n\n"
+                )
+                if out.broken:
+                    return
         except json.JSONDecodeError:
+            out.close()
             print("Error reading favorites file. It might be corrupted.")
+            return
+        finally:
+            if _metrics is not None:
+                _metrics.count("favorites_listed_total", count - offset)
+                _metrics.since("favorites_list_seconds", start)
+
+    if favorites.skipped:
+        print("Error reading favorites file. It might be corrupted.")
+        print(
+            f"Skipped {favorites.skipped} unreadable entries. "
+            "Run 'joke-machine --compact-favorites' to remove them."
+        )
+    elif count == offset:
+        if since or grep or offset:
+            print("No favorites match your filters.")
+        else:
+            print("Your favorites list is empty.")
+
+
+def compact_favorites():
+    """
+    Rewrite the favorites file, dropping unreadable entries.
+
+    Saving only ever appends to the favorites file, so entries cut short by
+    a crash stay in the file until it is compacted. Compaction also converts
+    favorites files written by older versions to the current format.
+
+    Examples
+    --------
+    >>> compact_favorites()
+    You haven't saved any favorites yet.
+    """
+    import json
+
+    favorites = open_favorites_store()
+
+    if not favorites.exists():
+        print("You haven't saved any favorites yet.")
+        return
+
+    try:
+        kept, dropped = favorites.compact()
+    except json.JSONDecodeError:
+        print("Error reading favorites file. It might be corrupted.")
+        return
+    print(f"Compacted favorites: kept {kept}, dropped {dropped} unreadable entries.")
+
+
+def import_favorites(source=None):
+    """
+    Copy favorites from a JSON favorites file into the SQLite store.
+
+    Duplicates are skipped, so importing the same file twice is harmless.
+
+    Parameters
+    ----------
+    source : str, optional
+        The favorites file to import. Default is ~/.joke_machine_favorites.json.
 
+    Examples
+    --------
+    >>> import_favorites()  # doctest: +SKIP
+    Imported 120 favorites from ~/.joke_machine_favorites.json (3 duplicates skipped).
+    """
+    import json
+
+    from joke_machine.favorites import FAVORITES_FILE, FavoritesLog
 
-def interactive_mode():
+    target = open_favorites_store()
+    source = os.path.expanduser(source or FAVORITES_FILE)
+
+    if not hasattr(target, "import_from"):
+        print(
+            "Importing needs the SQLite favorites store. "
+            "Set JOKE_MACHINE_FAVORITES to a path ending in .db first."
+        )
+        return
+
+    log = FavoritesLog(source)
+    if not log.exists():
+        print(f"No favorites file found at {source}")
+        return
+
+    try:
+        imported, duplicates = target.import_from(log)
+    except json.JSONDecodeError:
+        print("Error reading favorites file. It might be corrupted.")
+        return
+    print(
+        f"Imported {imported} favorites from {source} "
+        f"({duplicates} duplicates skipped)."
+    )
+
+
+def interactive_mode(session=None, window=None):
     """
     Run the joke machine in an interactive command-line interface mode.
 
     This function starts an interactive session where users can enter
-    commands to get jokes, fun facts, manage favorites, and more.
+    commands to get jokes, fun facts, manage favorites, and more. Jokes are
+    not repeated within the session until the category runs out.
+
+    Parameters
+    ----------
+    session : str, optional
+        Name of a saved session whose joke history carries over between runs.
+    window : int, optional
+        Number of recent jokes not to repeat in a saved session. Default is 50.
 
     Commands
     --------
@@ -325,72 +1338,132 @@ def interactive_mode():
     save : Save the last joke to favorites
     favorites : List saved favorite jokes
     categories : List available joke categories
+    search <words> : Find jokes and fun facts containing the words
+    profile on|off [file] : Profile the commands in between, see --profile
     help : Show available commands
     exit/quit : Exit interactive mode
 
+    The commands are those of :class:`joke_machine.session.Session`, which
+    also runs sessions without a terminal.
+
     Examples
     --------
     >>> interactive_mode()  # doctest: +SKIP
     """
-    print_header()
-    print("Welcome to Interactive Mode!")
-    print("Type 'exit' or 'quit' to leave, 'help' for commands.\n")
-
-    last_joke = None
+    from joke_machine.session import GREETING, PROMPT, Session
 
-    while True:
-        command = input("\nWhat would you like? > ").strip().lower()
+    print_header()
+    print(GREETING)
 
-        if command in ("exit", "quit"):
-            print("Thanks for laughing with JokeMachine! Goodbye!")
+    state = Session(
+        session or "interactive", window, saved=bool(session), terminal=True
+    )
+    while not state.closed:
+        try:
+            line = _prompt(PROMPT)
+        except EOFError:
+            _perform(state.close())
             break
+        _perform(state.handle(line))
 
-        elif command == "help":
-            print("\nAvailable commands:")
-            print(
-                "  joke [category] - Tell a joke (categories: programming, dad, puns)"
-            )
-            print("  fact            - Tell a fun fact")
-            print("  save            - Save the last joke to favorites")
-            print("  favorites       - List your favorite jokes")
-            print("  categories      - List joke categories")
-            print("  exit/quit       - Exit the program")
-            print("  help            - Show this help message")
-
-        elif command.startswith("joke"):
-            parts = command.split()
-            category = parts[1] if len(parts) > 1 and parts[1] in JOKES else None
 
+def print_search_results(results):
+    """
+    Print search results, one per line with its category.
+
+    Examples
+    --------
+    >>> print_search_results([("dad", "A joke."), (None, "A fact.")])
+    [dad] A joke.
+    [fact] A fact.
+    >>> print_search_results([])
+    No jokes or facts found.
+    """
+    for line in format_search_results(results):
+        print(line)
+
+
+def format_search_results(results):
+    """Return the lines :func:`print_search_results` prints."""
+    if not results:
+        return ["No jokes or facts found."]
+    return [f"[{category or 'fact'}] {text}" for category, text in results]
+
+
+def _tell_joke(category=None, save=False, joke=None, delay=1.5, user=None):
+    """Tell a joke for the command line, with a dad joke response if fitting."""
+    parts = None
+    if joke is None:
+        if _corpus is not None:
+            # Use the split stored in the corpus instead of computing it
+            if _metrics is not None:
+                next(_metrics.draws[category])
+            index = _corpus.draw(category)
+            joke, parts = _corpus.text(index), _corpus.parts(index)
+        else:
             joke = get_joke(category)
-            tell_joke_with_delay(joke)
 
-            # For dad jokes, add a response
-            if category == "dad" or (not category and joke in JOKES["dad"]):
-                time.sleep(1)
-                print(f"\n{generate_dad_joke_response()}")
+    _perform(plan_joke(joke, category, delay, parts))
 
-            # Store the last joke for saving
-            last_joke = joke
+    if save:
+        save_favorite(joke, user)
 
-        elif command == "fact":
-            print(get_fun_fact())
 
-        elif command == "save":
-            if last_joke:
-                save_favorite(last_joke)
-            else:
-                print("No joke to save. Tell a joke first!")
+# Invocations handled by _fast_main() without building the argument parser
+_FAST_COMMANDS = {
+    "--joke": "joke",
+    "-j": "joke",
+    "--fact": "fact",
+    "-f": "fact",
+    "--version": "version",
+    "-v": "version",
+}
 
-        elif command == "favorites":
-            list_favorites()
 
-        elif command == "categories":
-            print("\nAvailable joke categories:")
-            for category in JOKES:
-                print(f"  - {category} ({len(JOKES[category])} jokes)")
+def _fast_main(argv):
+    """
+    Handle the most common single-flag invocations without argparse.
 
-        else:
-            print("I didn't understand that. Type 'help' for available commands.")
+    Parameters
+    ----------
+    argv : list of str
+        Command-line arguments, without the program name.
+
+    Returns
+    -------
+    bool
+        True if the invocation was handled, False if ``main()`` needs to
+        parse the arguments itself.
+
+    Examples
+    --------
+    >>> _fast_main(['--version'])
+    JokeMachine v0.1.0
+    True
+    >>> _fast_main(['--joke', '--save'])
+    False
+    """
+    if len(argv) != 1 or argv[0] not in _FAST_COMMANDS:
+        return False
+    command = _FAST_COMMANDS[argv[0]]
+
+    if command == "version":
+        print(f"JokeMachine v{__version__}")
+        return True
+    if os.environ.get("JOKE_MACHINE_SESSION"):
+        # Session draws and their history are handled by main()
+        return False
+
+    corpus = os.environ.get("JOKE_MACHINE_CORPUS")
+    if corpus:
+        load_corpus(corpus)
+
+    print_header()
+    if command == "joke":
+        _tell_joke()
+    else:
+        print(get_fun_fact())
+    return True
 
 
 def main():
@@ -407,8 +1480,30 @@ def main():
     --fact, -f : Tell a random fun fact
     --save, -s : Save the joke to favorites
     --favorites : List your favorite jokes
+    --user : Save and list the favorites of this user ID
+    --limit, --offset, --since, --grep : Page through and filter --favorites
+    --no-pager : Print favorites directly instead of through $PAGER
+    --compact-favorites : Remove unreadable entries from the favorites file
+    --import-favorites : Import a JSON favorites file into the SQLite store
     --interactive, -i : Run in interactive mode
+    --corpus : Serve jokes and facts from a packed or JSON corpus file
+    --session : Do not repeat recent jokes for this named session
+    --window : Number of recent jokes a session does not repeat
+    --popular : Favor jokes that were saved as favorites
+    --search : Find jokes and fun facts by keyword
+    --count : Stream N jokes (or facts with --fact), one per line
+    --format : Line format for --count (jsonl, tsv)
+    --no-header : Leave out the banner and TSV column names
+    --no-delay : Tell the punchline without a pause
+    --serve : Run the HTTP JSON service on HOST:PORT
+    --listen : Host interactive sessions over TCP on HOST:PORT
+    --workers : Thread pool size for --serve favorites requests
+    --favorites-cache : Keep favorites in memory in long-running modes
+    --stats : Print counters and latencies in the Prometheus format
+    --profile : Profile the command, leaving out pauses and prompts
     --version, -v : Show version information
+    build-corpus : Build a packed corpus from raw dumps, see
+        ``joke-machine build-corpus --help``
 
     Examples
     --------
@@ -422,6 +1517,21 @@ def main():
     >>> sys.argv = ['joke_machine', '--interactive']
     >>> main()  # doctest: +SKIP
     """
+    if _fast_main(sys.argv[1:]):
+        return
+
+    if sys.argv[1:2] == ["build-corpus"]:
+        from joke_machine.builder import main as build_corpus_main
+
+        build_corpus_main(sys.argv[2:])
+        return
+
+    import argparse
+    import textwrap
+
+    from joke_machine.favorites import FAVORITES_FILE
+    from joke_machine.favorites_cache import DEFAULT_DURABILITY
+
     parser = argparse.ArgumentParser(
         description="JokeMachine - A fun tool for jokes and humor",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -430,13 +1540,22 @@ def main():
           python -m joke_machine --joke
           python -m joke_machine --category programming
           python -m joke_machine --fact
+          python -m joke_machine --search "chicken road"
+          python -m joke_machine --count 1000000 --no-header > jokes.jsonl
           python -m joke_machine --interactive
+          python -m joke_machine --serve 127.0.0.1:8000
+          python -m joke_machine --listen 127.0.0.1:8001
+          python -m joke_machine --count 100000 --stats > /dev/null
+          python -m joke_machine --search chicken --profile search.prof
+          python -m joke_machine build-corpus dump.txt -o jokes.jpk
         """),
     )
 
     parser.add_argument("--joke", "-j", action="store_true", help="Tell a random joke")
     parser.add_argument(
-        "--category", "-c", choices=list(JOKES.keys()), help="Specify joke category"
+        "--category",
+        "-c",
+        help=f"Specify joke category ({', '.join(JOKES)}, or one from --corpus)",
     )
     parser.add_argument(
         "--fact", "-f", action="store_true", help="Tell a random fun fact"
@@ -447,9 +1566,151 @@ def main():
     parser.add_argument(
         "--favorites", action="store_true", help="List your favorite jokes"
     )
+    parser.add_argument(
+        "--user",
+        default=os.environ.get("JOKE_MACHINE_USER"),
+        metavar="ID",
+        help="Save and list the favorites of this user ID, kept in "
+        "$JOKE_MACHINE_FAVORITES_DIR (default: $JOKE_MACHINE_USER)",
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        metavar="N",
+        help="Stream N random jokes (or facts with --fact), one per line",
+    )
+    parser.add_argument(
+        "--format",
+        choices=BATCH_FORMATS,
+        default="jsonl",
+        help="Line format for --count (default: jsonl)",
+    )
+    parser.add_argument(
+        "--no-header",
+        action="store_true",
+        help="Leave out the banner and TSV column names",
+    )
+    parser.add_argument(
+        "--no-delay",
+        action="store_true",
+        help="Tell the punchline without a pause",
+    )
+    parser.add_argument(
+        "--search",
+        metavar="WORDS",
+        help="Find jokes and fun facts containing WORDS (prefixes match too)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Show at most N favorites or search results",
+        metavar="N",
+    )
+    parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="Skip the first N matching favorites",
+        metavar="N",
+    )
+    parser.add_argument(
+        "--since", help="Only show favorites saved on or after DATE", metavar="DATE"
+    )
+    parser.add_argument(
+        "--grep", help="Only show favorites containing TEXT", metavar="TEXT"
+    )
+    parser.add_argument(
+        "--no-pager",
+        action="store_true",
+        help="Print favorites directly instead of through $PAGER",
+    )
+    parser.add_argument(
+        "--import-favorites",
+        nargs="?",
+        const=FAVORITES_FILE,
+        metavar="FILE",
+        help="Import a JSON favorites file into the SQLite store",
+    )
+    parser.add_argument(
+        "--compact-favorites",
+        action="store_true",
+        help="Remove unreadable entries from the favorites file",
+    )
     parser.add_argument(
         "--interactive", "-i", action="store_true", help="Run in interactive mode"
     )
+    parser.add_argument(
+        "--corpus",
+        default=os.environ.get("JOKE_MACHINE_CORPUS"),
+        help="Serve jokes from a packed corpus or a JSON file of "
+        "{category: [joke, ...]} (default: $JOKE_MACHINE_CORPUS)",
+    )
+    parser.add_argument(
+        "--session",
+        default=os.environ.get("JOKE_MACHINE_SESSION"),
+        metavar="NAME",
+        help="Do not repeat recent jokes for this session, across runs "
+        "(default: $JOKE_MACHINE_SESSION)",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        metavar="N",
+        help="Number of recent jokes a session does not repeat (default: 50)",
+    )
+    parser.add_argument(
+        "--popular",
+        action="store_true",
+        help="Favor jokes that were saved as favorites",
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const="127.0.0.1:8000",
+        metavar="HOST:PORT",
+        help="Run the HTTP JSON service (default: 127.0.0.1:8000)",
+    )
+    parser.add_argument(
+        "--listen",
+        nargs="?",
+        const="127.0.0.1:8001",
+        metavar="HOST:PORT",
+        help="Host interactive sessions over TCP, e.g. for nc "
+        "(default: 127.0.0.1:8001)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        metavar="N",
+        help="Threads for favorites requests in --serve and --listen mode (default: 8)",
+    )
+    parser.add_argument(
+        "--favorites-cache",
+        nargs="?",
+        const=DEFAULT_DURABILITY,
+        default=os.environ.get("JOKE_MACHINE_FAVORITES_CACHE"),
+        metavar="WHEN",
+        help="In --serve, --listen and --interactive mode, keep favorites in "
+        "memory and write saves to disk in batches: always, every N ms (e.g. "
+        f"250ms), or on exit (default: {DEFAULT_DURABILITY}, or "
+        "$JOKE_MACHINE_FAVORITES_CACHE)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="Profile the command, leaving out pauses and prompts; write the "
+        "profile to FILE (default: joke-machine.prof) and print the top "
+        "functions to stderr",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print counters and latencies to stderr when done, and serve "
+        "them on /metrics in --serve mode",
+    )
     parser.add_argument(
         "--version", "-v", action="version", version=f"JokeMachine v{__version__}"
     )
@@ -461,30 +1722,124 @@ def main():
         parser.print_help()
         return
 
+    metrics = profiler = cache = None
+    if args.favorites_cache and (args.serve or args.listen or args.interactive):
+        from joke_machine.favorites_cache import CachedFavorites
+
+        try:
+            cache = CachedFavorites(favorites_path(), args.favorites_cache)
+        except ValueError as exc:
+            parser.error(f"argument --favorites-cache: {exc}")
+        use_favorites_cache(cache)
+    if args.stats:
+        from joke_machine.metrics import Metrics
+
+        metrics = Metrics()
+        use_metrics(metrics)
+    if args.profile is not None:
+        profiler = start_profiling()
+    try:
+        _run(parser, args)
+    finally:
+        if cache is not None:
+            use_favorites_cache(None)
+            cache.close()
+        if profiler is not None:
+            stop_profiling(profiler, args.profile, sys.stderr)
+        if metrics is not None:
+            use_metrics(None)
+            sys.stderr.write(metrics.export())
+
+
+def _run(parser, args):
+    """Run the command selected by the parsed arguments."""
+    if args.corpus:
+        load_corpus(args.corpus)
+
+    categories = get_categories()
+    if args.category and args.category not in categories:
+        parser.error(
+            f"argument --category/-c: invalid choice: {args.category!r} "
+            f"(choose from {', '.join(map(repr, categories))})"
+        )
+
     # If interactive mode requested
     if args.interactive:
-        interactive_mode()
+        interactive_mode(args.session, args.window)
+        return
+
+    if args.serve:
+        from joke_machine.server import parse_address, serve
+
+        try:
+            host, port = parse_address(args.serve)
+        except ValueError as exc:
+            parser.error(f"argument --serve: {exc}")
+        serve(host, port, args.workers)
+        return
+
+    if args.listen:
+        from joke_machine.server import parse_address
+        from joke_machine.session import serve_sessions
+
+        try:
+            host, port = parse_address(args.listen)
+        except ValueError as exc:
+            parser.error(f"argument --listen: {exc}")
+        serve_sessions(host, port, 0 if args.no_delay else 1.5, args.workers)
+        return
+
+    if args.count is not None:
+        if args.count < 0:
+            parser.error("argument --count: must not be negative")
+        if not args.no_header:
+            print_header()
+        stream_batch(
+            args.count, args.fact, args.category, args.format, not args.no_header
+        )
         return
 
     # Print header for non-interactive mode
-    print_header()
+    if not args.no_header:
+        print_header()
 
     # Handle command-line arguments
     if args.favorites:
-        list_favorites()
+        list_favorites(
+            args.limit,
+            args.offset,
+            args.since,
+            args.grep,
+            pager=False if args.no_pager else None,
+            user=args.user,
+        )
         return
 
-    if args.joke or args.category:
-        joke = get_joke(args.category)
-        tell_joke_with_delay(joke)
+    if args.import_favorites:
+        import_favorites(args.import_favorites)
+        return
 
-        # For dad jokes, add a response
-        if args.category == "dad" or (not args.category and joke in JOKES["dad"]):
-            time.sleep(1)
-            print(f"\n{generate_dad_joke_response()}")
+    if args.search:
+        print_search_results(search_jokes(args.search, args.limit or 10, args.category))
+        return
+
+    if args.compact_favorites:
+        compact_favorites()
+        return
 
-        if args.save:
-            save_favorite(joke)
+    if args.joke or args.category or args.popular:
+        joke = None
+        if args.session:
+            joke = _session_joke(args.session, args.category, args.window, args.popular)
+        elif args.popular:
+            joke = get_popular_joke(args.category)
+        _tell_joke(
+            args.category,
+            save=args.save,
+            user=args.user,
+            joke=joke,
+            delay=0 if args.no_delay else 1.5,
+        )
 
     elif args.fact:
         print(get_fun_fact())
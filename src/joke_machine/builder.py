@@ -0,0 +1,497 @@
+"""
+Multi-process builder for packed corpora from large raw joke dumps.
+
+``joke-machine build-corpus`` turns text files (one joke per line) and CSV
+files (a ``joke`` or ``text`` column, optionally a ``category`` column) into a
+packed corpus::
+
+    joke-machine build-corpus dump.txt scraped.csv -o jokes.jpk --jobs 8
+
+Inputs are cut into byte ranges that end on line boundaries, and a process
+pool works through the ranges in parallel. Each worker normalizes its jokes,
+classifies the ones without a category, drops exact duplicates, splits them
+into setup and punchline, and writes the result to a shard file. The parent
+then merges the shards category by category into the packed format, dropping
+duplicates found across shards.
+
+Joke texts are only ever held one shard index at a time; the merge keeps the
+8-byte keys of the unique jokes in a sorted array (:class:`KeySet`). CSV
+records must not span several lines.
+Near-duplicate removal needs a global view of the corpus, so it is left to
+``python -m joke_machine.dedup`` on smaller corpora.
+"""
+
+import csv
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from joke_machine.corpus import write_packed_corpus
+from joke_machine.dedup import joke_key, normalize_joke
+from joke_machine.delivery import split_joke
+
+# Bytes of input per work unit
+SHARD_SIZE = 16 * 1024 * 1024
+
+# Category of jokes that match no keywords, unless overridden
+DEFAULT_CATEGORY = "misc"
+
+# Words that put a joke without a category column into a category
+CATEGORY_KEYWORDS = {
+    "programming": frozenset(
+        "algorithm api array binary bit bits bug bugs byte bytes cache code "
+        "coder coding compiler computer computers css database debug "
+        "debugging developer developers function git hacker html java "
+        "javascript keyboard linux programmer programmers programming python "
+        "recursion server software sql stack unix variable windows".split()
+    ),
+    "dad": frozenset("dad dads daddy father fathers grandpa kid kids son".split()),
+    "puns": frozenset("pun puns punny".split()),
+}
+
+# Shard index: count, then one array per field
+_FIELDS = (
+    ("category", "I"),
+    ("key", "Q"),
+    ("size", "I"),
+    ("setup", "I"),
+    ("start", "I"),
+)
+
+
+def classify(normalized, default=DEFAULT_CATEGORY):
+    """
+    Return the category with the most distinct keywords in a normalized joke.
+
+    Examples
+    --------
+    >>> classify("why do programmers prefer dark mode")
+    'programming'
+    >>> classify("a horse walks into a bar")
+    'misc'
+    """
+    words = set(normalized.split())
+    best, best_hits = default, 0
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        hits = len(keywords.intersection(words))
+        if hits > best_hits:
+            best, best_hits = category, hits
+    return best
+
+
+def plan_shards(paths, shard_size=SHARD_SIZE):
+    """
+    Cut input files into byte ranges of about ``shard_size`` bytes.
+
+    Returns
+    -------
+    list of tuple
+        ``(path, start, stop, columns)``, where ``columns`` is None for text
+        files and ``(joke_column, category_column)`` for CSV files, whose
+        header line is excluded from the ranges.
+    """
+    shards = []
+    for path in paths:
+        start, columns = 0, None
+        if path.lower().endswith(".csv"):
+            with open(path, "rb") as f:
+                header = f.readline()
+                start = f.tell()
+            columns = _csv_columns(header.decode("utf-8-sig", "replace"), path)
+        size = os.path.getsize(path)
+        while start < size:
+            stop = min(start + shard_size, size)
+            shards.append((path, start, stop, columns))
+            start = stop
+    return shards
+
+
+def _csv_columns(header, path):
+    names = [name.strip().lower() for name in next(csv.reader([header]), [])]
+    for column in ("joke", "text"):
+        if column in names:
+            joke = names.index(column)
+            break
+    else:
+        raise ValueError(f"{path} has no 'joke' or 'text' column")
+    category = names.index("category") if "category" in names else None
+    return joke, category
+
+
+def _read_lines(path, start, stop):
+    """Yield the decoded lines that start within ``[start, stop)``."""
+    with open(path, "rb") as f:
+        position = start
+        if start:
+            # The line holding byte start - 1 belongs to the previous range
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        while position < stop:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode("utf-8", "replace")
+
+
+class KeySet:
+    """
+    A compact set of 64-bit keys.
+
+    A Python set of ints needs 60-70 bytes per entry, too much for the keys
+    of every joke in a multi-gigabyte dump. Keys are kept in sorted
+    ``array("Q")`` buckets, one per value of their top bits, at 8 bytes per
+    key. New keys wait in a Python set that is merged into the arrays once
+    it holds an eighth as many keys, so adding stays amortized O(log n) and
+    the whole takes about 20 bytes per key.
+
+    Parameters
+    ----------
+    min_buffer : int, optional
+        Keys buffered before the first merge. Default is 65536.
+
+    Examples
+    --------
+    >>> keys = KeySet(min_buffer=2)
+    >>> [keys.add(key) for key in (5, 1, 5, 3, 2**64 - 1)]
+    [True, True, False, True, True]
+    >>> 3 in keys, 4 in keys, 2**64 - 1 in keys, len(keys)
+    (True, False, True, 4)
+    """
+
+    # Bits of a key selecting its bucket
+    BUCKET_BITS = 12
+
+    def __init__(self, min_buffer=1 << 16):
+        self.min_buffer = min_buffer
+        self._shift = 64 - self.BUCKET_BITS
+        self._buckets = [array("Q") for _ in range(1 << self.BUCKET_BITS)]
+        self._stored = 0
+        self._recent = set()
+
+    def __len__(self):
+        return self._stored + len(self._recent)
+
+    def __contains__(self, key):
+        if key in self._recent:
+            return True
+        bucket = self._buckets[key >> self._shift]
+        i = bisect_left(bucket, key)
+        return i < len(bucket) and bucket[i] == key
+
+    def add(self, key):
+        """Add ``key``, returning False if it was already in the set."""
+        if key in self:
+            return False
+        self._recent.add(key)
+        if len(self._recent) >= max(self.min_buffer, self._stored // 8):
+            self._merge()
+        return True
+
+    def _merge(self):
+        by_bucket = {}
+        for key in sorted(self._recent):
+            by_bucket.setdefault(key >> self._shift, []).append(key)
+        for index, keys in by_bucket.items():
+            old, merged, lo = self._buckets[index], array("Q"), 0
+            for key in keys:
+                hi = bisect_left(old, key, lo)
+                merged.extend(old[lo:hi])
+                merged.append(key)
+                lo = hi
+            merged.extend(old[lo:])
+            self._buckets[index] = merged
+        self._stored += len(self._recent)
+        self._recent = set()
+
+
+def process_shard(task):
+    """
+    Turn one byte range of an input into a shard file.
+
+    Runs in a worker process. ``task`` is ``(path, start, stop, columns,
+    shard_path, default_category, min_length)``.
+
+    Returns
+    -------
+    tuple
+        ``(shard_path, categories, read, duplicates, skipped)``, where
+        ``categories`` lists the category names used in the shard index.
+    """
+    path, start, stop, columns, shard_path, default_category, min_length = task
+    lines = _read_lines(path, start, stop)
+    if columns is None:
+        rows = ((line, None) for line in lines)
+    else:
+        joke_column, category_column = columns
+        rows = (
+            (
+                row[joke_column] if joke_column < len(row) else "",
+                row[category_column]
+                if category_column is not None and category_column < len(row)
+                else None,
+            )
+            for row in csv.reader(lines)
+        )
+
+    split = split_joke.__wrapped__
+    fields = {name: array(code) for name, code in _FIELDS}
+    categories = {}
+    seen = set()
+    read = duplicates = skipped = 0
+    with open(shard_path + ".data", "wb") as data:
+        for text, category in rows:
+            read += 1
+            text = " ".join(text.split())
+            if not text or len(text) < min_length:
+                skipped += 1
+                continue
+            normalized = normalize_joke(text)
+            key = int.from_bytes(joke_key(normalized), "little")
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            category = (category or "").strip().lower() or classify(
+                normalized, default_category
+            )
+            setup, punchline = split(text)
+            encoded = text.encode("utf-8")
+            data.write(encoded)
+            fields["category"].append(categories.setdefault(category, len(categories)))
+            fields["key"].append(key)
+            fields["size"].append(len(encoded))
+            fields["setup"].append(len(setup))
+            fields["start"].append(len(text) - len(punchline) if punchline else 0)
+
+    with open(shard_path + ".index", "wb") as index:
+        index.write(array("Q", [len(fields["key"])]).tobytes())
+        for name, _ in _FIELDS:
+            fields[name].tofile(index)
+    return shard_path, list(categories), read, duplicates, skipped
+
+
+def _load_index(shard_path):
+    with open(shard_path + ".index", "rb") as f:
+        count = array("Q", f.read(8))[0]
+        fields = {}
+        for name, code in _FIELDS:
+            values = array(code)
+            values.fromfile(f, count)
+            fields[name] = values
+    return fields
+
+
+def _category_records(shards, category, seen, counts):
+    """Yield ``(text, setup_end, punchline_start)`` of one category, deduped."""
+    for shard_path, categories in shards:
+        if category not in categories:
+            continue
+        local = categories.index(category)
+        fields = _load_index(shard_path)
+        records = zip(
+            fields["category"],
+            fields["key"],
+            accumulate(fields["size"]),
+            fields["size"],
+            fields["setup"],
+            fields["start"],
+        )
+        before = len(seen)
+        with open(shard_path + ".data", "rb") as f:
+            # Shards listing a category hold at least one non-empty joke
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for category_id, key, end, size, setup_end, start in records:
+                    if category_id != local:
+                        continue
+                    if not seen.add(key):
+                        counts["duplicates"] += 1
+                        continue
+                    yield data[end - size : end].decode("utf-8"), setup_end, start
+        counts["kept"] += len(seen) - before
+
+
+def build_corpus(
+    inputs,
+    output,
+    jobs=None,
+    facts=None,
+    default_category=DEFAULT_CATEGORY,
+    min_length=10,
+    shard_size=SHARD_SIZE,
+):
+    """
+    Build a packed corpus from raw text and CSV joke dumps.
+
+    Parameters
+    ----------
+    inputs : list of str
+        Text files with one joke per line, and ``.csv`` files.
+    output : str
+        Packed corpus to write.
+    jobs : int, optional
+        Worker processes. Defaults to the number of CPUs; 1 processes the
+        shards in this process.
+    facts : iterable of str, optional
+        Fun facts to store. Defaults to the built-in ``FUN_FACTS``.
+    default_category : str, optional
+        Category of jokes without a category column that match no keywords.
+        Default is 'misc'.
+    min_length : int, optional
+        Shorter lines are skipped. Default is 10.
+    shard_size : int, optional
+        Bytes of input per work unit. Default is 16 MiB.
+
+    Returns
+    -------
+    dict
+        ``read``, ``kept``, ``duplicates`` and ``skipped`` line counts,
+        ``categories`` mapping each category to its size, and ``seconds``.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> workdir = tempfile.mkdtemp()
+    >>> dump = os.path.join(workdir, "dump.txt")
+    >>> with open(dump, "w") as f:
+    ...     _ = f.write("My code has a bug. It is a feature!\\n" * 2)
+    ...     _ = f.write("A horse walks into a bar. Why the long face?\\n")
+    >>> stats = build_corpus([dump], os.path.join(workdir, "jokes.jpk"), jobs=1)
+    >>> stats["categories"], stats["duplicates"]
+    ({'programming': 1, 'misc': 1}, 1)
+    """
+    if facts is None:
+        from joke_machine.app import FUN_FACTS
+
+        facts = FUN_FACTS
+    began = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(output))
+    workdir = tempfile.mkdtemp(dir=directory, prefix=".build-corpus-")
+    try:
+        tasks = [
+            (
+                path,
+                start,
+                stop,
+                columns,
+                os.path.join(workdir, f"shard-{i:06d}"),
+                default_category,
+                min_length,
+            )
+            for i, (path, start, stop, columns) in enumerate(
+                plan_shards(inputs, shard_size)
+            )
+        ]
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(tasks) <= 1:
+            results = list(map(process_shard, tasks))
+        else:
+            with ProcessPoolExecutor(jobs) as pool:
+                results = list(pool.map(process_shard, tasks))
+
+        counts = {
+            "read": sum(result[2] for result in results),
+            "kept": 0,
+            "duplicates": sum(result[3] for result in results),
+            "skipped": sum(result[4] for result in results),
+        }
+        shards = [(shard_path, names) for shard_path, names, *_ in results]
+        order = list(dict.fromkeys(name for _, names in shards for name in names))
+        seen = KeySet()
+        write_packed_corpus(
+            output,
+            {name: _category_records(shards, name, seen, counts) for name in order},
+            facts,
+            splits=True,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    from joke_machine.corpus import PackedCorpus
+
+    with PackedCorpus(output) as corpus:
+        counts["categories"] = {name: corpus.count(name) for name in corpus.categories}
+    counts["seconds"] = time.perf_counter() - began
+    return counts
+
+
+def format_stats(stats):
+    """
+    Format the result of :func:`build_corpus` for the terminal.
+
+    Examples
+    --------
+    >>> print(format_stats({"read": 3, "kept": 2, "duplicates": 1, "skipped": 0,
+    ...     "categories": {"misc": 2}, "seconds": 0.5}))
+    Read 3 lines in 0.50 s, kept 2 jokes.
+    Dropped 1 duplicates and 0 short lines.
+      misc: 2
+    """
+    lines = [
+        f"Read {stats['read']} lines in {stats['seconds']:.2f} s, "
+        f"kept {stats['kept']} jokes.",
+        f"Dropped {stats['duplicates']} duplicates and {stats['skipped']} short lines.",
+    ]
+    lines += [f"  {name}: {count}" for name, count in stats["categories"].items()]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Build a packed corpus from the command line."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="joke-machine build-corpus",
+        description="Build a packed corpus from text files (one joke per line) "
+        "and CSV files with a 'joke' or 'text' column.",
+    )
+    parser.add_argument("inputs", nargs="+", help="Text and .csv joke dumps")
+    parser.add_argument("--output", "-o", required=True, help="Packed corpus to write")
+    parser.add_argument(
+        "--jobs", "-j", type=int, help="Worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--facts", help="Text file of fun facts, one per line (default: built-in)"
+    )
+    parser.add_argument(
+        "--default-category",
+        default=DEFAULT_CATEGORY,
+        help="Category of jokes that match no keywords (default: misc)",
+    )
+    parser.add_argument(
+        "--min-length",
+        type=int,
+        default=10,
+        help="Skip lines shorter than this (default: 10)",
+    )
+    args = parser.parse_args(argv)
+
+    facts = None
+    if args.facts:
+        with open(args.facts, encoding="utf-8") as f:
+            facts = [line.strip() for line in f if line.strip()]
+    try:
+        stats = build_corpus(
+            args.inputs,
+            args.output,
+            args.jobs,
+            facts,
+            args.default_category,
+            args.min_length,
+        )
+    except (OSError, ValueError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
+    print(format_stats(stats))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Flat, category-tagged index over the joke collection.
+
+Drawing a joke from "any category" needs a single sequence spanning every
+category. Rebuilding that sequence on each draw costs O(total corpus), so the
+catalog builds it once and only rebuilds when the categories change.
+
+Per-joke metadata (category ID, hash and setup/punchline offsets) is stored
+in parallel arrays, so large catalogs cost little more than their texts and
+looking a joke up is O(1).
+"""
+
+import heapq
+import random
+from array import array
+
+from joke_machine.delivery import split_joke
+
+
+class Joke:
+    """
+    One joke of a :class:`JokeCatalog`, assembled from its parallel arrays.
+
+    Attributes
+    ----------
+    text : str
+        The joke text.
+    category_id : int
+        Small-int ID of the category, an index into
+        :attr:`JokeCatalog.categories`.
+    category : str
+        The category name.
+    hash : int
+        ``hash(text)``, stored so lookups never rehash the text.
+    setup_end : int
+        Length of the setup.
+    punchline_start : int
+        Offset of the punchline in ``text``, or 0 if the joke has no break.
+    """
+
+    __slots__ = (
+        "text",
+        "category_id",
+        "category",
+        "hash",
+        "setup_end",
+        "punchline_start",
+    )
+
+    def __init__(self, text, category_id, category, hash, setup_end, punchline_start):
+        self.text = text
+        self.category_id = category_id
+        self.category = category
+        self.hash = hash
+        self.setup_end = setup_end
+        self.punchline_start = punchline_start
+
+    @property
+    def parts(self):
+        """tuple: ``(setup, punchline)``, as returned by ``split_joke``."""
+        if not self.punchline_start:
+            return self.text, None
+        return self.text[: self.setup_end], self.text[self.punchline_start :]
+
+    def __repr__(self):
+        return f"Joke({self.text!r}, category={self.category!r})"
+
+
+def _id_typecode(count):
+    return "B" if count <= 0x100 else "H" if count <= 0x10000 else "I"
+
+
+class JokeCatalog:
+    """
+    Flat index over a ``{category: [joke, ...]}`` mapping.
+
+    The index is built lazily on first access and rebuilt whenever the set of
+    categories, or the identity or length of any category list, changes.
+    Checking for changes is O(number of categories), so uncategorized draws
+    stay O(1) regardless of corpus size.
+
+    Per-joke metadata is kept in parallel arrays rather than per-joke
+    objects: a small-int category ID for every joke, and, built on first
+    lookup, the text hash and the setup/punchline offsets. A text-to-position
+    table makes :meth:`find`, :meth:`category_of` and :meth:`split` O(1).
+
+    Parameters
+    ----------
+    jokes : dict
+        Mapping of category name to a list of jokes. The mapping is referenced,
+        not copied, so later changes to it are picked up by :meth:`refresh`.
+
+    Notes
+    -----
+    Replacing a joke in place (``jokes["dad"][0] = ...``) keeps the list
+    identity and length unchanged and is not detected. Call :meth:`invalidate`
+    after such edits.
+
+    Examples
+    --------
+    >>> catalog = JokeCatalog({"a": ["a1", "a2"], "b": ["b1"]})
+    >>> catalog.texts
+    ['a1', 'a2', 'b1']
+    >>> catalog.tags
+    ['a', 'a', 'b']
+    >>> catalog.category_of("b1")
+    'b'
+    >>> catalog.source["b"].append("b2")
+    >>> len(catalog)
+    4
+    """
+
+    def __init__(self, jokes):
+        self.source = jokes
+        self._signature = None
+        self._texts = []
+        self._categories = []
+        self._category_ids = array("B")
+        self._tags = None
+        self._spans = {}
+        self._lookup = None
+
+    def _current_signature(self):
+        return tuple(
+            (name, id(jokes), len(jokes)) for name, jokes in self.source.items()
+        )
+
+    def invalidate(self):
+        """Force the index to be rebuilt on next access."""
+        self._signature = None
+
+    def refresh(self):
+        """
+        Rebuild the flat index if the underlying categories have changed.
+
+        Returns
+        -------
+        JokeCatalog
+            The catalog itself, to allow chaining.
+        """
+        signature = self._current_signature()
+        if signature != self._signature:
+            texts = []
+            spans = {}
+            ids = array(_id_typecode(len(self.source)))
+            for category_id, (name, jokes) in enumerate(self.source.items()):
+                spans[name] = (len(texts), len(texts) + len(jokes))
+                texts.extend(jokes)
+                ids.extend(array(ids.typecode, [category_id]) * len(jokes))
+            self._texts = texts
+            self._categories = list(self.source)
+            self._category_ids = ids
+            self._spans = spans
+            self._tags = None
+            self._lookup = None
+            self._signature = signature
+        return self
+
+    def _build_lookup(self):
+        # Bypass the LRU cache, which is meant for ad-hoc jokes
+        split = split_joke.__wrapped__
+        positions = {}
+        hashes = array("q")
+        setup_ends = array("I")
+        punchline_starts = array("I")
+        for position, text in enumerate(self._texts):
+            # Keep the first position of a joke listed more than once
+            positions.setdefault(text, position)
+            hashes.append(hash(text))
+            setup, punchline = split(text)
+            setup_ends.append(len(setup))
+            punchline_starts.append(len(text) - len(punchline) if punchline else 0)
+        self._lookup = (positions, hashes, setup_ends, punchline_starts)
+        return self._lookup
+
+    @property
+    def texts(self):
+        """list of str: Every joke, in category order."""
+        return self.refresh()._texts
+
+    @property
+    def categories(self):
+        """list of str: Category names, indexed by category ID."""
+        return self.refresh()._categories
+
+    @property
+    def category_ids(self):
+        """array.array: Category ID of each entry in :attr:`texts`."""
+        return self.refresh()._category_ids
+
+    @property
+    def tags(self):
+        """
+        list of str: Category of each entry in :attr:`texts`.
+
+        Materialized from :attr:`category_ids` on first access; prefer
+        :meth:`category_of` or :attr:`category_ids` for large catalogs.
+        """
+        self.refresh()
+        if self._tags is None:
+            names = self._categories
+            self._tags = [names[i] for i in self._category_ids]
+        return self._tags
+
+    @property
+    def spans(self):
+        """dict: ``(start, stop)`` range of each category within :attr:`texts`."""
+        return self.refresh()._spans
+
+    def position(self, joke):
+        """
+        Return the position of a joke in :attr:`texts`, or None.
+
+        Examples
+        --------
+        >>> JokeCatalog({"a": ["a1", "a2"]}).position("a2")
+        1
+        """
+        lookup = self.refresh()._lookup or self._build_lookup()
+        return lookup[0].get(joke)
+
+    def find(self, joke):
+        """
+        Return the :class:`Joke` record of a joke text, or None.
+
+        Examples
+        --------
+        >>> JokeCatalog({"a": ["Why? Because."]}).find("Why? Because.").parts
+        ('Why?', ' Because.')
+        """
+        position = self.position(joke)
+        return None if position is None else self.record(position)
+
+    def record(self, position):
+        """Return the :class:`Joke` record at a position of :attr:`texts`."""
+        _, hashes, setup_ends, punchline_starts = self._lookup or self._build_lookup()
+        category_id = self._category_ids[position]
+        return Joke(
+            self._texts[position],
+            category_id,
+            self._categories[category_id],
+            hashes[position],
+            setup_ends[position],
+            punchline_starts[position],
+        )
+
+    def category_of(self, joke):
+        """
+        Return the category of a joke, or None if it is not in the catalog.
+
+        This is an O(1) lookup, unlike scanning the category lists.
+        """
+        position = self.position(joke)
+        if position is None:
+            return None
+        return self._categories[self._category_ids[position]]
+
+    def split(self, joke):
+        """
+        Return the ``(setup, punchline)`` split of a joke.
+
+        Catalog jokes are split from their precomputed offsets; any other
+        joke is split by :func:`joke_machine.delivery.split_joke`, which
+        caches recent results.
+
+        Examples
+        --------
+        >>> catalog = JokeCatalog({"a": ["Why? Because."]})
+        >>> catalog.split("Why? Because.")
+        ('Why?', ' Because.')
+        >>> catalog.split("Not in the catalog. Still works.")
+        ('Not in the catalog.', 'Still works.')
+        """
+        # Offsets depend only on the joke text, so a table built before the
+        # last change is still correct for the jokes it contains
+        positions, _, setup_ends, punchline_starts = (
+            self._lookup or self.refresh()._lookup or self._build_lookup()
+        )
+        position = positions.get(joke)
+        if position is None:
+            return split_joke(joke)
+        start = punchline_starts[position]
+        if not start:
+            return joke, None
+        return joke[: setup_ends[position]], joke[start:]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def sample(self, n, category=None, unique=False, weights=None, rng=None):
+        """
+        Draw ``n`` positions from the flat index in a single pass.
+
+        Parameters
+        ----------
+        n : int
+            Number of positions to draw.
+        category : str, optional
+            Restrict the draw to this category. Unknown categories draw from
+            every category, like :func:`joke_machine.app.get_joke`.
+        unique : bool, optional
+            Sample without replacement. Default is False.
+        weights : dict, optional
+            Relative share of draws per category, e.g. ``{"dad": 2, "puns": 1}``.
+            Categories missing from the mapping get weight 0. Ignored when
+            ``category`` is given.
+        rng : random.Random, optional
+            Random number generator to draw from. Defaults to the global
+            ``random`` module state.
+
+        Returns
+        -------
+        array.array
+            Positions into :attr:`texts`, as unsigned ints.
+
+        Raises
+        ------
+        ValueError
+            If ``unique`` is set and ``n`` exceeds the number of eligible jokes.
+
+        Examples
+        --------
+        >>> import random
+        >>> catalog = JokeCatalog({"a": ["a1", "a2"], "b": ["b1", "b2"]})
+        >>> picks = catalog.sample(2, category="b", unique=True, rng=random.Random(1))
+        >>> sorted(catalog.texts[i] for i in picks)
+        ['b1', 'b2']
+        >>> picks = catalog.sample(5, weights={"a": 1}, rng=random.Random(1))
+        >>> sorted({catalog.tags[i] for i in picks})
+        ['a']
+        """
+        return sample_spans(
+            self.spans, len(self._texts), n, category, unique, weights, rng
+        )
+
+
+def sample_spans(spans, total, n, category=None, unique=False, weights=None, rng=None):
+    """
+    Draw ``n`` positions from a sequence made of contiguous category spans.
+
+    This is the sampler behind :meth:`JokeCatalog.sample`. It only needs the
+    category spans and the total length, so any indexed corpus can share it.
+
+    Parameters
+    ----------
+    spans : dict
+        ``(start, stop)`` range of each category.
+    total : int
+        Length of the whole sequence.
+    n, category, unique, weights, rng
+        See :meth:`JokeCatalog.sample`.
+
+    Returns
+    -------
+    array.array
+        The drawn positions, as unsigned ints.
+
+    Examples
+    --------
+    >>> import random
+    >>> list(sample_spans({"a": (0, 3), "b": (3, 4)}, 4, 2, "b", rng=random.Random(0)))
+    [3, 3]
+    """
+    rng = rng or random
+    if category in spans:
+        start, stop = spans[category]
+        return _sample_range(rng, start, stop, n, unique)
+    if not weights:
+        return _sample_range(rng, 0, total, n, unique)
+
+    ranges = [
+        (spans[name], weight)
+        for name, weight in weights.items()
+        if name in spans and weight > 0 and spans[name][0] < spans[name][1]
+    ]
+    if not ranges:
+        if n > 0:
+            raise ValueError("No jokes in the weighted categories to draw from")
+        return array("I")
+    if unique:
+        # Efraimidis-Spirakis: keep the n largest u ** (1 / w) keys
+        keyed = (
+            (rng.random() ** ((stop - start) / weight), index)
+            for (start, stop), weight in ranges
+            for index in range(start, stop)
+        )
+        if n > sum(stop - start for (start, stop), _ in ranges):
+            raise ValueError("Sample larger than population or is negative")
+        return array("I", [index for _, index in heapq.nlargest(n, keyed)])
+
+    chosen = rng.choices(ranges, weights=[weight for _, weight in ranges], k=n)
+    return array(
+        "I",
+        [start + int(rng.random() * (stop - start)) for (start, stop), _ in chosen],
+    )
+
+
+def _sample_range(rng, start, stop, n, unique):
+    population = range(start, stop)
+    if unique:
+        return array("I", rng.sample(population, n))
+    if not population and n > 0:
+        raise ValueError("Cannot draw from an empty population")
+    return array("I", rng.choices(population, k=n))
@@ -0,0 +1,475 @@
+"""
+Packed, memory-mapped joke corpus stored on disk.
+
+A packed corpus file lets JokeMachine serve corpora far larger than the
+built-in ``JOKES`` and ``FUN_FACTS`` lists. Records are stored back to back
+and located through an offset table, so drawing a joke decodes only that one
+record and resident memory does not grow with the corpus size.
+
+File layout (all integers little-endian)::
+
+    magic         8 bytes, b"JOKEPAK1"
+    header_size   uint32
+    header        UTF-8 JSON: {"version", "count", "categories", "facts"}
+    offsets       (count + 1) x uint64, record boundaries relative to data
+    data          UTF-8 records, back to back
+    splits        optional, 2 x uint32 per joke: setup end and punchline
+                  start, in characters, present if the header has "splits"
+
+Joke categories occupy contiguous record ranges listed in ``categories`` as
+``[name, start, stop]``. Fun facts follow as the ``[start, stop]`` range in
+``facts``.
+
+Plain JSON corpora of ``{category: [joke, ...]}`` are compiled to this format
+by :func:`compile_corpus` and cached under ``$XDG_CACHE_HOME/joke_machine``.
+The header of a cached file records the source path, modification time and
+size it was built from, so later runs only ``stat`` the source and read the
+cache header before serving from the mapping.
+"""
+
+import json
+import mmap
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+from joke_machine.delivery import split_joke
+
+MAGIC = b"JOKEPAK1"
+FORMAT_VERSION = 1
+
+_HEADER_SIZE = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_BOUNDS = struct.Struct("<QQ")
+_SPLIT = struct.Struct("<II")
+
+
+class CorpusFormatError(ValueError):
+    """Raised when a file is not a valid packed corpus."""
+
+
+def write_packed_corpus(path, jokes, facts=(), meta=None, splits=False):
+    """
+    Write jokes and fun facts to a packed corpus file.
+
+    Records are streamed to a temporary data file while only their offsets
+    are kept in memory, then assembled into ``path``.
+
+    Parameters
+    ----------
+    path : str
+        Destination file. It is replaced atomically once fully written.
+    jokes : dict
+        Mapping of category name to an iterable of jokes.
+    facts : iterable of str, optional
+        Fun facts to store alongside the jokes.
+    meta : dict, optional
+        JSON-serializable data stored in the header, available as
+        :attr:`PackedCorpus.meta`.
+    splits : bool, optional
+        Jokes are ``(text, setup_end, punchline_start)`` tuples with the
+        precomputed split of each joke (see :attr:`joke_machine.catalog.Joke`),
+        stored for :meth:`PackedCorpus.parts`. Default is False.
+
+    Returns
+    -------
+    int
+        Number of records written.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "corpus.jpk")
+    >>> write_packed_corpus(path, {"dad": ["Joke A", "Joke B"]}, ["Fact A"])
+    3
+    >>> with PackedCorpus(path) as corpus:
+    ...     corpus.categories, corpus.text(2)
+    (['dad'], 'Fact A')
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    offsets = array("Q", [0])
+    split_table = array("I")
+    categories = []
+
+    with tempfile.TemporaryFile(dir=directory) as data:
+
+        def write_records(records):
+            start = len(offsets) - 1
+            for record in records:
+                data.write(record.encode("utf-8"))
+                offsets.append(data.tell())
+            return start, len(offsets) - 1
+
+        def split_records(records):
+            for text, setup_end, punchline_start in records:
+                split_table.append(setup_end)
+                split_table.append(punchline_start)
+                yield text
+
+        for name, records in jokes.items():
+            if splits:
+                records = split_records(records)
+            categories.append([name, *write_records(records)])
+        fact_span = list(write_records(facts))
+
+        fields = {
+            "version": FORMAT_VERSION,
+            "count": len(offsets) - 1,
+            "categories": categories,
+            "facts": fact_span,
+            "meta": meta,
+        }
+        if splits:
+            fields["splits"] = True
+        header = json.dumps(fields).encode("utf-8")
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(MAGIC)
+                out.write(_HEADER_SIZE.pack(len(header)))
+                out.write(header)
+                if sys.byteorder == "big":
+                    offsets.byteswap()
+                    split_table.byteswap()
+                offsets.tofile(out)
+                data.seek(0)
+                shutil.copyfileobj(data, out)
+                split_table.tofile(out)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    return len(offsets) - 1
+
+
+class _Records:
+    """Read-only sequence of the records of a :class:`PackedCorpus`."""
+
+    def __init__(self, corpus):
+        self._corpus = corpus
+
+    def __len__(self):
+        return self._corpus._count
+
+    def __getitem__(self, index):
+        return self._corpus.text(index)
+
+
+class PackedCorpus:
+    """
+    Read-only view of a packed corpus file through ``mmap``.
+
+    Only the small JSON header is parsed when the file is opened. Offsets and
+    records are read from the mapping on demand.
+
+    Parameters
+    ----------
+    path : str
+        Path of a file written by :func:`write_packed_corpus`.
+
+    Raises
+    ------
+    CorpusFormatError
+        If the file is not a packed corpus or uses an unknown format version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:  # empty file
+                raise CorpusFormatError(f"{path} is not a packed corpus") from exc
+
+        try:
+            self._read_header()
+        except CorpusFormatError:
+            self.close()
+            raise
+        except (struct.error, ValueError, KeyError, TypeError) as exc:
+            self.close()
+            raise CorpusFormatError(f"{path} has a damaged header") from exc
+
+    def _read_header(self):
+        path = self.path
+        if self._map[: len(MAGIC)] != MAGIC:
+            raise CorpusFormatError(f"{path} is not a packed corpus")
+        (header_size,) = _HEADER_SIZE.unpack_from(self._map, len(MAGIC))
+        header_start = len(MAGIC) + _HEADER_SIZE.size
+        header = json.loads(self._map[header_start : header_start + header_size])
+        if header.get("version") != FORMAT_VERSION:
+            raise CorpusFormatError(
+                f"{path} uses unsupported corpus version {header.get('version')}"
+            )
+
+        self._count = header["count"]
+        self._offsets_start = header_start + header_size
+        self._data_start = self._offsets_start + (self._count + 1) * _OFFSET.size
+        if self._data_start > len(self._map):
+            raise CorpusFormatError(f"{path} is truncated")
+        self._spans = {
+            name: (start, stop) for name, start, stop in header["categories"]
+        }
+        self._joke_count = max((stop for _, stop in self._spans.values()), default=0)
+        self.fact_span = tuple(header["facts"])
+        self.meta = header.get("meta")
+        self._splits_start = None
+        if header.get("splits"):
+            (size,) = _OFFSET.unpack_from(
+                self._map, self._offsets_start + self._count * _OFFSET.size
+            )
+            self._splits_start = self._data_start + size
+
+    def close(self):
+        """Release the memory mapping."""
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def categories(self):
+        """list of str: Joke category names, in file order."""
+        return list(self._spans)
+
+    @property
+    def spans(self):
+        """dict: ``(start, stop)`` record range of each joke category."""
+        return self._spans
+
+    def __len__(self):
+        """Number of joke records (fun facts are not counted)."""
+        return self._joke_count
+
+    @property
+    def records(self):
+        """Sequence view of every record, jokes first, decoded on access."""
+        return _Records(self)
+
+    def count(self, category):
+        """Number of jokes in ``category``, or 0 if it does not exist."""
+        start, stop = self._spans.get(category, (0, 0))
+        return stop - start
+
+    def text(self, index):
+        """
+        Decode a single record.
+
+        Parameters
+        ----------
+        index : int
+            Record number, between 0 and the total record count.
+
+        Returns
+        -------
+        str
+            The decoded joke or fun fact.
+        """
+        if not 0 <= index < self._count:
+            raise IndexError("record index out of range")
+        start, stop = _BOUNDS.unpack_from(
+            self._map, self._offsets_start + index * _OFFSET.size
+        )
+        return self._map[self._data_start + start : self._data_start + stop].decode(
+            "utf-8"
+        )
+
+    def parts(self, index):
+        """
+        Return the ``(setup, punchline)`` split of a joke record.
+
+        Uses the splits stored in the file when there are any, and
+        :func:`joke_machine.delivery.split_joke` otherwise.
+
+        Examples
+        --------
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "corpus.jpk")
+        >>> write_packed_corpus(path, {"a": [("Why? Because.", 4, 4)]}, splits=True)
+        1
+        >>> with PackedCorpus(path) as corpus:
+        ...     corpus.parts(0)
+        ('Why?', ' Because.')
+        """
+        text = self.text(index)
+        if self._splits_start is None or not 0 <= index < self._joke_count:
+            return split_joke(text)
+        setup_end, punchline_start = _SPLIT.unpack_from(
+            self._map, self._splits_start + index * _SPLIT.size
+        )
+        if not punchline_start:
+            return text, None
+        return text[:setup_end], text[punchline_start:]
+
+    def draw(self, category=None, rng=None):
+        """Return the record number of a random joke, see :meth:`get_joke`."""
+        start, stop = self._spans.get(category, (0, self._joke_count))
+        if start == stop:
+            raise IndexError("Cannot choose from an empty sequence")
+        return start + int((rng or random).random() * (stop - start))
+
+    def get_joke(self, category=None, rng=None):
+        """
+        Get a random joke, decoding only the drawn record.
+
+        Parameters
+        ----------
+        category : str, optional
+            The joke category to select from. If None or unknown, a joke from
+            any category will be returned.
+        rng : random.Random, optional
+            Random number generator to draw from. Defaults to the global
+            ``random`` module state.
+
+        Returns
+        -------
+        str
+            A randomly selected joke.
+        """
+        start, stop = self._spans.get(category, (0, self._joke_count))
+        return self._choose(start, stop, rng)
+
+    def get_fun_fact(self, rng=None):
+        """Get a random fun fact, decoding only the drawn record."""
+        return self._choose(*self.fact_span, rng)
+
+    def _choose(self, start, stop, rng):
+        if start == stop:
+            raise IndexError("Cannot choose from an empty sequence")
+        return self.text(start + int((rng or random).random() * (stop - start)))
+
+
+def cache_dir():
+    """
+    Return the directory compiled corpora are cached in.
+
+    This is ``$XDG_CACHE_HOME/joke_machine``, or ``~/.cache/joke_machine`` if
+    the variable is not set.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "joke_machine")
+
+
+def read_corpus_source(path):
+    """
+    Read a JSON corpus of ``{category: [joke, ...]}``.
+
+    Raises
+    ------
+    CorpusFormatError
+        If the file is not valid JSON of that shape.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            jokes = json.load(f)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise CorpusFormatError(f"{path} is not a JSON corpus: {exc}") from exc
+    if not isinstance(jokes, dict) or not all(
+        isinstance(texts, list) and all(isinstance(text, str) for text in texts)
+        for texts in jokes.values()
+    ):
+        raise CorpusFormatError(
+            f"{path} must map each category to a list of joke strings"
+        )
+    return jokes
+
+
+def compile_corpus(source, facts=(), version="", directory=None):
+    """
+    Open a JSON corpus through its compiled cache, rebuilding it if stale.
+
+    The cache is valid while the source path, modification time and size,
+    the fun facts and ``version`` all match the ones it was built from.
+    Checking this costs one ``stat`` and reading the cache header.
+
+    Parameters
+    ----------
+    source : str
+        Path of a JSON corpus of ``{category: [joke, ...]}``.
+    facts : sequence of str, optional
+        Fun facts to store alongside the jokes.
+    version : str, optional
+        Version of the program building the cache; a new version rebuilds it.
+    directory : str, optional
+        Cache directory. Defaults to :func:`cache_dir`.
+
+    Returns
+    -------
+    PackedCorpus
+        The compiled corpus.
+
+    Examples
+    --------
+    >>> import json, os, tempfile
+    >>> workdir = tempfile.mkdtemp()
+    >>> source = os.path.join(workdir, "jokes.json")
+    >>> with open(source, "w") as f:
+    ...     json.dump({"dad": ["Joke A", "Joke B"]}, f)
+    >>> with compile_corpus(source, ["Fact A"], directory=workdir) as corpus:
+    ...     corpus.categories, len(corpus), corpus.text(2)
+    (['dad'], 2, 'Fact A')
+    """
+    source = os.path.abspath(source)
+    stat = os.stat(source)
+    key = {
+        "source": source,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "facts": zlib.crc32("\n".join(facts).encode("utf-8")),
+        "version": version,
+    }
+    directory = directory or cache_dir()
+    name = os.path.basename(source)
+    path = os.path.join(
+        directory, f"{name}-{zlib.crc32(source.encode('utf-8')):08x}.jpk"
+    )
+
+    try:
+        corpus = PackedCorpus(path)
+    except (OSError, CorpusFormatError):
+        pass
+    else:
+        if corpus.meta == key:
+            return corpus
+        corpus.close()
+
+    jokes = read_corpus_source(source)
+    os.makedirs(directory, exist_ok=True)
+    write_packed_corpus(path, jokes, facts, meta=key)
+    return PackedCorpus(path)
+
+
+def open_corpus(path, facts=(), version=""):
+    """
+    Open a packed corpus, or a JSON corpus through its compiled cache.
+
+    Parameters
+    ----------
+    path : str
+        A file written by :func:`write_packed_corpus`, or a JSON corpus of
+        ``{category: [joke, ...]}``.
+    facts, version
+        Passed to :func:`compile_corpus` for JSON corpora.
+
+    Returns
+    -------
+    PackedCorpus
+        The opened corpus.
+    """
+    with open(path, "rb") as f:
+        packed = f.read(len(MAGIC)) == MAGIC
+    if packed:
+        return PackedCorpus(path)
+    return compile_corpus(path, facts, version)
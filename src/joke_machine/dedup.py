@@ -0,0 +1,411 @@
+"""
+Exact and near-duplicate removal for joke corpora.
+
+Merged community corpora tend to repeat jokes, verbatim or with small edits,
+which skews :func:`joke_machine.app.get_joke` towards the repeated ones.
+:func:`dedupe_corpus` removes them in one streaming pass:
+
+1. Exact duplicates are found by a hash of the normalized text (case,
+   punctuation and spacing are ignored).
+2. Near duplicates are found with MinHash signatures over word shingles and
+   locality-sensitive hashing (LSH): signatures are cut into bands, and only
+   jokes sharing a band bucket are compared. A bucket keeps the first joke
+   that landed in it, so each joke has at most one candidate per band.
+   Candidates are confirmed by their exact Jaccard similarity, so there are
+   no false positives.
+
+Each joke is compared against a handful of candidates instead of every other
+joke, so the pass scales linearly with the corpus size. The kept jokes are
+held in memory, as they make up the result. On top of them, deduplication
+keeps one dict entry per kept joke, keyed by an 8-byte hash, and for near
+duplicates up to one bucket entry per band and kept joke.
+
+The module can also be run on a JSON file of ``{category: [joke, ...]}``::
+
+    python -m joke_machine.dedup community.json -o clean.json
+"""
+
+import hashlib
+import random
+import zlib
+
+_MASK64 = (1 << 64) - 1
+
+
+class _SpacingTable(dict):
+    """str.translate table mapping every non-alphanumeric character to a space.
+
+    Entries are added the first time a character is seen, so translating
+    stays in C after a short warm-up whatever the script of the corpus.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        self[codepoint] = value = char if char.isalnum() else " "
+        return value
+
+
+_SPACING = _SpacingTable()
+
+
+def normalize_joke(text):
+    """
+    Normalize a joke for comparison.
+
+    Letters are case-folded, punctuation becomes spacing, and runs of spacing
+    collapse to one space.
+
+    Examples
+    --------
+    >>> normalize_joke("Why?  Because -- it's FUNNY!")
+    'why because it s funny'
+    """
+    return " ".join(text.casefold().translate(_SPACING).split())
+
+
+def joke_key(normalized):
+    """
+    Return the 8-byte exact-duplicate key of a normalized joke.
+
+    Examples
+    --------
+    >>> joke_key(normalize_joke("Knock knock!")) == joke_key("knock knock")
+    True
+    """
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+
+def shingles(normalized, size=2):
+    """
+    Return the set of hashed word ``size``-grams of a normalized joke.
+
+    Jokes shorter than ``size`` words yield a single shingle for the whole
+    text. Hashes are CRC-32, which is stable across processes.
+
+    Examples
+    --------
+    >>> len(shingles("a b c d"))
+    3
+    >>> shingles("a b c d") <= shingles("a b c d e")
+    True
+    """
+    words = normalized.split()
+    if len(words) <= size:
+        return {zlib.crc32(normalized.encode("utf-8"))}
+    return {
+        zlib.crc32(" ".join(words[i : i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    }
+
+
+def jaccard(a, b):
+    """
+    Return the Jaccard similarity of two sets.
+
+    Examples
+    --------
+    >>> jaccard({1, 2, 3}, {2, 3, 4})
+    0.5
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _mix64(value):
+    # splitmix64 finalizer: spreads CRC-32 shingle hashes over 64 bits
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class MinHasher:
+    """
+    MinHash signatures by one-permutation hashing with optimal densification.
+
+    Classic MinHash hashes every shingle once per signature slot. Here each
+    shingle is hashed once and lands in one slot, keeping the slot minimum.
+    Slots left empty (common for short jokes) borrow the value of another
+    slot along a fixed random probe sequence. Two signatures still agree in
+    each slot with probability equal to the Jaccard similarity of the
+    shingle sets, at a fraction of the cost.
+
+    Parameters
+    ----------
+    num_perm : int, optional
+        Signature length. Default is 32.
+    seed : int, optional
+        Seed for the probe sequences, so signatures are reproducible.
+
+    Examples
+    --------
+    >>> hasher = MinHasher(num_perm=8)
+    >>> a = hasher.signature(shingles("the quick brown fox jumps"))
+    >>> len(a)
+    8
+    >>> a == hasher.signature(shingles("the quick brown fox jumps"))
+    True
+    """
+
+    def __init__(self, num_perm=32, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._probes = [
+            [rng.randrange(num_perm) for _ in range(8 * num_perm)]
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, hashes):
+        """Return the MinHash signature of a set of shingle hashes."""
+        k = self.num_perm
+        slots = [None] * k
+        for h in hashes:
+            rank, slot = divmod(_mix64(h), k)
+            current = slots[slot]
+            if current is None or rank < current:
+                slots[slot] = rank
+        signature = list(slots)
+        for slot, value in enumerate(slots):
+            if value is not None:
+                continue
+            for other in self._probes[slot]:
+                if slots[other] is not None:
+                    signature[slot] = slots[other]
+                    break
+            else:
+                # Only reachable for tiny inputs with astronomically bad luck
+                signature[slot] = next(v for v in slots if v is not None)
+        return tuple(signature)
+
+
+class DedupReport:
+    """
+    Summary of a deduplication pass.
+
+    Attributes
+    ----------
+    total : int
+        Jokes read.
+    kept : int
+        Jokes kept.
+    exact : list of tuple
+        ``(category, joke, kept_category, kept_joke)`` for each exact
+        duplicate, up to ``max_examples``.
+    near : list of tuple
+        ``(category, joke, kept_category, kept_joke, similarity)`` for each
+        near duplicate, up to ``max_examples``.
+    exact_count, near_count : int
+        Number of exact and near duplicates removed.
+    removed_by_category : dict
+        Duplicates removed from each category.
+    """
+
+    def __init__(self, max_examples=20):
+        self.max_examples = max_examples
+        self.total = 0
+        self.kept = 0
+        self.exact = []
+        self.near = []
+        self.exact_count = 0
+        self.near_count = 0
+        self.removed_by_category = {}
+
+    def _removed(self, category):
+        self.removed_by_category[category] = (
+            self.removed_by_category.get(category, 0) + 1
+        )
+
+    def format(self):
+        """
+        Format the report for the terminal.
+
+        Examples
+        --------
+        >>> _, report = dedupe_corpus({"a": ["Hi there!", "hi, there"]})
+        >>> print(report.format())
+        Read 2 jokes, kept 1.
+        Removed 1 exact duplicates and 0 near duplicates.
+          a: 1 removed
+        <BLANKLINE>
+        Exact duplicates:
+          [a] 'hi, there'
+            = [a] 'Hi there!'
+        """
+        lines = [
+            f"Read {self.total} jokes, kept {self.kept}.",
+            f"Removed {self.exact_count} exact duplicates and "
+            f"{self.near_count} near duplicates.",
+        ]
+        for category, count in self.removed_by_category.items():
+            lines.append(f"  {category}: {count} removed")
+        if self.exact:
+            lines += ["", "Exact duplicates:"]
+            for category, joke, kept_category, kept in self.exact:
+                lines.append(f"  [{category}] {joke!r}")
+                lines.append(f"    = [{kept_category}] {kept!r}")
+        if self.near:
+            lines += ["", "Near duplicates:"]
+            for category, joke, kept_category, kept, similarity in self.near:
+                lines.append(f"  [{category}] {joke!r}")
+                lines.append(f"    ~ [{kept_category}] {kept!r} ({similarity:.0%})")
+        return "\n".join(lines)
+
+
+def dedupe_corpus(
+    jokes, threshold=0.8, near=True, num_perm=32, bands=8, shingle_size=2
+):
+    """
+    Remove exact and near-duplicate jokes from a corpus.
+
+    The first occurrence of each joke is kept, in category order, so merging
+    a new corpus after an existing one keeps the existing jokes.
+
+    Parameters
+    ----------
+    jokes : dict
+        Mapping of category name to an iterable of jokes.
+    threshold : float, optional
+        Jaccard similarity of word shingles at or above which two jokes are
+        near duplicates. Default is 0.8.
+    near : bool, optional
+        Also remove near duplicates. Default is True.
+    num_perm : int, optional
+        MinHash signature length. Default is 32.
+    bands : int, optional
+        Number of LSH bands; ``num_perm`` must be divisible by it. More,
+        narrower bands find more candidates at the cost of memory. With the
+        defaults a pair at 0.8 similarity becomes a candidate with 98%
+        probability, and one at 0.7 with 88%. Default is 8.
+    shingle_size : int, optional
+        Words per shingle. Default is 2.
+
+    Returns
+    -------
+    tuple
+        ``(jokes, report)``: the deduplicated ``{category: [joke, ...]}`` and
+        a :class:`DedupReport`.
+
+    Examples
+    --------
+    >>> corpus = {
+    ...     "dad": ["I'm afraid for the calendar. Its days are numbered."],
+    ...     "puns": [
+    ...         "I'm afraid for the calendar! Its days are numbered.",
+    ...         "I'm so afraid for the calendar. Its days are numbered.",
+    ...         "Time flies like an arrow.",
+    ...     ],
+    ... }
+    >>> clean, report = dedupe_corpus(corpus, threshold=0.7)
+    >>> clean["puns"]
+    ['Time flies like an arrow.']
+    >>> report.exact_count, report.near_count
+    (1, 1)
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    seen = {}
+    buckets = [{} for _ in range(bands)]
+    kept_texts = []
+    kept_categories = []
+    report = DedupReport()
+    result = {}
+
+    for category, texts in jokes.items():
+        kept_in_category = result.setdefault(category, [])
+        for text in texts:
+            report.total += 1
+            normalized = normalize_joke(text)
+            key = joke_key(normalized)
+            match = seen.get(key)
+            if match is not None:
+                report.exact_count += 1
+                report._removed(category)
+                if len(report.exact) < report.max_examples:
+                    report.exact.append(
+                        (category, text, kept_categories[match], kept_texts[match])
+                    )
+                continue
+
+            if near:
+                hashes = shingles(normalized, shingle_size)
+                signature = hasher.signature(hashes)
+                keys = [
+                    hash(signature[band * rows : (band + 1) * rows])
+                    for band in range(bands)
+                ]
+                duplicate_of = similarity = None
+                checked = set()
+                for band, band_key in enumerate(keys):
+                    candidate = buckets[band].get(band_key)
+                    if candidate is None or candidate in checked:
+                        continue
+                    checked.add(candidate)
+                    other = shingles(
+                        normalize_joke(kept_texts[candidate]), shingle_size
+                    )
+                    similarity = jaccard(hashes, other)
+                    if similarity >= threshold:
+                        duplicate_of = candidate
+                        break
+                if duplicate_of is not None:
+                    report.near_count += 1
+                    report._removed(category)
+                    if len(report.near) < report.max_examples:
+                        report.near.append(
+                            (
+                                category,
+                                text,
+                                kept_categories[duplicate_of],
+                                kept_texts[duplicate_of],
+                                similarity,
+                            )
+                        )
+                    continue
+                position = len(kept_texts)
+                for band, band_key in enumerate(keys):
+                    buckets[band].setdefault(band_key, position)
+
+            seen[key] = len(kept_texts)
+            kept_texts.append(text)
+            kept_categories.append(category)
+            kept_in_category.append(text)
+
+    report.kept = len(kept_texts)
+    return result, report
+
+
+def main(argv=None):
+    """Deduplicate a JSON corpus file from the command line."""
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Remove exact and near-duplicate jokes from a JSON corpus "
+        "of {category: [joke, ...]}."
+    )
+    parser.add_argument("corpus", nargs="+", help="JSON corpus files, merged in order")
+    parser.add_argument("--output", "-o", help="Write the deduplicated corpus here")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument(
+        "--exact-only", action="store_true", help="Skip near-duplicate detection"
+    )
+    args = parser.parse_args(argv)
+
+    merged = {}
+    for path in args.corpus:
+        with open(path, encoding="utf-8") as f:
+            for category, texts in json.load(f).items():
+                merged.setdefault(category, []).extend(texts)
+
+    clean, report = dedupe_corpus(merged, args.threshold, near=not args.exact_only)
+    print(report.format())
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(clean, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Timed joke delivery, shared by the blocking and the asyncio APIs.
+
+A delivery is planned once as a list of :class:`DeliveryEvent` objects, each
+carrying the pause to observe before its line is shown. The synchronous
+``tell_joke_with_delay`` sleeps through those pauses, while :func:`deliver`
+awaits them, so one event loop can run thousands of deliveries at once.
+
+Splitting a joke into setup and punchline is done by :func:`split_joke`, which
+caches its results. The joke catalog precomputes the split of every built-in
+joke once, so deliveries of known jokes skip the text scan entirely.
+
+``asyncio`` is only imported when an asynchronous delivery starts, keeping it
+out of the command-line start-up path.
+"""
+
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+DeliveryEvent = namedtuple("DeliveryEvent", ["kind", "pause", "text"])
+DeliveryEvent.__doc__ = """
+One line of a joke delivery.
+
+Attributes
+----------
+kind : str
+    ``"joke"`` for a joke without a punchline break, otherwise ``"setup"``,
+    ``"punchline"`` or ``"response"``. Interactive sessions also use
+    ``"text"`` for their other output.
+pause : float
+    Seconds to wait before showing ``text``.
+text : str
+    The line to show.
+"""
+
+# Pause before the groan that follows a dad joke, in seconds
+RESPONSE_DELAY = 1
+
+# Number of ad-hoc jokes whose split is remembered by split_joke()
+SPLIT_CACHE_SIZE = 4096
+
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = frozenset(
+    ["mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "mt", "e.g", "i.e"]
+)
+
+# Words that are only abbreviations before a number, like "No. 5"
+NUMBER_ABBREVIATIONS = frozenset(["no"])
+
+# Characters that end a sentence, and those that may close one after it
+_TERMINATORS = ".!\u2026"
+_CLOSERS = "\"')\u201d"
+
+
+def _split(joke):
+    # Plain string scanning keeps the re module out of the start-up path
+    question = joke.find("?")
+    if question >= 0:
+        end = question + 1
+        while end < len(joke) and joke[end] in "?!":
+            end += 1
+        if joke[end:].strip():
+            # The punchline keeps its leading space, as it always has
+            return joke[:end], joke[end:]
+
+    i, n = 0, len(joke)
+    while i < n:
+        if joke[i] not in _TERMINATORS:
+            i += 1
+            continue
+        end = i + 1
+        while end < n and joke[end] in _TERMINATORS:
+            end += 1
+        mark = joke[i:end]
+        while end < n and joke[end] in _CLOSERS:
+            end += 1
+        if end < n and joke[end].isspace():
+            word = joke[:i].rsplit(None, 1)[-1:]
+            punchline = joke[end:].lstrip()
+            abbreviated = mark == "." and bool(word)
+            if abbreviated:
+                word = word[0].lower()
+                abbreviated = word in ABBREVIATIONS or (
+                    word in NUMBER_ABBREVIATIONS and punchline[:1].isdigit()
+                )
+            if punchline and not abbreviated:
+                return joke[:end], punchline
+        i = end
+    return joke, None
+
+
+@lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def split_joke(joke):
+    """
+    Split a joke into its setup and punchline.
+
+    The break goes after the first question mark (including a run like
+    "?!"), or otherwise after the first sentence. Sentences end with ".",
+    "!" or an ellipsis followed by whitespace; a period after a common
+    abbreviation such as "Mr." does not end a sentence. Nothing is split off
+    if the punchline would be empty.
+
+    Results are interned and cached for the most recent
+    :data:`SPLIT_CACHE_SIZE` jokes.
+
+    Parameters
+    ----------
+    joke : str
+        The joke text.
+
+    Returns
+    -------
+    tuple
+        ``(setup, punchline)``, or ``(joke, None)`` if the joke has no break.
+
+    Examples
+    --------
+    >>> split_joke("Why? Because.")
+    ('Why?', ' Because.')
+    >>> split_joke("Mr. Bean walked in. Nobody laughed.")
+    ('Mr. Bean walked in.', 'Nobody laughed.')
+    >>> split_joke("I was going to tell a time joke… but it's not the right time.")
+    ('I was going to tell a time joke…', "but it's not the right time.")
+    >>> split_joke("What's the point?")
+    ("What's the point?", None)
+    """
+    setup, punchline = _split(joke)
+    if punchline is None:
+        return joke, None
+    return sys.intern(setup), sys.intern(punchline)
+
+
+def plan_delivery(joke, delay=1.5, response=None, parts=None):
+    """
+    Split a joke into timed delivery events.
+
+    The joke is split at a natural break point (see :func:`split_joke`), and
+    the punchline is delayed by ``delay``.
+
+    Parameters
+    ----------
+    joke : str
+        The joke text to deliver.
+    delay : float, optional
+        The pause in seconds between setup and punchline. Default is 1.5.
+    response : str, optional
+        A reaction to deliver after the joke, such as a dad joke groan.
+    parts : tuple, optional
+        A precomputed ``(setup, punchline)`` split of ``joke``, as returned by
+        :func:`split_joke` or :meth:`joke_machine.catalog.JokeCatalog.split`.
+
+    Returns
+    -------
+    list of DeliveryEvent
+        The events in delivery order.
+
+    Examples
+    --------
+    >>> for event in plan_delivery("Why? Because.", 0.5, response="*groans*"):
+    ...     print(event)
+    DeliveryEvent(kind='setup', pause=0, text='Why?')
+    DeliveryEvent(kind='punchline', pause=0.5, text=' Because.')
+    DeliveryEvent(kind='response', pause=1, text='\\n*groans*')
+    """
+    setup, punchline = parts or split_joke(joke)
+    if punchline is None:
+        events = [DeliveryEvent("joke", 0, joke)]
+    else:
+        events = [
+            DeliveryEvent("setup", 0, setup),
+            DeliveryEvent("punchline", delay, punchline),
+        ]
+
+    if response is not None:
+        events.append(DeliveryEvent("response", RESPONSE_DELAY, f"\n{response}"))
+    return events
+
+
+async def deliver(joke, delay=1.5, response=None, parts=None):
+    """
+    Yield the events of a joke delivery at their scheduled times.
+
+    Pauses are awaited with ``asyncio.sleep``, so the event loop stays free
+    for other deliveries while a punchline is pending.
+
+    Parameters
+    ----------
+    joke, delay, response, parts
+        See :func:`plan_delivery`.
+
+    Yields
+    ------
+    DeliveryEvent
+        Each event, once its pause has passed.
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> async def show():
+    ...     async for event in deliver("Setup. Punchline.", delay=0):
+    ...         print(event.text)
+    >>> asyncio.run(show())
+    Setup.
+    Punchline.
+    """
+    import asyncio
+
+    for event in plan_delivery(joke, delay, response, parts):
+        if event.pause:
+            await asyncio.sleep(event.pause)
+        yield event
+
+
+async def tell(joke, delay=1.5, response=None, write=print):
+    """
+    Deliver a joke without blocking the event loop.
+
+    Parameters
+    ----------
+    joke, delay, response
+        See :func:`plan_delivery`.
+    write : callable, optional
+        Called with the text of each event. Default is ``print``.
+    """
+    async for event in deliver(joke, delay, response):
+        write(event.text)
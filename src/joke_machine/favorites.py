@@ -0,0 +1,500 @@
+"""
+Append-only storage for favorite jokes.
+
+Favorites are stored as JSON Lines, one ``{"joke", "saved_at"}`` object per
+line, so saving a joke appends a single line instead of rewriting the whole
+file. Files written by older versions as a single JSON array are migrated to
+the new layout the first time they are touched.
+
+Several processes may share one favorites file. Writers serialize on an
+advisory lock held on a ``.lock`` file next to it, and every rewrite goes
+through a temporary file that atomically replaces the original, so a crash
+never leaves a half-written favorites file behind. Within one process,
+concurrent savers are batched into a single locked write (group commit).
+"""
+
+import codecs
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Location of the favorites file, before user expansion
+FAVORITES_FILE = "~/.joke_machine_favorites.json"
+
+# File extensions selecting the SQLite favorites store
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+def open_favorites(path):
+    """
+    Open the favorites store matching the file extension of ``path``.
+
+    Parameters
+    ----------
+    path : str
+        Favorites location. Paths ending in ``.db``, ``.sqlite`` or
+        ``.sqlite3`` use the SQLite store, anything else the JSON Lines file.
+
+    Returns
+    -------
+    FavoritesLog or joke_machine.favorites_db.SQLiteFavorites
+        The favorites store.
+
+    Examples
+    --------
+    >>> type(open_favorites("favorites.json")).__name__
+    'FavoritesLog'
+    >>> type(open_favorites("favorites.db")).__name__
+    'SQLiteFavorites'
+    """
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        from joke_machine.favorites_db import SQLiteFavorites
+
+        return SQLiteFavorites(path)
+    return FavoritesLog(path)
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    Hold an advisory lock on ``path`` for the duration of the block.
+
+    Parameters
+    ----------
+    path : str
+        Lock file to use. It is created if missing and never removed.
+    shared : bool, optional
+        Take a shared (reader) lock instead of an exclusive one. Windows only
+        supports exclusive locks, so this is ignored there.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> with file_lock(os.path.join(tempfile.mkdtemp(), "demo.lock")):
+    ...     pass
+    """
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10 seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _Pending:
+    __slots__ = ("data", "done", "error")
+
+    def __init__(self, data):
+        self.data = data
+        self.done = False
+        self.error = None
+
+
+class _GroupCommit:
+    """
+    Batch concurrent writes to one file into a single locked write.
+
+    The first thread to reach the flush lock becomes the leader and writes
+    every line queued so far. Threads whose lines went out with an earlier
+    batch return as soon as they get the flush lock.
+    """
+
+    def __init__(self):
+        self._queue_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._queue = []
+
+    def commit(self, data, write):
+        pending = _Pending(data)
+        with self._queue_lock:
+            self._queue.append(pending)
+        with self._flush_lock:
+            if not pending.done:
+                with self._queue_lock:
+                    batch, self._queue = self._queue, []
+                try:
+                    write(b"".join(item.data for item in batch))
+                except BaseException as exc:
+                    for item in batch:
+                        item.error = exc
+                finally:
+                    for item in batch:
+                        item.done = True
+        if pending.error is not None:
+            raise pending.error
+
+
+_committers = {}
+_committers_lock = threading.Lock()
+
+
+def _committer(path):
+    with _committers_lock:
+        return _committers.setdefault(path, _GroupCommit())
+
+
+class FavoritesLog:
+    """
+    JSON Lines favorites file with O(1), concurrency-safe appends.
+
+    Parameters
+    ----------
+    path : str
+        Path of the favorites file. It does not need to exist yet.
+    fsync : bool, optional
+        Flush every write to stable storage before returning. Default is True.
+
+    Attributes
+    ----------
+    skipped : int
+        Number of unreadable lines skipped by the last full iteration.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> log = FavoritesLog(os.path.join(tempfile.mkdtemp(), "favorites.json"))
+    >>> log.append("A joke", "2023-01-01 12:00:00")
+    {'joke': 'A joke', 'saved_at': '2023-01-01 12:00:00'}
+    >>> [entry["joke"] for entry in log]
+    ['A joke']
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.fsync = fsync
+        self.skipped = 0
+
+    def exists(self):
+        """Return True if the favorites file exists."""
+        return os.path.exists(self.path)
+
+    def is_legacy(self):
+        """
+        Return True if the file still uses the old single JSON array layout.
+
+        Only the first non-blank bytes are read, so the check is O(1).
+        """
+        try:
+            with open(self.path, "rb") as f:
+                return _is_legacy(f)
+        except FileNotFoundError:
+            return False
+
+    def migrate(self):
+        """
+        Convert a legacy JSON array file to JSON Lines in place.
+
+        Returns
+        -------
+        bool
+            True if the file was migrated, False if it already used JSON Lines.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            If the legacy file cannot be parsed. It is left untouched.
+        """
+        with file_lock(self.lock_path):
+            return self._migrate_locked()
+
+    def _migrate_locked(self):
+        if not self.is_legacy():
+            return False
+        with open(self.path, "rb") as f:
+            tmp_path, _ = self._write_temp(iter_json_array(f))
+        self._replace(tmp_path)
+        return True
+
+    def append(self, joke, saved_at):
+        """
+        Append one favorite to the end of the file.
+
+        Parameters
+        ----------
+        joke : str
+            The joke text to save.
+        saved_at : str
+            Timestamp recorded with the joke.
+
+        Returns
+        -------
+        dict
+            The stored entry.
+        """
+        entry = {"joke": joke, "saved_at": saved_at}
+        self.extend([entry])
+        return entry
+
+    def extend(self, entries):
+        """
+        Append several favorites in one locked write.
+
+        Parameters
+        ----------
+        entries : iterable of dict
+            Entries with at least a ``"joke"`` key.
+        """
+        data = "".join(json.dumps(entry) + "\n" for entry in entries)
+        _committer(os.path.abspath(self.path)).commit(
+            data.encode("utf-8"), self._write_batch
+        )
+
+    def _write_batch(self, data):
+        with file_lock(self.lock_path):
+            if self.is_legacy():
+                try:
+                    self._migrate_locked()
+                except json.JSONDecodeError:
+                    # Keep the unreadable file for inspection and start afresh
+                    os.replace(self.path, self.path + ".corrupt")
+            with open(self.path, "a+b") as f:
+                # Start a new line if a previous write was cut short
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        data = b"\n" + data
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    def __iter__(self):
+        """
+        Yield favorites one line at a time, skipping unreadable lines.
+
+        Only the file size is read under the lock. Lines are then streamed up
+        to that size without blocking writers, so a save in progress is never
+        mistaken for a damaged entry. The number of skipped lines is available
+        as :attr:`skipped` once iteration has finished.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            If the file is a legacy JSON array that cannot be parsed.
+        """
+        self.skipped = 0
+        if not self.exists():
+            return
+        with file_lock(self.lock_path, shared=True):
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                return
+            size = os.fstat(f.fileno()).st_size
+        with f:
+            yield from self._read(f, size)
+
+    def _read(self, f, size):
+        if _is_legacy(f):
+            yield from iter_json_array(f)
+            return
+        for line in f:
+            size -= len(line)
+            if size < 0:
+                line = line[:size]
+            if line.strip():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if isinstance(entry, dict) and "joke" in entry:
+                    yield entry
+                else:
+                    self.skipped += 1
+            if size <= 0:
+                break
+
+    def query(self, limit=None, offset=0, since=None, grep=None):
+        """
+        Yield favorites in file order, filtered and paginated while streaming.
+
+        Parameters
+        ----------
+        limit : int, optional
+            Maximum number of favorites to yield.
+        offset : int, optional
+            Number of matching favorites to skip first.
+        since : str, optional
+            Only include favorites saved at or after this timestamp, e.g.
+            ``"2023-01-31"`` or ``"2023-01-31 12:00:00"``.
+        grep : str, optional
+            Only include favorites containing this text, ignoring case.
+
+        Yields
+        ------
+        dict
+            Entries with ``"joke"`` and ``"saved_at"`` keys.
+        """
+        needle = grep.casefold() if grep else None
+        matched = 0
+        for entry in self:
+            if since and entry.get("saved_at", "") < since:
+                continue
+            if needle and needle not in entry["joke"].casefold():
+                continue
+            matched += 1
+            if matched <= offset:
+                continue
+            if limit is not None and matched > offset + limit:
+                return
+            yield entry
+
+    def compact(self):
+        """
+        Rewrite the file keeping only readable entries.
+
+        The new contents are written to a temporary file that replaces the
+        original in one step, so an interrupted compaction loses nothing.
+
+        Returns
+        -------
+        tuple of int
+            Number of entries kept and number of unreadable lines dropped.
+        """
+        self.skipped = 0
+        with file_lock(self.lock_path):
+            with open(self.path, "rb") as f:
+                tmp_path, kept = self._write_temp(
+                    self._read(f, os.fstat(f.fileno()).st_size)
+                )
+            self._replace(tmp_path)
+        return kept, self.skipped
+
+    def _rewrite_locked(self, entries):
+        tmp_path, count = self._write_temp(entries)
+        self._replace(tmp_path)
+        return count
+
+    def _write_temp(self, entries):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        count = 0
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for count, entry in enumerate(entries, 1):
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path, count
+
+    def _replace(self, tmp_path):
+        try:
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _is_legacy(f):
+    """Check for the legacy JSON array layout and rewind ``f``."""
+    legacy = f.read(64).lstrip().startswith(b"[")
+    f.seek(0)
+    return legacy
+
+
+def iter_json_array(f, chunk_size=64 * 1024):
+    """
+    Yield the items of a JSON array read incrementally from a binary file.
+
+    Only one chunk and the item being decoded are held in memory, so legacy
+    favorites files of any size can be listed and migrated in constant memory.
+
+    Parameters
+    ----------
+    f : file-like
+        Binary file positioned at the start of the array.
+    chunk_size : int, optional
+        Number of bytes to read at a time.
+
+    Yields
+    ------
+    object
+        The decoded array items.
+
+    Raises
+    ------
+    json.JSONDecodeError
+        If the file does not contain a well-formed JSON array.
+
+    Examples
+    --------
+    >>> import io
+    >>> list(iter_json_array(io.BytesIO(b' [{"a": 1}, 2, "x"] '), chunk_size=3))
+    [{'a': 1}, 2, 'x']
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    expect, first = "[", True
+
+    def refill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise json.JSONDecodeError("Unterminated array", buf, pos)
+            refill()
+            continue
+
+        char = buf[pos]
+        if expect == "[":
+            if char != "[":
+                raise json.JSONDecodeError("Expecting '['", buf, pos)
+            pos += 1
+            expect = "item"
+        elif expect == "item":
+            if char == "]" and first:
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()
+                continue
+            # A value touching the end of the buffer may continue in the next chunk
+            if end == len(buf) and not eof:
+                refill()
+                continue
+            yield item
+            pos, expect, first = end, "separator", False
+        else:
+            if char == "]":
+                return
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            expect = "item"
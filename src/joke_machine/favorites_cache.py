@@ -0,0 +1,335 @@
+"""
+In-process favorites cache with write-behind saving.
+
+A long-running process (``--serve``, ``--listen``, ``--interactive``) reads
+the same favorites file over and over: to list it, and to weight popular
+jokes. :class:`CachedFavorites` reads the file once and answers later
+listings from memory. Saves land in memory first and reach the disk in
+batches, as often as the chosen durability asks for:
+
+- ``"always"``: every save is written before it returns, as without a cache;
+- ``"250ms"``, ``"2s"`` or a bare number of milliseconds: a background
+  thread writes whatever is pending at that interval;
+- ``"exit"``: pending saves are written when the process exits.
+
+Saves still pending are always written at exit, and :meth:`~CachedFavorites.flush`
+writes them at any time. A crash loses at most the saves of the last
+interval.
+
+Other processes may keep saving to the same file. Before answering from
+memory, the cache compares the file's modification time and size (and
+those of an SQLite WAL file) with the ones it last saw, and reloads the
+file if they changed.
+"""
+
+import atexit
+import logging
+import os
+import threading
+
+from joke_machine.favorites import SQLITE_SUFFIXES, open_favorites
+
+logger = logging.getLogger(__name__)
+
+# Durability used when --favorites-cache is given without a value
+DEFAULT_DURABILITY = "100ms"
+
+
+def parse_durability(spec):
+    """
+    Return the flush interval described by a durability setting.
+
+    Parameters
+    ----------
+    spec : str
+        "always", "exit", a duration such as "250ms" or "2s", or a number of
+        milliseconds.
+
+    Returns
+    -------
+    float or None
+        Seconds between flushes, 0 to flush on every save, or None to flush
+        only on exit.
+
+    Raises
+    ------
+    ValueError
+        If ``spec`` is not a durability setting.
+
+    Examples
+    --------
+    >>> parse_durability("250ms"), parse_durability("2s"), parse_durability("50")
+    (0.25, 2.0, 0.05)
+    >>> parse_durability("always"), parse_durability("exit") is None
+    (0, True)
+    """
+    text = spec.strip().lower()
+    if text == "always":
+        return 0
+    if text == "exit":
+        return None
+    scale = 0.001
+    if text.endswith("ms"):
+        text = text[:-2]
+    elif text.endswith("s"):
+        text, scale = text[:-1], 1.0
+    try:
+        seconds = float(text) * scale
+    except ValueError:
+        raise ValueError(
+            f"expected 'always', 'exit' or a duration like '250ms', got {spec!r}"
+        ) from None
+    if seconds < 0:
+        raise ValueError(f"flush interval must not be negative, got {spec!r}")
+    return seconds
+
+
+class CachedFavorites:
+    """
+    A favorites store kept in memory, written back in batches.
+
+    It has the interface of the store at ``path`` (see
+    :func:`~joke_machine.favorites.open_favorites`), so the app and the
+    servers can use it in its place. The cache is safe to share between
+    threads.
+
+    Parameters
+    ----------
+    path : str
+        Favorites file or SQLite database.
+    durability : str, optional
+        When saves reach the disk, see :func:`parse_durability`. Default is
+        "100ms".
+
+    Attributes
+    ----------
+    interval : float or None
+        Seconds between flushes, 0 for every save, None for exit only.
+    skipped : int
+        Unreadable entries skipped when the file was last loaded.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "favorites.json")
+    >>> cache = CachedFavorites(path, durability="exit")
+    >>> cache.append("A joke", "2023-01-01 12:00:00")
+    {'joke': 'A joke', 'saved_at': '2023-01-01 12:00:00'}
+    >>> [entry["joke"] for entry in cache], os.path.exists(path)
+    (['A joke'], False)
+    >>> cache.flush()
+    1
+    >>> [entry["joke"] for entry in open_favorites(path)]
+    ['A joke']
+    >>> cache.close()
+    """
+
+    def __init__(self, path, durability=DEFAULT_DURABILITY):
+        self.path = path
+        self.interval = parse_durability(durability)
+        # SQLite stores ignore duplicates, so the cache must as well
+        self.unique = path.lower().endswith(SQLITE_SUFFIXES)
+        self.skipped = 0
+        self._entries = None  # loaded entries followed by pending ones
+        self._hashes = set()
+        self._pending = []
+        self._inflight = []  # being written by flush()
+        self._signature = None
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        if self.interval:
+            self._thread = threading.Thread(
+                target=self._flush_periodically, name="favorites-flush", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _stat(self):
+        signature = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self):
+        # Called with the lock held; keeps the saves not yet written
+        signature = self._stat()
+        if self._entries is not None and signature == self._signature:
+            return self._entries
+        store = open_favorites(self.path)
+        try:
+            entries = list(store) if store.exists() else []
+            self.skipped = store.skipped
+        finally:
+            _close(store)
+        self._hashes = set()
+        if self.unique:
+            self._hashes = {_hash(entry["joke"]) for entry in entries}
+        for entry in self._inflight + self._pending:
+            if not self.unique or _hash(entry["joke"]) not in self._hashes:
+                self._hashes.add(_hash(entry["joke"]))
+                entries.append(entry)
+        self._entries = entries
+        self._signature = signature
+        return entries
+
+    def exists(self):
+        """Return True if there are favorites on disk or pending."""
+        with self._lock:
+            if self._pending:
+                return True
+        # Like the stores, without opening one (and an SQLite connection)
+        return os.path.exists(self.path)
+
+    def append(self, joke, saved_at):
+        """
+        Save one favorite, writing it according to the durability.
+
+        Returns
+        -------
+        dict or None
+            The stored entry, or None if the store ignores the joke as a
+            duplicate.
+        """
+        entry = {"joke": joke, "saved_at": saved_at}
+        with self._lock:
+            entries = self._load()
+            if self.unique:
+                key = _hash(joke)
+                if key in self._hashes:
+                    return None
+                self._hashes.add(key)
+            entries.append(entry)
+            self._pending.append(entry)
+        if self.interval == 0:
+            self.flush()
+        return entry
+
+    def extend(self, entries):
+        """Save several favorites, see :meth:`append`."""
+        added = 0
+        for entry in entries:
+            if self.append(entry["joke"], entry.get("saved_at", "")) is not None:
+                added += 1
+        return added
+
+    def flush(self):
+        """
+        Write the pending saves to disk in one batch.
+
+        Returns
+        -------
+        int
+            Number of favorites written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._inflight = batch
+                entries = self._entries
+                # Another process's change before ours still needs a reload
+                unchanged = self._stat() == self._signature
+            if not batch:
+                return 0
+            try:
+                store = open_favorites(self.path)
+                try:
+                    store.extend(batch)
+                finally:
+                    _close(store)
+            except BaseException:
+                with self._lock:
+                    self._inflight = []
+                    self._pending[:0] = batch  # retry with the next flush
+                raise
+            with self._lock:
+                self._inflight = []
+                if unchanged and self._entries is entries:
+                    self._signature = self._stat()
+                else:
+                    # Reloaded while writing: read the finished file again
+                    self._entries = None
+        return len(batch)
+
+    def _flush_periodically(self):
+        while not self._wake.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                # Kept pending and retried at the next interval, e.g. while
+                # another process holds the database lock
+                logger.warning(
+                    "Could not write favorites to %s", self.path, exc_info=True
+                )
+
+    def query(self, limit=None, offset=0, since=None, grep=None):
+        """
+        Return an iterator over the favorites in save order.
+
+        Parameters are those of
+        :meth:`joke_machine.favorites.FavoritesLog.query`; ``grep`` matches a
+        case-insensitive substring.
+        """
+        needle = grep.casefold() if grep else None
+        stop = None if limit is None else offset + limit
+        with self._lock:
+            entries = self._load()
+            if since:
+                entries = [e for e in entries if e.get("saved_at", "") >= since]
+            if needle:
+                entries = [e for e in entries if needle in e["joke"].casefold()]
+            # A copy, so saves made while the caller iterates do not show up
+            return iter(entries[offset:stop])
+
+    def __iter__(self):
+        return self.query()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def compact(self):
+        """Write pending saves, then compact the store on disk."""
+        self.flush()
+        store = open_favorites(self.path)
+        try:
+            return store.compact()
+        finally:
+            _close(store)
+            with self._lock:
+                self._entries = None
+
+    def close(self):
+        """Stop the flush thread and write the pending saves."""
+        if not self._closed:
+            self._closed = True
+            atexit.unregister(self.close)
+            self._wake.set()
+            if self._thread is not None:
+                self._thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _hash(joke):
+    from joke_machine.favorites_db import joke_hash
+
+    return joke_hash(joke)
+
+
+def _close(store):
+    close = getattr(store, "close", None)
+    if close is not None:
+        close()
@@ -0,0 +1,216 @@
+"""
+Load-test harness for the HTTP service.
+
+Runs many keep-alive client connections against ``joke-machine --serve`` and
+reports throughput and latency percentiles. Without ``--url`` the harness
+starts a server on a free local port in the same process::
+
+    python -m joke_machine.loadtest --requests 20000 --connections 64
+    python -m joke_machine.loadtest --url http://127.0.0.1:8000/fact --pipeline 8
+"""
+
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from joke_machine.server import JokeServer
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile of sorted values (nearest rank).
+
+    Examples
+    --------
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    >>> percentile([1, 2, 3, 4], 99)
+    4
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head[9:12])
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, request, count, pipeline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while count > 0:
+            batch = min(pipeline, count)
+            count -= batch
+            start = time.perf_counter()
+            writer.write(request * batch)
+            await writer.drain()
+            for _ in range(batch):
+                status = await _read_response(reader)
+                latencies.append(time.perf_counter() - start)
+                if status >= 400:
+                    errors.append(status)
+    finally:
+        writer.close()
+
+
+async def _load_test(host, port, path, requests, connections, pipeline):
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("ascii")
+    connections = max(1, min(connections, requests))
+    share, extra = divmod(requests, connections)
+    latencies, errors = [], []
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _client(
+                host,
+                port,
+                request,
+                share + (i < extra),
+                pipeline,
+                latencies,
+                errors,
+            )
+            for i in range(connections)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def run_load_test(
+    host=None, port=None, path="/joke", requests=10_000, connections=50, pipeline=1
+):
+    """
+    Send requests to the HTTP service and measure latency and throughput.
+
+    Parameters
+    ----------
+    host, port : str and int, optional
+        The server to test. If omitted, a server is started in-process on a
+        free local port for the duration of the test.
+    path : str, optional
+        The endpoint to request. Default is "/joke".
+    requests : int, optional
+        Total number of requests to send. Default is 10000.
+    connections : int, optional
+        Number of concurrent keep-alive connections. Default is 50.
+    pipeline : int, optional
+        Requests written back to back on a connection before reading the
+        responses. Default is 1 (no pipelining).
+
+    Returns
+    -------
+    dict
+        ``requests``, ``errors``, ``seconds``, ``rps``, ``p50_ms``,
+        ``p99_ms`` and ``max_ms``.
+
+    Raises
+    ------
+    ValueError
+        If ``connections`` or ``pipeline`` is less than 1.
+
+    Examples
+    --------
+    >>> result = run_load_test(path="/health", requests=100, connections=4)
+    >>> result["requests"], result["errors"]
+    (100, 0)
+    """
+    if connections < 1:
+        raise ValueError(f"connections must be at least 1, got {connections}")
+    if pipeline < 1:
+        raise ValueError(f"pipeline must be at least 1, got {pipeline}")
+
+    async def run():
+        if host is not None:
+            return await _load_test(host, port, path, requests, connections, pipeline)
+        server = JokeServer(port=0)
+        await server.start()
+        try:
+            return await _load_test(
+                *server.address, path, requests, connections, pipeline
+            )
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def format_report(result):
+    """
+    Format a load-test result for the terminal.
+
+    Examples
+    --------
+    >>> print(format_report({"requests": 10, "errors": 0, "seconds": 0.5,
+    ...     "rps": 20.0, "p50_ms": 1.0, "p99_ms": 2.5, "max_ms": 3.0}))
+    requests:   10 (0 errors) in 0.50 s
+    throughput: 20 req/s
+    latency:    p50 1.00 ms, p99 2.50 ms, max 3.00 ms
+    """
+    return (
+        f"requests:   {result['requests']} ({result['errors']} errors)"
+        f" in {result['seconds']:.2f} s\n"
+        f"throughput: {result['rps']:.0f} req/s\n"
+        f"latency:    p50 {result['p50_ms']:.2f} ms,"
+        f" p99 {result['p99_ms']:.2f} ms, max {result['max_ms']:.2f} ms"
+    )
+
+
+def main(argv=None):
+    """Run the load test from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Load-test the JokeMachine HTTP service."
+    )
+    parser.add_argument(
+        "--url",
+        help="Endpoint to test, e.g. http://127.0.0.1:8000/joke "
+        "(default: an in-process server)",
+    )
+    parser.add_argument("--path", default="/joke", help="Endpoint path to request")
+    parser.add_argument("--requests", "-n", type=int, default=10_000)
+    parser.add_argument("--connections", "-c", type=int, default=50)
+    parser.add_argument("--pipeline", "-p", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    host = port = None
+    path = args.path
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+        path = url.path or path
+        if url.query:
+            path = f"{path}?{url.query}"
+
+    try:
+        result = run_load_test(
+            host, port, path, args.requests, args.connections, args.pipeline
+        )
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(format_report(result))
+
+
+if __name__ == "__main__":
+    main()
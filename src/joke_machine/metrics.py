@@ -0,0 +1,220 @@
+"""
+Counters and latency histograms for drawing, telling and saving jokes.
+
+Collection is off unless a :class:`Metrics` is installed with
+:func:`joke_machine.app.use_metrics` (``joke-machine --stats``). While it is
+off, this module is not even imported and drawing a joke only pays for one
+``is not None`` check.
+
+Drawing a joke takes a few hundred nanoseconds, so draws are only counted,
+per requested category, with one ``next()`` on an ``itertools.count``. That
+runs in C and is atomic, so server threads can count without a lock. Counts
+are read back with ``next()`` as well, minus the earlier reads. Telling jokes
+and saving or listing favorites take milliseconds and are also timed, into
+fixed-bucket histograms.
+
+:meth:`Metrics.export` renders everything in the Prometheus text format.
+"""
+
+import itertools
+import threading
+from bisect import bisect_left
+from time import perf_counter_ns
+
+# Prefix of every exported metric name
+PREFIX = "joke_machine_"
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (
+    1e-6, 2.5e-6, 1e-5, 2.5e-5, 1e-4, 2.5e-4,
+    1e-3, 2.5e-3, 0.01, 0.025, 0.1, 0.25, 1.0, 2.5, 10.0,
+)  # fmt: skip
+
+# Distinct category labels counted separately; the rest share OTHER_LABEL
+MAX_LABELS = 1000
+OTHER_LABEL = "_other"
+
+# Label of draws that did not ask for a category
+ANY_LABEL = "any"
+
+# name -> (type, help) of every metric, in export order
+METRICS = {
+    "draws_total": ("counter", "Jokes drawn, by requested category."),
+    "deliveries_total": ("counter", "Jokes told."),
+    "delivery_seconds": ("histogram", "Time to tell a joke, pauses included."),
+    "favorites_saved_total": ("counter", "Jokes saved as favorites."),
+    "favorites_duplicate_total": (
+        "counter",
+        "Favorites not saved because the store already held them.",
+    ),
+    "favorite_save_seconds": ("histogram", "Time to save a favorite."),
+    "favorites_listed_total": ("counter", "Favorites printed by list_favorites."),
+    "favorites_list_seconds": ("histogram", "Time to list favorites."),
+}
+
+
+class Histogram:
+    """
+    Observations counted in fixed buckets, plus their count and sum.
+
+    Parameters
+    ----------
+    bounds : sequence of float, optional
+        Increasing upper bounds of the buckets. A last bucket without an
+        upper bound is added. Default is ``LATENCY_BUCKETS``.
+
+    Examples
+    --------
+    >>> histogram = Histogram([1.0, 10.0])
+    >>> for value in (0.5, 1.0, 3.0, 50.0):
+    ...     histogram.observe(value)
+    >>> histogram.counts, histogram.count, histogram.total
+    ([2, 1, 1], 4, 54.5)
+    >>> histogram.cumulative()
+    [(1.0, 2), (10.0, 3), (inf, 4)]
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        """Add one observation."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def cumulative(self):
+        """Return ``(upper bound, observations at or below it)`` per bucket."""
+        return list(
+            zip(self.bounds + [float("inf")], itertools.accumulate(self.counts))
+        )
+
+
+class _DrawCounts(dict):
+    """Category -> ``itertools.count``, created on first use and capped."""
+
+    def __missing__(self, category):
+        if len(self) >= MAX_LABELS:
+            # Keep unknown categories from growing the table without bound
+            category = OTHER_LABEL
+        # Atomic, so threads drawing a new category share one counter
+        return self.setdefault(category, itertools.count())
+
+
+class Metrics:
+    """
+    Metrics of one process, see the module docstring.
+
+    Notes
+    -----
+    Draw counts are exact from any thread. Other counters and histograms
+    are updated without a lock; updates racing in from server threads may
+    rarely lose one observation.
+
+    Examples
+    --------
+    >>> metrics = Metrics()
+    >>> next(metrics.draws["dad"])
+    0
+    >>> metrics.count("draws_total", 2, "dad")
+    >>> metrics.observe("delivery_seconds", 0.2)
+    >>> metrics.draw_counts()
+    {'dad': 3}
+    >>> print(metrics.export())  # doctest: +ELLIPSIS
+    # HELP joke_machine_draws_total Jokes drawn, by requested category.
+    # TYPE joke_machine_draws_total counter
+    joke_machine_draws_total{category="dad"} 3
+    ...
+    joke_machine_delivery_seconds_bucket{le="0.25"} 1
+    ...
+    joke_machine_delivery_seconds_count 1
+    ...
+    """
+
+    def __init__(self):
+        # Category -> count of single draws, advanced by app.get_joke()
+        self.draws = _DrawCounts()
+        # Category -> times draw_counts() advanced its counter to read it
+        self._reads = {}
+        self._reads_lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, amount=1, category=None):
+        """Add ``amount`` to a counter, per category for ``draws_total``."""
+        key = (name, category)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds):
+        """Record a latency in a histogram."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def since(self, name, start):
+        """Record the time since ``start``, a ``perf_counter_ns()`` reading."""
+        self.observe(name, (perf_counter_ns() - start) / 1e9)
+
+    def draw_counts(self):
+        """
+        Return the number of jokes drawn per requested category.
+
+        Draws without a category are counted under None.
+        """
+        counts = {}
+        with self._reads_lock:
+            for category, counter in list(self.draws.items()):
+                reads = self._reads.get(category, 0)
+                counts[category] = next(counter) - reads
+                self._reads[category] = reads + 1
+        for (name, category), amount in list(self.counters.items()):
+            if name == "draws_total":
+                counts[category] = counts.get(category, 0) + amount
+        return {category: n for category, n in counts.items() if n}
+
+    def export(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            full = PREFIX + name
+            if kind == "histogram":
+                histogram = self.histograms.get(name) or Histogram()
+                samples = [
+                    (f'{full}_bucket{{le="{_number(bound)}"}}', count)
+                    for bound, count in histogram.cumulative()
+                ]
+                samples.append((f"{full}_sum", _number(histogram.total)))
+                samples.append((f"{full}_count", histogram.count))
+            elif name == "draws_total":
+                samples = [
+                    (f'{full}{{category="{_label(category)}"}}', count)
+                    for category, count in sorted(
+                        self.draw_counts().items(), key=lambda item: _label(item[0])
+                    )
+                ]
+            else:
+                samples = [(full, self.counters.get((name, None), 0))]
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            lines.extend(f"{sample} {value}" for sample, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    """Format a float the way Prometheus writes them."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _label(category):
+    """Escape a category for use as a label value."""
+    if category is None:
+        return ANY_LABEL
+    return str(category).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,126 @@
+"""
+Buffered terminal output with optional paging.
+
+Printing long listings with one ``print`` call per line costs a write call
+per line when stdout is a terminal. :class:`OutputBuffer` collects text and
+writes it in large chunks instead, and can send it through a pager such as
+``less`` when stdout is interactive.
+"""
+
+import os
+import shlex
+import subprocess
+import sys
+
+# Flush once this many characters are buffered
+BUFFER_SIZE = 64 * 1024
+
+
+def default_pager():
+    """
+    Return the pager command to use, from $PAGER or a platform default.
+
+    Examples
+    --------
+    >>> isinstance(default_pager(), list)
+    True
+    """
+    pager = os.environ.get("PAGER")
+    if pager:
+        return shlex.split(pager)
+    if os.name == "nt":
+        return ["more"]
+    # Quit if one screen is enough, keep colors, don't clear the screen
+    return ["less", "-FRX"]
+
+
+class OutputBuffer:
+    """
+    Write text to stdout or a pager in large chunks.
+
+    The first write goes out immediately so output starts without delay.
+    After that, text is buffered until :data:`BUFFER_SIZE` characters have
+    accumulated. The pager, if any, is only started on the first write, so
+    short messages printed before it stay on the terminal. Once the reader
+    quits the pager, :attr:`broken` is set so callers can stop producing.
+
+    Parameters
+    ----------
+    pager : bool, optional
+        Send output through a pager. If None (the default), a pager is used
+        when stdout is a terminal.
+    stream : file-like, optional
+        Stream to write to when not paging. Defaults to ``sys.stdout`` at the
+        time of the first write.
+
+    Examples
+    --------
+    >>> with OutputBuffer(pager=False) as out:
+    ...     out.write("first line\\n")
+    ...     out.write("second line\\n")
+    first line
+    second line
+    """
+
+    def __init__(self, pager=None, stream=None):
+        self.pager = pager
+        self._stream = stream
+        self._process = None
+        self._chunks = []
+        self._size = 0
+        self._started = False
+        self.broken = False
+
+    def _open(self):
+        stream = self._stream or sys.stdout
+        use_pager = self.pager
+        if use_pager is None:
+            use_pager = stream.isatty() and sys.stdin.isatty()
+        if use_pager:
+            try:
+                self._process = subprocess.Popen(
+                    default_pager(), stdin=subprocess.PIPE, text=True
+                )
+                stream = self._process.stdin
+            except OSError:  # pager not installed
+                self._process = None
+        self._stream = stream
+        self._started = True
+
+    def write(self, text):
+        """Queue ``text`` for output, flushing when the buffer is full."""
+        self._chunks.append(text)
+        self._size += len(text)
+        if not self._started or self._size >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered text."""
+        if not self._started:
+            self._open()
+        if self._chunks:
+            try:
+                self._stream.write("".join(self._chunks))
+                self._stream.flush()
+            except OSError:  # pager closed early (EPIPE, or EINVAL on Windows)
+                self.broken = True
+            self._chunks = []
+            self._size = 0
+
+    def close(self):
+        """Flush remaining text and wait for the pager to exit."""
+        if self._chunks:
+            self.flush()
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,115 @@
+"""
+Profiling for ``joke-machine --profile`` and the interactive ``profile`` command.
+
+:class:`Profiler` wraps :mod:`cProfile` with a clock that stops while the
+program waits on purpose: the dramatic pauses before punchlines, and the
+interactive prompt waiting for the user. Without that, a profile of a few
+jokes is all ``time.sleep`` and ``input``, and the code worth optimizing
+does not show up in the summary at all.
+
+Waits go through :meth:`Profiler.paused`, which
+:func:`joke_machine.app.use_profiler` arranges for the CLI's pauses and
+prompts. Everything else, disk and terminal I/O included, is profiled in
+wall-clock time.
+"""
+
+import cProfile
+import io
+import time
+from contextlib import contextmanager
+
+# Profile written by --profile when no file is given
+PROFILE_FILE = "joke-machine.prof"
+
+# Functions shown in the summary
+TOP = 20
+
+
+class Profiler:
+    """
+    A :class:`cProfile.Profile` whose clock skips deliberate waits.
+
+    Examples
+    --------
+    >>> profiler = Profiler()
+    >>> profiler.enable()
+    >>> profiler.sleep(0.05)
+    >>> profiler.disable()
+    >>> profiler.waited >= 0.05
+    True
+    >>> print(profiler.summary(3))  # doctest: +ELLIPSIS
+    Profile of ... function calls, excluding 0.05... s of pauses and prompts
+    ...
+    """
+
+    def __init__(self):
+        self.waited = 0.0
+        self.enabled = False
+        self._paused_at = None
+        self._profile = cProfile.Profile(self._clock)
+
+    def _clock(self):
+        # Frozen during a pause, so the waiting call itself gets no time
+        if self._paused_at is not None:
+            return self._paused_at - self.waited
+        return time.perf_counter() - self.waited
+
+    def enable(self):
+        """Start or resume collecting."""
+        self._profile.enable()
+        self.enabled = True
+
+    def disable(self):
+        """Stop collecting; the data so far is kept."""
+        self._profile.disable()
+        self.enabled = False
+
+    @contextmanager
+    def paused(self):
+        """Keep the time spent in the ``with`` block off the profile."""
+        if self._paused_at is not None:
+            yield  # already paused
+            return
+        self._paused_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.waited += time.perf_counter() - self._paused_at
+            self._paused_at = None
+
+    def sleep(self, seconds):
+        """Sleep without the sleep showing up in the profile."""
+        with self.paused():
+            time.sleep(seconds)
+
+    def stats(self, stream=None):
+        """Return the collected data as :class:`pstats.Stats`."""
+        import pstats
+
+        return pstats.Stats(self._profile, stream=stream or io.StringIO())
+
+    def dump(self, path):
+        """Write the profile to ``path`` for ``pstats`` or ``snakeviz``."""
+        self._profile.dump_stats(path)
+
+    def summary(self, limit=TOP, sort="cumulative"):
+        """
+        Return the ``limit`` most expensive functions as text.
+
+        Parameters
+        ----------
+        limit : int, optional
+            Number of functions to list. Default is 20.
+        sort : str, optional
+            A :meth:`pstats.Stats.sort_stats` key. Default is "cumulative".
+        """
+        out = io.StringIO()
+        stats = self.stats(out).strip_dirs().sort_stats(sort)
+        stats.print_stats(limit)
+        # Keep the table, not pstats' own header lines
+        table = out.getvalue().split("\n\n", 2)[-1].strip("\n")
+        head = (
+            f"Profile of {stats.total_calls} function calls, excluding "
+            f"{self.waited:.2f} s of pauses and prompts"
+        )
+        return f"{head}\n\n{table}\n"
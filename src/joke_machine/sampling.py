@@ -0,0 +1,372 @@
+"""
+No-repeat joke sampling with per-session memory.
+
+:class:`NoRepeatSampler` remembers the jokes recently served to each session
+(a user, a chat, a CLI profile) and redraws until it finds one outside the
+session's window. Jokes are remembered by a 32-bit fingerprint of their text,
+so the memory works the same for the built-in jokes, a packed corpus and
+jokes added later.
+
+Memory is bounded twice: each session keeps at most ``window`` fingerprints,
+and only the ``max_sessions`` most recently active sessions are kept, so
+millions of distinct users cost no more than the busiest ``max_sessions``.
+
+Session state can be saved to a compact binary file and loaded again, which
+is how ``joke-machine --session NAME`` avoids repeats across invocations.
+
+:class:`WeightedSampler` draws positions in proportion to their weights, with
+O(log n) draws and O(log n) weight updates, so weights can follow favorites
+as they are saved.
+"""
+
+import os
+import random
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections import OrderedDict
+
+# Window used when none is given
+DEFAULT_WINDOW = 50
+
+# Sessions kept in memory, and in a state file
+DEFAULT_MAX_SESSIONS = 10_000
+
+# Default location of the CLI session state
+SESSIONS_FILE = "~/.joke_machine_sessions"
+
+_MAGIC = b"JKSESS1\n"
+_RECORD = struct.Struct("<HI")
+
+
+def fingerprint(joke):
+    """
+    Return the 32-bit fingerprint used to remember a joke.
+
+    Examples
+    --------
+    >>> fingerprint("Why? Because.") == fingerprint("Why? Because.")
+    True
+    """
+    return zlib.crc32(joke.encode("utf-8"))
+
+
+class RecentSet:
+    """
+    The last ``window`` fingerprints served to one session.
+
+    Fingerprints are kept in a ring buffer for eviction and in a dict mapping
+    each one to when it was last served, so "was this served within the last
+    n draws?" is O(1) for any ``n`` up to ``window``.
+
+    Parameters
+    ----------
+    window : int
+        Number of draws to remember.
+    keys : iterable of int, optional
+        Fingerprints to start with, oldest first.
+
+    Examples
+    --------
+    >>> recent = RecentSet(2)
+    >>> for key in (1, 2, 3):
+    ...     recent.add(key)
+    >>> recent.seen_within(1), recent.seen_within(3), recent.seen_within(2, 1)
+    (False, True, False)
+    """
+
+    __slots__ = ("window", "_ring", "_served", "_count")
+
+    def __init__(self, window, keys=()):
+        self.window = window
+        self._ring = array("I")
+        self._served = {}
+        self._count = 0
+        for key in keys:
+            self.add(key)
+
+    def add(self, key):
+        """Record that ``key`` was just served."""
+        if self.window <= 0:
+            return
+        slot = self._count % self.window
+        if len(self._ring) < self.window:
+            self._ring.append(key)
+        else:
+            old = self._ring[slot]
+            # Only forget the old key if it was not served again since
+            if self._served.get(old) == self._count - self.window:
+                del self._served[old]
+            self._ring[slot] = key
+        self._served[key] = self._count
+        self._count += 1
+
+    def seen_within(self, key, draws=None):
+        """Return True if ``key`` was served in the last ``draws`` draws."""
+        served = self._served.get(key)
+        if served is None:
+            return False
+        limit = self.window if draws is None else min(draws, self.window)
+        return self._count - served <= limit
+
+    def keys(self):
+        """Return the remembered fingerprints, oldest first."""
+        if len(self._ring) < self.window:
+            return array("I", self._ring)
+        slot = self._count % self.window
+        return self._ring[slot:] + self._ring[:slot]
+
+    def __len__(self):
+        return len(self._ring)
+
+
+class NoRepeatSampler:
+    """
+    Draw jokes without repeats within a per-session window.
+
+    Parameters
+    ----------
+    window : int, optional
+        Number of recent draws a session never repeats. Default is 50.
+    max_sessions : int, optional
+        Sessions kept in memory; the least recently active one is dropped
+        when a new one starts. Default is 10000.
+
+    Examples
+    --------
+    >>> import random
+    >>> rng = random.Random(0)
+    >>> jokes = ["a", "b", "c"]
+    >>> sampler = NoRepeatSampler(window=2)
+    >>> draws = [sampler.draw("alice", lambda: rng.choice(jokes), 3) for _ in range(6)]
+    >>> all(len(set(draws[i : i + 3])) == 3 for i in range(4))
+    True
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.window = window
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def recent(self, session):
+        """Return the :class:`RecentSet` of a session, creating it if needed."""
+        recent = self._sessions.get(session)
+        if recent is None:
+            recent = self._sessions[session] = RecentSet(self.window)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session)
+        return recent
+
+    def draw(self, session, draw, population):
+        """
+        Draw a joke the session has not seen within its window.
+
+        Parameters
+        ----------
+        session : hashable
+            The user or session to draw for.
+        draw : callable
+            Returns a random joke, e.g. ``lambda: get_joke(category)``.
+        population : int
+            Number of jokes ``draw`` chooses from. The window is capped at
+            ``population - 1``, so small categories still cycle.
+
+        Returns
+        -------
+        str
+            The joke.
+        """
+        recent = self.recent(session)
+        limit = min(self.window, population - 1)
+        # Rejection sampling needs population / (population - limit) draws on
+        # average; the cap only matters if ``draw`` cannot reach every joke
+        for _ in range(16 + 4 * max(population, 0)):
+            joke = draw()
+            key = fingerprint(joke)
+            if limit <= 0 or not recent.seen_within(key, limit):
+                break
+        recent.add(key)
+        return joke
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session):
+        return session in self._sessions
+
+    def save(self, path):
+        """
+        Write every session to a compact binary file, atomically.
+
+        Each session takes its name plus 4 bytes per remembered joke, stored
+        little-endian.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_MAGIC)
+                for session, recent in self._sessions.items():
+                    name = str(session).encode("utf-8")[:0xFFFF]
+                    keys = recent.keys()
+                    if sys.byteorder == "big":
+                        keys.byteswap()
+                    f.write(_RECORD.pack(len(name), len(keys)))
+                    f.write(name)
+                    f.write(keys.tobytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def load(self, path):
+        """
+        Load sessions saved by :meth:`save`.
+
+        Missing or unreadable files are ignored, so a damaged state file
+        only costs the repeat history.
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if not data.startswith(_MAGIC):
+            return
+        position = len(_MAGIC)
+        while position + _RECORD.size <= len(data):
+            name_size, count = _RECORD.unpack_from(data, position)
+            position += _RECORD.size
+            name = data[position : position + name_size].decode("utf-8", "replace")
+            position += name_size
+            keys = array("I", data[position : position + 4 * count])
+            position += 4 * count
+            if len(keys) != count:
+                break  # truncated file
+            if sys.byteorder == "big":
+                keys.byteswap()
+            if len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[name] = RecentSet(self.window, keys[-self.window :])
+
+
+class WeightedSampler:
+    """
+    Weighted random positions backed by a Fenwick (binary indexed) tree.
+
+    Drawing, changing one weight and appending a weight are all O(log n), so
+    weights can be updated one at a time without rebuilding anything.
+
+    Parameters
+    ----------
+    weights : iterable of float, optional
+        Initial non-negative weight of each position.
+
+    Notes
+    -----
+    Weights may be updated from another thread without a lock. A draw that
+    runs concurrently with an update may see it partially applied, which only
+    skews that one draw slightly.
+
+    Examples
+    --------
+    >>> sampler = WeightedSampler([1, 0, 3])
+    >>> sampler.total, sampler.prefix(2)
+    (4.0, 1.0)
+    >>> sampler.add(1, 2)
+    >>> sampler.weight(1), sampler.total
+    (2.0, 6.0)
+    >>> sampler.find(0.5), sampler.find(1.5), sampler.find(5.9)
+    (0, 1, 2)
+    """
+
+    def __init__(self, weights=()):
+        self._weights = array("d", weights)
+        n = len(self._weights)
+        tree = array("d", [0.0]) + self._weights
+        # Linear-time construction: push each node into its parent
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def __len__(self):
+        return len(self._weights)
+
+    def weight(self, position):
+        """Return the weight of a position."""
+        return self._weights[position]
+
+    @property
+    def total(self):
+        """float: Sum of all weights."""
+        return self.prefix(len(self._weights))
+
+    def prefix(self, stop):
+        """Return the sum of the weights of positions ``0`` to ``stop - 1``."""
+        tree = self._tree
+        total = 0.0
+        while stop > 0:
+            total += tree[stop]
+            stop &= stop - 1
+        return total
+
+    def add(self, position, delta):
+        """Add ``delta`` to the weight of a position."""
+        self._weights[position] += delta
+        tree = self._tree
+        n = len(self._weights)
+        i = position + 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def set(self, position, weight):
+        """Set the weight of a position."""
+        self.add(position, weight - self._weights[position])
+
+    def append(self, weight):
+        """Add a position with the given weight at the end."""
+        n = len(self._weights) + 1
+        # Node n covers positions n - lowbit(n) + 1 to n (1-based)
+        covered = self.prefix(n - 1) - self.prefix(n - (n & -n))
+        self._weights.append(weight)
+        self._tree.append(covered + weight)
+
+    def find(self, value):
+        """Return the position whose cumulative weight range holds ``value``."""
+        tree = self._tree
+        n = len(self._weights)
+        position = 0
+        step = 1 << n.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= n and tree[nxt] <= value:
+                position = nxt
+                value -= tree[nxt]
+            step >>= 1
+        return min(position, n - 1)
+
+    def sample(self, start=0, stop=None, rng=None):
+        """
+        Draw a position from ``start`` to ``stop - 1`` by weight.
+
+        Raises
+        ------
+        ValueError
+            If the weights in the range sum to zero.
+        """
+        stop = len(self._weights) if stop is None else stop
+        low = self.prefix(start)
+        high = self.prefix(stop)
+        if high <= low:
+            raise ValueError("cannot sample from a range with zero total weight")
+        position = self.find(low + (rng or random).random() * (high - low))
+        # Guard against rounding at the range edges
+        return min(max(position, start), stop - 1)
@@ -0,0 +1,264 @@
+"""
+Full-text search over jokes and fun facts.
+
+:class:`SearchIndex` is an inverted index: each word maps to an array of
+the positions of the texts containing it, shortest texts first. Words are
+kept in a sorted list too, so every query term also matches the words it is
+a prefix of ("chick" finds "chicken") through a binary search.
+
+Results are ranked by BM25, with prefix matches weighted by the fraction of
+the word they cover. Since a word rarely appears twice in a joke, a text's
+score only falls as it gets longer, which the query plan relies on:
+
+- A query is answered from its rarest term. If that term matches few
+  texts, the other terms are checked by intersecting their postings, or by
+  re-reading the candidates if the postings are much larger.
+- If even the rarest term is common, its texts are visited shortest first
+  and the search stops as soon as no longer text can enter the top results.
+
+Either way the cost follows the number of results and candidates, not the
+size of the corpus.
+"""
+
+import heapq
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+from joke_machine.dedup import normalize_joke
+
+# BM25 parameters: term frequency saturation and length normalization
+_K1 = 1.2
+_B = 0.75
+
+# Terms shorter than this only match whole words
+MIN_PREFIX = 2
+
+# Re-read candidate texts instead of intersecting postings this many times
+# larger; re-reading one text costs about as much as 300 set lookups
+_VERIFY_RATIO = 256
+
+# Rarest-term matches above which texts are visited shortest first
+_EXHAUSTIVE_LIMIT = 4096
+
+
+def tokenize(text):
+    """
+    Split a text into search terms.
+
+    Terms are case-folded words; punctuation separates words.
+
+    Examples
+    --------
+    >>> tokenize("Why did the CHICKEN cross the road?")
+    ['why', 'did', 'the', 'chicken', 'cross', 'the', 'road']
+    """
+    return normalize_joke(text).split()
+
+
+class SearchIndex:
+    """
+    Inverted index with prefix matching and BM25 ranking.
+
+    Parameters
+    ----------
+    texts : sequence of str
+        The texts to index, addressed by position. The sequence is kept to
+        re-read candidate texts, so it may be a lazy view.
+    spans : dict, optional
+        ``(start, stop)`` range of each category, used by :meth:`label`.
+
+    Examples
+    --------
+    >>> index = SearchIndex(["Chickens cross roads.", "A road trip.", "Eggs."])
+    >>> index.search("road")
+    [1, 0]
+    >>> index.search("chick road")
+    [0]
+    >>> index.search("zebra")
+    []
+    """
+
+    def __init__(self, texts, spans=None):
+        self.texts = texts
+        self.spans = dict(spans or {})
+        postings = {}
+        lengths = array("H")
+        for position in range(len(texts)):
+            words = tokenize(texts[position])
+            lengths.append(min(len(words), 0xFFFF))
+            for word in set(words):
+                docs = postings.get(word)
+                if docs is None:
+                    postings[word] = docs = array("I")
+                docs.append(position)
+        # Shortest texts first; positions are already ascending within a length
+        for word, docs in postings.items():
+            postings[word] = array("I", sorted(docs, key=lengths.__getitem__))
+        self._postings = postings
+        self._words = sorted(postings)
+        self._lengths = lengths
+        self._average = sum(lengths) / len(lengths) if lengths else 0.0
+        self._starts = sorted(
+            (start, stop, name) for name, (start, stop) in self.spans.items()
+        )
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def expand(self, term):
+        """
+        Return the indexed words matching a query term, with their weights.
+
+        A word matches if it equals the term or, for terms of at least
+        ``MIN_PREFIX`` characters, starts with it. Each weight is the word's
+        inverse document frequency, scaled by ``len(term) / len(word)``.
+
+        Examples
+        --------
+        >>> index = SearchIndex(["bug", "bugs", "debug"])
+        >>> [word for word, _ in index.expand("bug")]
+        ['bug', 'bugs']
+        """
+        if len(term) < MIN_PREFIX:
+            words = [term] if term in self._postings else []
+        else:
+            lo = bisect_left(self._words, term)
+            hi = bisect_right(self._words, term + "\U0010ffff", lo)
+            words = self._words[lo:hi]
+        total = len(self._lengths)
+        weighted = []
+        for word in words:
+            found = len(self._postings[word])
+            idf = math.log(1 + (total - found + 0.5) / (found + 0.5))
+            weighted.append((word, idf * len(term) / len(word)))
+        return weighted
+
+    def search(self, query, limit=10, start=0, stop=None):
+        """
+        Return the positions of the best matches for a query.
+
+        Every query term must match (see :meth:`expand`); texts are ranked
+        by BM25 score, ties broken by position.
+
+        Parameters
+        ----------
+        query : str
+            The search terms.
+        limit : int, optional
+            Maximum number of results. Default is 10.
+        start, stop : int, optional
+            Only return positions in this range, e.g. one category's span.
+
+        Returns
+        -------
+        list of int
+            Positions into ``texts``, best match first.
+        """
+        return [position for position, _ in self.scored(query, limit, start, stop)]
+
+    def scored(self, query, limit=10, start=0, stop=None):
+        """Like :meth:`search`, returning ``(position, score)`` pairs."""
+        stop = len(self._lengths) if stop is None else stop
+        groups = []
+        for term in dict.fromkeys(tokenize(query)):
+            words = self.expand(term)
+            if not words:
+                return []
+            size = sum(len(self._postings[word]) for word, _ in words)
+            groups.append((size, words))
+        if not groups or limit <= 0:
+            return []
+        groups.sort(key=lambda group: group[0])
+        if groups[0][0] > _EXHAUSTIVE_LIMIT:
+            return self._scored_shortest_first(groups, limit, start, stop)
+
+        # Best weight per text for the rarest term
+        scores = {}
+        for word, weight in groups[0][1]:
+            for position in self._postings[word]:
+                if start <= position < stop and scores.get(position, 0.0) < weight:
+                    scores[position] = weight
+
+        for size, words in groups[1:]:
+            if not scores:
+                return []
+            matched = {}
+            if size > _VERIFY_RATIO * len(scores):
+                weights = dict(words)
+                for position in scores:
+                    best = self._best_weight(weights, self._words_of(position))
+                    if best:
+                        matched[position] = best
+            else:
+                for word, weight in words:
+                    for position in scores.keys() & self._postings[word]:
+                        if matched.get(position, 0.0) < weight:
+                            matched[position] = weight
+            scores = {position: scores[position] + w for position, w in matched.items()}
+
+        ranked = (
+            (position, score * self._norm(position))
+            for position, score in scores.items()
+        )
+        return heapq.nsmallest(limit, ranked, key=lambda item: (-item[1], item[0]))
+
+    def _scored_shortest_first(self, groups, limit, start, stop):
+        """Score texts shortest first, stopping once the top results are final."""
+        weights = [dict(words) for _, words in groups]
+        ceiling = sum(max(group.values()) for group in weights)
+        lengths = self._lengths
+        postings = [self._postings[word] for word in weights[0]]
+        # Visit in (length, position) order, the order ties are broken in
+        merged = heapq.merge(*postings, key=lambda p: lengths[p] << 32 | p)
+        top = []  # min-heap of (score, -position)
+        seen = set()
+        for position in merged:
+            if not start <= position < stop or position in seen:
+                continue
+            seen.add(position)
+            norm = self._norm(position)
+            if len(top) == limit and top[0][0] >= ceiling * norm:
+                break  # no text from here on can rank higher
+            words = self._words_of(position)
+            score = 0.0
+            for group in weights:
+                best = self._best_weight(group, words)
+                if not best:
+                    break
+                score += best
+            else:
+                item = (score * norm, -position)
+                if len(top) < limit:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+        return [(-negative, score) for score, negative in sorted(top, reverse=True)]
+
+    def _words_of(self, position):
+        return set(tokenize(self.texts[position]))
+
+    @staticmethod
+    def _best_weight(weights, words):
+        return max((weights.get(word, 0.0) for word in words), default=0.0)
+
+    def _norm(self, position):
+        # BM25 term frequency factor for one occurrence in this text
+        length = self._lengths[position] / (self._average or 1.0)
+        return (_K1 + 1) / (1 + _K1 * (1 - _B + _B * length))
+
+    def label(self, position):
+        """
+        Return the name of the span holding a position, or None.
+
+        Examples
+        --------
+        >>> SearchIndex(["a", "b"], {"x": (0, 1), "y": (1, 2)}).label(1)
+        'y'
+        """
+        i = bisect_right(self._starts, (position, float("inf"))) - 1
+        if i >= 0:
+            span_start, span_stop, name = self._starts[i]
+            if span_start <= position < span_stop:
+                return name
+        return None
@@ -0,0 +1,419 @@
+"""
+HTTP JSON service for jokes, fun facts and favorites.
+
+``joke-machine --serve`` exposes the library over HTTP/1.1 using only the
+standard library. The server runs on asyncio: connections are kept alive,
+pipelined requests are answered in order, and handlers that touch the disk
+(favorites) run on a bounded thread pool so they never stall the event loop.
+
+Endpoints
+---------
+GET  /joke?category=NAME&session=ID A random joke, not repeated for the
+                                    session within its last 50 jokes;
+                                    add popular=1 to favor favorites
+GET  /jokes?n=N&category=NAME&unique=1
+                                    N random jokes in one draw
+GET  /fact                          A random fun fact
+GET  /categories                    Joke categories and their sizes
+GET  /favorites?limit=&offset=&since=&grep=&user=ID
+                                    A page of saved favorites, of one user
+                                    if given
+POST /favorites  {"joke": "...", "user": "ID"}
+                                    Save a favorite, for one user if given
+GET  /health                        Liveness check
+GET  /metrics                       Counters and latencies in the Prometheus
+                                    text format, with ``--stats``
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+from joke_machine import app
+
+logger = logging.getLogger(__name__)
+
+# Largest accepted request body, in bytes
+MAX_BODY_SIZE = 64 * 1024
+
+# Favorites returned per page when no limit is given, and the largest page
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Longest accepted user ID, in characters
+MAX_USER_LENGTH = 256
+
+_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+}
+
+
+class HTTPError(Exception):
+    """Raised by handlers to answer with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _int_param(query, name, default, minimum=0, maximum=None):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer") from None
+    if value < minimum or (maximum is not None and value > maximum):
+        raise HTTPError(400, f"{name} is out of range")
+    return value
+
+
+def _category_param(query):
+    category = query.get("category", [None])[0]
+    if category is not None and category not in app.get_categories():
+        raise HTTPError(404, f"unknown category {category!r}")
+    return category
+
+
+def _popular_param(query):
+    return query.get("popular", ["0"])[0] not in ("0", "false", "")
+
+
+def _get_joke(query, body):
+    category = _category_param(query)
+    session = query.get("session", [None])[0]
+    popular = _popular_param(query)
+    if session:
+        return 200, {"joke": app.get_unseen_joke(session, category, popular=popular)}
+    if popular:
+        return 200, {"joke": app.get_popular_joke(category)}
+    return 200, {"joke": app.get_joke(category)}
+
+
+def _get_jokes(query, body):
+    category = _category_param(query)
+    n = _int_param(query, "n", 10, minimum=1, maximum=10_000)
+    unique = query.get("unique", ["0"])[0] not in ("0", "false", "")
+    try:
+        jokes = app.get_jokes(n, category, unique=unique)
+    except ValueError:
+        raise HTTPError(400, "not enough jokes for a unique draw") from None
+    return 200, {"jokes": jokes}
+
+
+def _get_fact(query, body):
+    return 200, {"fact": app.get_fun_fact()}
+
+
+def _get_categories(query, body):
+    return 200, {"categories": app.get_categories()}
+
+
+_local = threading.local()
+
+
+def _user_param(user):
+    if user is None:
+        return None
+    if not isinstance(user, str) or not 0 < len(user) <= MAX_USER_LENGTH:
+        raise HTTPError(
+            400, f"user must be a string of 1 to {MAX_USER_LENGTH} characters"
+        )
+    return user
+
+
+def _favorites_store(user=None):
+    if user is not None:
+        # Shards are shared between threads and users, in a bounded cache
+        return app.open_favorites_store(user)
+    # Each worker thread keeps its store, so SQLite connections are reused
+    store = app.open_favorites_store()
+    cached = getattr(_local, "store", None)
+    if type(cached) is type(store) and cached.path == store.path:
+        return cached
+    _local.store = store
+    return store
+
+
+def _get_favorites(query, body):
+    limit = _int_param(query, "limit", DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE)
+    offset = _int_param(query, "offset", 0)
+    since = query.get("since", [None])[0]
+    grep = query.get("grep", [None])[0]
+    favorites = _favorites_store(_user_param(query.get("user", [None])[0]))
+    if not favorites.exists():
+        return 200, {"favorites": []}
+    try:
+        entries = list(favorites.query(limit, offset, since, grep))
+    except json.JSONDecodeError:
+        raise HTTPError(500, "favorites file is corrupted") from None
+    return 200, {"favorites": entries}
+
+
+def _post_favorite(query, body):
+    try:
+        request = json.loads(body)
+        joke = request["joke"]
+        user = _user_param(request.get("user"))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPError(400, 'expected a JSON body like {"joke": "..."}') from None
+    if not isinstance(joke, str) or not joke.strip():
+        raise HTTPError(400, "joke must be a non-empty string")
+    saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    entry = app.add_favorite(joke, saved_at, _favorites_store(user))
+    if entry is None:
+        return 200, {"saved": False, "reason": "duplicate"}
+    return 201, {"saved": True, "favorite": entry}
+
+
+def _get_health(query, body):
+    return 200, {"status": "ok"}
+
+
+def _get_metrics(query, body):
+    metrics = app.get_metrics()
+    if metrics is None:
+        raise HTTPError(404, "metrics are off, start the server with --stats")
+    return 200, metrics.export()
+
+
+# (method, path) -> (handler, runs on the thread pool). Instead of a bool, the
+# second item can be a function of the query deciding per request.
+ROUTES = {
+    # Popular draws may first read the favorites store to weight the jokes
+    ("GET", "/joke"): (_get_joke, _popular_param),
+    ("GET", "/jokes"): (_get_jokes, False),
+    ("GET", "/fact"): (_get_fact, False),
+    ("GET", "/categories"): (_get_categories, False),
+    ("GET", "/favorites"): (_get_favorites, True),
+    ("POST", "/favorites"): (_post_favorite, True),
+    ("GET", "/health"): (_get_health, False),
+    ("GET", "/metrics"): (_get_metrics, False),
+}
+
+
+def _response(status, payload, keep_alive):
+    # Handlers return JSON-able objects, or text such as the /metrics page
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body = json.dumps(payload).encode("utf-8")
+        content_type = "application/json"
+    head = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("ascii") + body
+
+
+class JokeServer:
+    """
+    Asyncio HTTP/1.1 server for the JokeMachine API.
+
+    Parameters
+    ----------
+    host : str, optional
+        Interface to listen on. Default is "127.0.0.1".
+    port : int, optional
+        Port to listen on. 0 picks a free port. Default is 8000.
+    workers : int, optional
+        Size of the thread pool for disk-bound handlers. Default is 8.
+
+    Examples
+    --------
+    >>> async def ping():
+    ...     server = JokeServer(port=0)
+    ...     await server.start()
+    ...     reader, writer = await asyncio.open_connection(*server.address)
+    ...     writer.write(b"GET /health HTTP/1.1\\r\\nConnection: close\\r\\n\\r\\n")
+    ...     response = await reader.read()
+    ...     writer.close()
+    ...     await server.stop()
+    ...     return response.split(b"\\r\\n")[0]
+    >>> asyncio.run(ping())
+    b'HTTP/1.1 200 OK'
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, workers=8):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self._executor = None
+        self._server = None
+
+    @property
+    def address(self):
+        """tuple: The ``(host, port)`` the server is listening on."""
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self):
+        """Start listening for connections."""
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="joke-server"
+        )
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+
+    async def stop(self):
+        """Stop accepting connections and shut down the thread pool."""
+        self._server.close()
+        await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        """Start the server and run until cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        route = ROUTES.get((method, url.path))
+        if route is None:
+            if any(path == url.path for _, path in ROUTES):
+                raise HTTPError(405, f"{method} not allowed on {url.path}")
+            raise HTTPError(404, f"no such endpoint {url.path}")
+        handler, blocking = route
+        query = parse_qs(url.query)
+        if callable(blocking):
+            blocking = blocking(query)
+        if blocking:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, handler, query, body)
+        return handler(query, body)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break  # client closed the connection
+                except asyncio.LimitOverrunError:
+                    writer.write(_response(431, {"error": "headers too large"}, False))
+                    break
+
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ")
+                except ValueError:
+                    writer.write(_response(400, {"error": "bad request line"}, False))
+                    break
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (
+                    connection != "close"
+                    if version == "HTTP/1.1"
+                    else connection == "keep-alive"
+                )
+
+                if "transfer-encoding" in headers:
+                    # Chunked bodies are not supported. Reading one as the next
+                    # request would let a client smuggle requests past a proxy.
+                    writer.write(
+                        _response(
+                            501, {"error": "transfer encodings not supported"}, False
+                        )
+                    )
+                    break
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_SIZE:
+                    writer.write(_response(413, {"error": "body too large"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = await self._dispatch(method, target, body)
+                except HTTPError as exc:
+                    status, payload = exc.status, {"error": exc.message}
+                except Exception:
+                    logger.exception("error handling %s %s", method, target)
+                    status, payload = 500, {"error": "internal server error"}
+
+                writer.write(_response(status, payload, keep_alive))
+                # Only wait for the socket when the send buffer is filling up,
+                # so pipelined responses are batched into few writes
+                if writer.transport.get_write_buffer_size() > 64 * 1024:
+                    await writer.drain()
+                if not keep_alive:
+                    break
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def parse_address(address, default_host="127.0.0.1"):
+    """
+    Parse a ``HOST:PORT`` or ``PORT`` listen address.
+
+    Examples
+    --------
+    >>> parse_address("0.0.0.0:8080")
+    ('0.0.0.0', 8080)
+    >>> parse_address("9000")
+    ('127.0.0.1', 9000)
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"invalid port in {address!r}") from None
+    if not 0 <= port <= 65535:
+        raise ValueError(f"invalid port in {address!r}")
+    return host.strip("[]") or default_host, port
+
+
+def serve(host="127.0.0.1", port=8000, workers=8):
+    """
+    Run the HTTP service until interrupted.
+
+    Parameters
+    ----------
+    host : str, optional
+        Interface to listen on. Default is "127.0.0.1".
+    port : int, optional
+        Port to listen on. Default is 8000.
+    workers : int, optional
+        Size of the thread pool for favorites requests. Default is 8.
+
+    Examples
+    --------
+    >>> serve(port=8000)  # doctest: +SKIP
+    Serving JokeMachine on http://127.0.0.1:8000 (Ctrl+C to stop)
+    """
+    server = JokeServer(host, port, workers)
+    print(f"Serving JokeMachine on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
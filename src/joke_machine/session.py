@@ -0,0 +1,437 @@
+"""
+Interactive sessions, separated from the terminal they run in.
+
+A :class:`Session` holds the state of one interactive user (the last joke,
+a running profiler) and turns each line of input into a list of
+:class:`~joke_machine.delivery.DeliveryEvent` objects. It never reads,
+prints or sleeps itself, so the same session logic runs behind:
+
+- ``joke-machine --interactive``, which reads stdin and sleeps through the
+  pauses (:func:`joke_machine.app.interactive_mode`);
+- :class:`SessionServer`, which hosts any number of sessions over TCP on one
+  asyncio event loop, awaiting pauses instead of sleeping;
+- scripts and tests, which call :meth:`Session.handle` directly.
+
+Commands live in the ``COMMANDS`` table, filled by the :func:`command`
+decorator. Each entry says how the command is used, whether it touches the
+disk (the server then runs it on a thread pool) and whether it is only
+offered to local sessions.
+"""
+
+import io
+from collections import namedtuple
+
+from joke_machine import app
+from joke_machine.delivery import DeliveryEvent
+
+Command = namedtuple(
+    "Command", ["name", "handler", "usage", "help", "blocking", "local"]
+)
+Command.__doc__ = """
+An interactive command.
+
+Attributes
+----------
+name : str
+    The word that invokes the command.
+handler : callable
+    Called as ``handler(session, argument)`` with the rest of the input line
+    and returns a list of delivery events.
+usage : str
+    The command line shown by ``help``.
+help : str
+    One-line description shown by ``help``.
+blocking : bool
+    True if the handler does disk I/O and should not run on an event loop.
+local : bool
+    True if the command is only offered to sessions on this machine.
+"""
+
+# name -> Command, in the order shown by "help"
+COMMANDS = {}
+
+# Shown before every line of input
+PROMPT = "\nWhat would you like? > "
+
+GREETING = (
+    "Welcome to Interactive Mode!\n"
+    "Type 'exit' or 'quit' to leave, 'help' for commands.\n"
+)
+
+
+def command(usage, help, blocking=False, local=False, aliases=()):
+    """
+    Register a session command.
+
+    The command is named by the first word of ``usage``.
+
+    Examples
+    --------
+    >>> @command("shrug", "Shrug")
+    ... def _shrug(session, argument):
+    ...     return say("¯\\\\_(ツ)_/¯")
+    >>> Session().handle("shrug")[0].text
+    '¯\\\\_(ツ)_/¯'
+    >>> del COMMANDS["shrug"]
+    """
+
+    def register(handler):
+        name = usage.split()[0]
+        cmd = Command(name, handler, usage, help, blocking, local)
+        for word in (name, *aliases):
+            COMMANDS[word] = cmd
+        return handler
+
+    return register
+
+
+def say(*lines):
+    """Return events showing ``lines`` without a pause."""
+    return [DeliveryEvent("text", 0, line) for line in lines]
+
+
+class Session:
+    """
+    The state of one interactive user.
+
+    Parameters
+    ----------
+    name : str, optional
+        Session name jokes are not repeated for. Default is "interactive".
+    window : int, optional
+        Number of recent jokes not to repeat. Default is 50.
+    saved : bool, optional
+        Keep the joke history on disk under ``name``, as
+        ``joke-machine --session`` does. Default is False.
+    delay : float, optional
+        Pause before punchlines, in seconds. Default is 1.5.
+    commands : dict, optional
+        The commands offered. Default is ``COMMANDS``.
+    terminal : bool, optional
+        The session runs in this process's terminal, so commands with long
+        output such as ``favorites`` print it themselves, through $PAGER if
+        needed, instead of returning it as events. Default is False.
+
+    Examples
+    --------
+    >>> session = Session(delay=0)
+    >>> [event.kind for event in session.handle("joke puns")][0] in ("joke", "setup")
+    True
+    >>> session.handle("fact")[0].kind
+    'text'
+    >>> session.handle("quit")[0].text
+    'Thanks for laughing with JokeMachine! Goodbye!'
+    >>> session.closed
+    True
+    """
+
+    def __init__(
+        self,
+        name="interactive",
+        window=None,
+        saved=False,
+        delay=1.5,
+        commands=None,
+        terminal=False,
+    ):
+        self.name = name
+        self.window = window
+        self.saved = saved
+        self.delay = delay
+        self.commands = COMMANDS if commands is None else commands
+        self.terminal = terminal
+        self.sampler = None
+        if window and not saved:
+            from joke_machine.sampling import NoRepeatSampler
+
+            # The shared in-process sampler has the default window
+            self.sampler = NoRepeatSampler(window)
+        self.last_joke = None
+        self.profiler = None
+        self.closed = False
+
+    def parse(self, line):
+        """
+        Return the command and argument of an input line.
+
+        Returns
+        -------
+        tuple
+            ``(Command or None, argument)``. The command is None for blank
+            or unknown input.
+        """
+        word, _, argument = line.strip().partition(" ")
+        return self.commands.get(word.lower()), argument.strip()
+
+    def handle(self, line):
+        """
+        Run one line of input.
+
+        Returns
+        -------
+        list of DeliveryEvent
+            What to show, with the pause to observe before each line.
+        """
+        cmd, argument = self.parse(line)
+        if cmd is None:
+            return say("I didn't understand that. Type 'help' for available commands.")
+        return cmd.handler(self, argument)
+
+    def close(self):
+        """End the session, stopping a profiler it started."""
+        self.closed = True
+        if self.profiler is not None:
+            return self._stop_profiler(None)
+        return []
+
+    def _stop_profiler(self, path):
+        out = io.StringIO()
+        app.stop_profiling(self.profiler, path, out)
+        self.profiler = None
+        return say(out.getvalue().rstrip("\n"))
+
+
+@command("joke [category]", "Tell a joke")
+def _joke(session, argument):
+    words = argument.lower().split()
+    category = words[0] if words and words[0] in app.get_categories() else None
+    if session.saved:
+        joke = app._session_joke(session.name, category, session.window)
+    else:
+        joke = app.get_unseen_joke(session.name, category, session.sampler)
+    session.last_joke = joke
+    return app.plan_joke(joke, category, session.delay)
+
+
+@command("fact", "Tell a fun fact")
+def _fact(session, argument):
+    return say(app.get_fun_fact())
+
+
+@command("save", "Save the last joke to favorites", blocking=True)
+def _save(session, argument):
+    if not session.last_joke:
+        return say("No joke to save. Tell a joke first!")
+    store = app.open_favorites_store()
+    if app.add_favorite(session.last_joke, store=store) is None:
+        return say("That joke is already in your favorites.")
+    return say(f"Joke saved to favorites at {store.path}")
+
+
+@command("favorites", "List your favorite jokes", blocking=True)
+def _favorites(session, argument):
+    if session.terminal:
+        app.list_favorites()
+        return []
+    store = app.open_favorites_store()
+    if not store.exists():
+        return say("You haven't saved any favorites yet.")
+    lines = []
+    try:
+        for count, fav in enumerate(store.query(), 1):
+            lines.append(f"{count}. {fav['joke']}")
+            lines.append(f"   Saved on: {fav.get('saved_at', 'unknown')}\n")
+    except ValueError:
+        return say("Error reading favorites file. It might be corrupted.")
+    if not lines:
+        return say("Your favorites list is empty.")
+    return say("\n=== Your Favorite Jokes ===\n", *lines)
+
+
+@command("categories", "List joke categories")
+def _categories(session, argument):
+    return say(
+        "\nAvailable joke categories:",
+        *(
+            f"  - {name} ({count} jokes)"
+            for name, count in app.get_categories().items()
+        ),
+    )
+
+
+# Blocking, as the first search builds the index over the whole corpus
+@command("search <words>", "Find jokes and facts by keyword", blocking=True)
+def _search(session, argument):
+    if not argument:
+        return say("Usage: search <words>")
+    return say(*app.format_search_results(app.search_jokes(argument)))
+
+
+@command("profile on|off [file]", "Profile the commands in between", local=True)
+def _profile(session, argument):
+    action, _, path = argument.partition(" ")
+    action = action.lower()
+    if action == "on" and app._profiler is not None:
+        return say("Already profiling.")
+    if action == "on":
+        session.profiler = app.start_profiling()
+        return say("Profiling on. Pauses and prompts are left out.")
+    if action == "off" and session.profiler is not None:
+        return session._stop_profiler(path.strip() or None)
+    if action == "off":
+        return say("Not profiling. Type 'profile on' to start.")
+    return say("Usage: profile on|off [file]")
+
+
+@command("help", "Show this help message")
+def _help(session, argument):
+    commands = dict.fromkeys(session.commands.values())
+    return say(
+        "\nAvailable commands:",
+        *(f"  {cmd.usage:<22}- {cmd.help}" for cmd in commands),
+    )
+
+
+@command("exit", "Exit the program (or type quit)", aliases=("quit",))
+def _exit(session, argument):
+    return session.close() + say("Thanks for laughing with JokeMachine! Goodbye!")
+
+
+class SessionServer:
+    """
+    Host interactive sessions over TCP on one asyncio event loop.
+
+    Every connection gets its own :class:`Session`. Punchline pauses are
+    awaited, and commands that touch the disk run on a thread pool, so a
+    slow client or a pending punchline never holds up the other sessions.
+    Local-only commands such as ``profile`` are not offered.
+
+    Parameters
+    ----------
+    host : str, optional
+        Interface to listen on. Default is "127.0.0.1".
+    port : int, optional
+        Port to listen on. 0 picks a free port. Default is 8001.
+    delay : float, optional
+        Pause before punchlines, in seconds. Default is 1.5.
+    workers : int, optional
+        Size of the thread pool for disk-bound commands. Default is 8.
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> async def chat():
+    ...     server = SessionServer(port=0, delay=0)
+    ...     await server.start()
+    ...     reader, writer = await asyncio.open_connection(*server.address)
+    ...     writer.write(b"fact\\nquit\\n")
+    ...     transcript = (await reader.read()).decode()
+    ...     writer.close()
+    ...     await server.stop()
+    ...     return transcript
+    >>> asyncio.run(chat()).rstrip().endswith("Goodbye!")
+    True
+    """
+
+    # Longest accepted input line, in bytes
+    MAX_LINE = 4096
+
+    # Connections the OS queues before they are accepted, for login bursts
+    BACKLOG = 1024
+
+    def __init__(self, host="127.0.0.1", port=8001, delay=1.5, workers=8):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.workers = workers
+        self.commands = {word: cmd for word, cmd in COMMANDS.items() if not cmd.local}
+        self.sessions = 0
+        self._connections = 0
+        self._executor = None
+        self._server = None
+
+    @property
+    def address(self):
+        """tuple: The ``(host, port)`` the server is listening on."""
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self):
+        """Start listening for connections."""
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="joke-session"
+        )
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+            limit=self.MAX_LINE,
+            backlog=self.BACKLOG,
+        )
+
+    async def stop(self):
+        """Stop accepting connections and shut down the thread pool."""
+        self._server.close()
+        await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        """Start the server and run until cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+
+        self._connections += 1
+        self.sessions += 1
+        session = Session(
+            f"tcp-{self._connections}", delay=self.delay, commands=self.commands
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            writer.write(f"{app.HEADER_ART}\n{GREETING}".encode())
+            while not session.closed:
+                writer.write(PROMPT.encode())
+                await writer.drain()
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    break  # line too long
+                if not line:
+                    break  # client went away
+                line = line.decode("utf-8", "replace")
+                cmd, _ = session.parse(line)
+                if cmd is not None and cmd.blocking:
+                    events = await loop.run_in_executor(
+                        self._executor, session.handle, line
+                    )
+                else:
+                    events = session.handle(line)
+                for event in events:
+                    if event.pause:
+                        await writer.drain()
+                        await asyncio.sleep(event.pause)
+                    writer.write(f"{event.text}\n".encode())
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+
+def serve_sessions(host="127.0.0.1", port=8001, delay=1.5, workers=8):
+    """
+    Host interactive sessions over TCP until interrupted.
+
+    Connect with any line-based client, e.g. ``nc 127.0.0.1 8001``.
+
+    Examples
+    --------
+    >>> serve_sessions(port=8001)  # doctest: +SKIP
+    Hosting interactive sessions on 127.0.0.1:8001 (Ctrl+C to stop)
+    """
+    import asyncio
+
+    server = SessionServer(host, port, delay, workers)
+    print(f"Hosting interactive sessions on {host}:{port} (Ctrl+C to stop)")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import tempfile
@@ -39,9 +40,10 @@ def temp_favorites_file():
 
     yield temp_file
 
-    # Cleanup after test
-    if os.path.exists(temp_file):
-        os.unlink(temp_file)
+    # Cleanup after test, including the favorites lock file
+    for path in (temp_file, temp_file + ".lock"):
+        if os.path.exists(path):
+            os.unlink(path)
 
 
 @pytest.fixture
@@ -66,3 +68,56 @@ def setup_favorites_file(favorites_path_patch, sample_favorites):
     with open(favorites_path_patch, "w") as f:
         json.dump(sample_favorites, f)
     return favorites_path_patch
+
+
+@pytest.fixture
+def favorites_env(tmp_path, monkeypatch):
+    """Point the favorites store at a temporary JSON Lines file"""
+    path = tmp_path / "favorites.json"
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES", str(path))
+    return path
+
+
+class SleepTracker:
+    """
+    Stand-in for asyncio.sleep that records how many sleeps overlap.
+
+    Every sleep returns once ``expected`` sleeps are in progress at the same
+    time, without waiting out its delay. If that never happens, all sleeps
+    return after ``timeout`` seconds and ``peak`` tells how many overlapped.
+    """
+
+    def __init__(self, expected, timeout=10):
+        self.expected = expected
+        self.timeout = timeout
+        self.active = self.peak = 0
+        self.delays = []
+        self._all_asleep = None
+
+    async def __call__(self, delay, result=None):
+        if self._all_asleep is None:
+            self._all_asleep = asyncio.Event()  # bound to the running loop
+        self.delays.append(delay)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        if self.active >= self.expected:
+            self._all_asleep.set()
+        try:
+            await asyncio.wait_for(self._all_asleep.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            self._all_asleep.set()
+        finally:
+            self.active -= 1
+        return result
+
+
+@pytest.fixture
+def sleep_tracker(monkeypatch):
+    """Patch asyncio.sleep with a SleepTracker expecting the given overlap"""
+
+    def track(expected):
+        tracker = SleepTracker(expected)
+        monkeypatch.setattr(asyncio, "sleep", tracker)
+        return tracker
+
+    return track
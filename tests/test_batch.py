@@ -0,0 +1,211 @@
+import io
+import json
+import random
+import sys
+from array import array
+from collections import Counter
+from unittest.mock import Mock, patch
+
+import pytest
+
+from joke_machine.app import (
+    get_catalog,
+    get_fun_facts,
+    get_jokes,
+    load_corpus,
+    main,
+    stream_batch,
+    use_corpus,
+)
+from joke_machine.catalog import JokeCatalog
+from joke_machine.corpus import write_packed_corpus
+
+
+def test_get_jokes_with_category(mock_jokes):
+    """Test that a category restricts the whole batch"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        jokes = get_jokes(50, category="test", seed=1)
+
+    assert len(jokes) == 50
+    assert set(jokes) <= set(mock_jokes["test"])
+
+
+def test_get_jokes_invalid_category_draws_from_all(mock_jokes):
+    """Test that an unknown category falls back to every category"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        jokes = get_jokes(200, category="nope", seed=1)
+
+    assert "Why do programmers prefer dark mode? Because light attracts bugs!" in jokes
+
+
+def test_get_jokes_seed_is_reproducible(mock_jokes):
+    """Test that the same seed yields the same batch"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        assert get_jokes(20, seed=7) == get_jokes(20, seed=7)
+
+
+def test_get_jokes_unique(mock_jokes):
+    """Test sampling without replacement"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        jokes = get_jokes(4, unique=True, seed=3)
+
+        with pytest.raises(ValueError):
+            get_jokes(5, unique=True)
+
+    assert sorted(jokes) == sorted(mock_jokes["test"] + mock_jokes["programming"])
+
+
+def test_get_jokes_as_indices(mock_jokes):
+    """Test that indices point into the shared catalog"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        indices = get_jokes(10, seed=2, as_indices=True)
+        texts = get_catalog().texts
+        assert isinstance(indices, array)
+        assert [texts[i] for i in indices] == get_jokes(10, seed=2)
+
+
+def test_get_jokes_weights_set_category_share(mock_jokes):
+    """Test that category weights control the share of draws"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        jokes = get_jokes(
+            6000, weights={"test": 1, "programming": 2}, seed=5, as_indices=True
+        )
+        tags = Counter(get_catalog().tags[i] for i in jokes)
+
+    assert 1800 < tags["test"] < 2200
+    assert 3800 < tags["programming"] < 4200
+
+
+def test_sample_unique_weighted_excludes_zero_weight(mock_jokes):
+    """Test weighted sampling without replacement"""
+    catalog = JokeCatalog(mock_jokes)
+
+    picks = catalog.sample(
+        3, unique=True, weights={"test": 1, "programming": 0}, rng=random.Random(0)
+    )
+
+    assert sorted(picks) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        catalog.sample(4, unique=True, weights={"test": 1}, rng=random.Random(0))
+
+
+def test_sample_from_empty_categories_raises(mock_jokes):
+    """Test that draws with nothing to draw from raise ValueError"""
+    catalog = JokeCatalog({**mock_jokes, "empty": []})
+
+    with pytest.raises(ValueError, match="weighted categories"):
+        catalog.sample(2, weights={"empty": 1, "missing": 2})
+    with pytest.raises(ValueError, match="empty population"):
+        catalog.sample(2, category="empty")
+    assert len(catalog.sample(0, weights={"empty": 1})) == 0
+
+
+def test_get_fun_facts(mock_facts):
+    """Test batch draws of fun facts"""
+    with patch("joke_machine.app.FUN_FACTS", mock_facts):
+        facts = get_fun_facts(10, seed=1)
+        unique = get_fun_facts(2, unique=True, seed=1)
+        indices = get_fun_facts(3, seed=1, as_indices=True)
+
+    assert set(facts) <= set(mock_facts)
+    assert sorted(unique) == sorted(mock_facts)
+    assert list(indices) == [mock_facts.index(fact) for fact in facts[:3]]
+
+
+def test_stream_batch_jsonl(mock_jokes):
+    """Test streaming jokes as JSON Lines with their category"""
+    out = io.BytesIO()
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch("joke_machine.app.BATCH_CHUNK_SIZE", 7):
+            assert stream_batch(20, category="test", stream=out) == 20
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(records) == 20
+    assert all(record["category"] == "test" for record in records)
+    assert {record["joke"] for record in records} <= set(mock_jokes["test"])
+
+
+def test_stream_batch_memo_is_bounded(mock_jokes):
+    """Test that remembered lines are capped and output stays correct"""
+    outputs, encodings = [], []
+    for memo_size in (64, 2):
+        out = io.BytesIO()
+        with patch("joke_machine.app.JOKES", mock_jokes):
+            with patch("joke_machine.app.BATCH_MEMO_SIZE", memo_size):
+                with patch("json.dumps", wraps=json.dumps) as dumps:
+                    stream_batch(50, category="test", stream=out)
+        outputs.append(
+            {json.loads(line)["joke"] for line in out.getvalue().splitlines()}
+        )
+        encodings.append(dumps.call_count)
+
+    assert outputs[0] == outputs[1] == set(mock_jokes["test"])
+    assert encodings[0] == 3
+    assert encodings[1] > 3
+
+
+def test_stream_batch_tsv_escapes(mock_facts):
+    """Test that TSV output escapes separators and starts with column names"""
+    facts = ["Tab\there", "Two\nlines", "Back\\slash"]
+    out = io.BytesIO()
+    with patch("joke_machine.app.FUN_FACTS", facts):
+        stream_batch(30, facts=True, fmt="tsv", header=True, stream=out)
+
+    lines = out.getvalue().decode().splitlines()
+    assert lines[0] == "fact"
+    assert set(lines[1:]) == {"Tab\\there", "Two\\nlines", "Back\\\\slash"}
+
+
+def test_stream_batch_from_corpus(tmp_path, mock_jokes, mock_facts):
+    """Test that corpus records are labelled with their category"""
+    path = str(tmp_path / "jokes.jpk")
+    write_packed_corpus(path, mock_jokes, mock_facts)
+    out = io.BytesIO()
+    corpus = load_corpus(path)
+    try:
+        stream_batch(50, fmt="tsv", stream=out)
+    finally:
+        use_corpus(None)
+        corpus.close()
+
+    pairs = {tuple(line.split("\t")) for line in out.getvalue().decode().splitlines()}
+    assert pairs <= {
+        (category, joke) for category, jokes in mock_jokes.items() for joke in jokes
+    }
+
+
+def test_stream_batch_skips_empty_corpus_categories(tmp_path):
+    """Test that an empty category does not take over the next one's records"""
+    path = str(tmp_path / "jokes.jpk")
+    write_packed_corpus(path, {"zeta": [], "alpha": ["A1", "A2"]}, [])
+    out = io.BytesIO()
+    corpus = load_corpus(path)
+    try:
+        stream_batch(20, stream=out)
+    finally:
+        use_corpus(None)
+        corpus.close()
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert {record["category"] for record in records} == {"alpha"}
+    assert {record["joke"] for record in records} <= {"A1", "A2"}
+
+
+def test_stream_batch_stops_on_closed_pipe():
+    """Test that a closed pipe ends the stream quietly"""
+    stream = Mock()
+    stream.write.side_effect = BrokenPipeError
+
+    assert stream_batch(10, stream=stream) == 0
+
+
+def test_cli_count_without_header(mock_jokes, capsys):
+    """Test that --count --no-header writes only the records"""
+    argv = ["joke_machine", "--count", "5", "--no-header", "--format", "tsv"]
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch.object(sys, "argv", argv):
+            main()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 5
+    assert all("\t" in line for line in lines)
@@ -0,0 +1,62 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+BENCHMARKS = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "run.py")
+
+
+@pytest.fixture(scope="module")
+def bench():
+    """Load benchmarks/run.py as a module"""
+    spec = importlib.util.spec_from_file_location("bench_run", BENCHMARKS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmarks_run(bench, tmp_path, capsys):
+    """Test a quick run of every benchmark on a tiny corpus"""
+    output = tmp_path / "results.json"
+    quick = ["--sizes", "10", "--min-time", "0.001", "--repeat", "1"]
+
+    status = bench.main([*quick, "-o", str(output), "--baseline", str(output)])
+
+    results = json.loads(output.read_text())["results"]
+    assert status == 0
+    assert set(results) >= {"get_joke[10]", "save_favorite[10]", "cold_start_fact"}
+    assert all(result["best"] > 0 for result in results.values())
+
+
+def test_compare_flags_regressions(bench):
+    """Test that slowdowns beyond the threshold are reported"""
+    baseline = {
+        "a[10]": {"benchmark": "a", "best": 1.0},
+        "b[10]": {"benchmark": "b", "best": 1.0},
+    }
+    results = {
+        "a[10]": {"benchmark": "a", "best": 1.2},
+        "b[10]": {"benchmark": "b", "best": 1.6},
+        "new": {"benchmark": "new", "best": 9.0},
+    }
+
+    rows = bench.compare(results, baseline, threshold=0.25)
+    assert [(key, regressed) for key, *_, regressed in rows] == [
+        ("a[10]", False),
+        ("b[10]", True),
+    ]
+
+    rows = bench.compare(results, baseline, 0.25, overrides={"b": 1.0})
+    assert not any(regressed for *_, regressed in rows)
+
+
+def test_parse_options(bench):
+    """Test size and threshold parsing"""
+    assert [bench.parse_size(s) for s in ["10", "1e4", "10M", "5k"]] == [
+        10,
+        10_000,
+        10_000_000,
+        5_000,
+    ]
+    assert bench.parse_thresholds(["0.1", "split=0.5"]) == (0.1, {"split": 0.5})
@@ -0,0 +1,103 @@
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine.app import main
+from joke_machine.builder import build_corpus, plan_shards
+from joke_machine.corpus import PackedCorpus
+from joke_machine.delivery import split_joke
+
+
+@pytest.fixture
+def dump(tmp_path):
+    """Write a text dump with duplicates, blank and short lines"""
+    path = tmp_path / "dump.txt"
+    lines = [f"Joke number {i}? Punchline {i}." for i in range(50)]
+    lines += [
+        "",
+        "short",
+        "JOKE number 3?  Punchline 3!",
+        "Why did the code fail? A bug.",
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def corpus_contents(path):
+    """Return every joke of a packed corpus by category"""
+    with PackedCorpus(str(path)) as corpus:
+        return {
+            name: [corpus.text(i) for i in range(*corpus.spans[name])]
+            for name in corpus.categories
+        }
+
+
+def test_build_corpus_dedupes_and_classifies(dump, tmp_path):
+    """Test normalization, exact deduplication and keyword classification"""
+    output = tmp_path / "jokes.jpk"
+    stats = build_corpus([str(dump)], str(output), jobs=1, facts=["A fact"])
+
+    assert stats["read"] == 54
+    assert stats["duplicates"] == 1
+    assert stats["skipped"] == 2
+    assert stats["categories"] == {"misc": 50, "programming": 1}
+    jokes = corpus_contents(output)
+    assert jokes["programming"] == ["Why did the code fail? A bug."]
+    assert jokes["misc"][3] == "Joke number 3? Punchline 3."
+
+
+@pytest.mark.parametrize("shard_size, jobs", [(7, 1), (64, 2)])
+def test_shards_match_single_pass(dump, tmp_path, shard_size, jobs):
+    """Test that any shard size and worker count gives the same corpus"""
+    single = tmp_path / "single.jpk"
+    sharded = tmp_path / "sharded.jpk"
+    build_corpus([str(dump)], str(single), jobs=1, facts=[])
+    stats = build_corpus(
+        [str(dump)], str(sharded), jobs=jobs, facts=[], shard_size=shard_size
+    )
+
+    assert len(plan_shards([str(dump)], shard_size)) > 1
+    assert stats["duplicates"] == 1
+    assert corpus_contents(sharded) == corpus_contents(single)
+
+
+def test_csv_input_with_categories(tmp_path):
+    """Test CSV dumps with a category column and quoted fields"""
+    path = tmp_path / "dump.csv"
+    path.write_text(
+        "id,Category,Joke\n"
+        '1,Puns,"I used to be a banker, but I lost interest."\n'
+        "2,,My computer sings. It's a Dell.\n"
+        '3,puns,"I used to be a banker,  but I lost interest!"\n',
+        encoding="utf-8",
+    )
+    output = tmp_path / "jokes.jpk"
+    stats = build_corpus([str(path)], str(output), jobs=1, shard_size=40)
+
+    assert stats["duplicates"] == 1
+    assert corpus_contents(output) == {
+        "puns": ["I used to be a banker, but I lost interest."],
+        "programming": ["My computer sings. It's a Dell."],
+    }
+
+
+def test_splits_are_stored(dump, tmp_path):
+    """Test that the stored splits match the splitter"""
+    output = tmp_path / "jokes.jpk"
+    build_corpus([str(dump)], str(output), jobs=1)
+
+    with PackedCorpus(str(output)) as corpus:
+        for index in range(len(corpus)):
+            assert corpus.parts(index) == split_joke(corpus.text(index))
+
+
+def test_cli_build_corpus(dump, tmp_path, capsys):
+    """Test the build-corpus subcommand"""
+    output = tmp_path / "jokes.jpk"
+    argv = ["joke_machine", "build-corpus", str(dump), "-o", str(output), "-j", "1"]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    assert "kept 51 jokes" in capsys.readouterr().out
+    assert output.exists()
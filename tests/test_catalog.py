@@ -0,0 +1,118 @@
+from collections import Counter
+from unittest.mock import patch
+
+from joke_machine.app import _is_dad_joke, get_catalog, get_joke
+from joke_machine.catalog import JokeCatalog
+
+
+def test_catalog_flattens_in_category_order(mock_jokes):
+    """Test that the flat index lists every joke with its category tag"""
+    catalog = JokeCatalog(mock_jokes)
+
+    assert catalog.texts == mock_jokes["test"] + mock_jokes["programming"]
+    assert catalog.tags == ["test"] * 3 + ["programming"]
+
+
+def test_catalog_records(mock_jokes):
+    """Test O(1) record lookups backed by the parallel arrays"""
+    catalog = JokeCatalog(mock_jokes)
+
+    joke = catalog.find("Test joke 2?With a punchline")
+    assert joke.category == "test"
+    assert joke.category_id == 0
+    assert joke.hash == hash(joke.text)
+    assert joke.parts == ("Test joke 2?", "With a punchline")
+    assert catalog.find("Test joke 1").parts == ("Test joke 1", None)
+    assert catalog.find("Not a joke") is None
+
+    assert catalog.categories == ["test", "programming"]
+    assert list(catalog.category_ids) == [0, 0, 0, 1]
+    assert catalog.category_ids.itemsize == 1
+    assert catalog.category_of(mock_jokes["programming"][0]) == "programming"
+
+
+def test_catalog_records_follow_changes(mock_jokes):
+    """Test that lookups see jokes added after the first lookup"""
+    catalog = JokeCatalog(mock_jokes)
+    assert catalog.category_of("Fresh pun") is None
+
+    mock_jokes["puns"] = ["Fresh pun"]
+
+    assert catalog.category_of("Fresh pun") == "puns"
+    assert catalog.position("Fresh pun") == 4
+
+
+def test_is_dad_joke_uses_catalog():
+    """Test the dad joke check without a category"""
+    jokes = {"dad": ["Dad joke"], "puns": ["Pun"]}
+
+    with patch("joke_machine.app.JOKES", jokes):
+        assert _is_dad_joke("Dad joke")
+        assert not _is_dad_joke("Pun")
+        assert not _is_dad_joke("Dad joke", category="puns")
+        assert _is_dad_joke("Anything", category="dad")
+
+
+def test_catalog_is_built_once(mock_jokes):
+    """Test that repeated access reuses the same flat index"""
+    catalog = JokeCatalog(mock_jokes)
+
+    assert catalog.texts is catalog.texts
+
+
+def test_catalog_rebuilds_when_categories_change(mock_jokes):
+    """Test that adding categories or jokes invalidates the index"""
+    catalog = JokeCatalog(mock_jokes)
+    assert len(catalog) == 4
+
+    mock_jokes["puns"] = ["New pun"]
+    assert catalog.texts[-1] == "New pun"
+    assert catalog.tags[-1] == "puns"
+
+    mock_jokes["test"].append("Test joke 4")
+    assert len(catalog) == 6
+
+    del mock_jokes["programming"]
+    assert "programming" not in catalog.tags
+
+
+def test_catalog_invalidate_picks_up_in_place_edits(mock_jokes):
+    """Test that invalidate() forces a rebuild after same-length edits"""
+    catalog = JokeCatalog(mock_jokes)
+    assert catalog.texts[0] == "Test joke 1"
+    mock_jokes["test"][0] = "Edited joke"
+
+    catalog.invalidate()
+
+    assert catalog.texts[0] == "Edited joke"
+
+
+def test_get_catalog_follows_patched_jokes(mock_jokes):
+    """Test that the shared catalog tracks a replaced JOKES dict"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        assert get_catalog().texts == mock_jokes["test"] + mock_jokes["programming"]
+
+
+@patch("random.choice")
+def test_get_joke_draws_from_flat_index(mock_choice, mock_jokes):
+    """Test that uncategorized draws sample the cached flat index"""
+    mock_choice.side_effect = lambda seq: seq[0]
+
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        get_joke()
+        get_joke()
+
+    first, second = (call.args[0] for call in mock_choice.call_args_list)
+    assert first is second
+
+
+def test_get_joke_distribution_is_uniform(mock_jokes):
+    """Test that every joke is equally likely without a category"""
+    import random
+
+    random.seed(0)
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        counts = Counter(get_joke() for _ in range(4000))
+
+    assert set(counts) == set(mock_jokes["test"] + mock_jokes["programming"])
+    assert all(800 < count < 1200 for count in counts.values())
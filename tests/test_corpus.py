@@ -0,0 +1,170 @@
+import json
+import os
+import random
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine import app
+from joke_machine.corpus import (
+    _HEADER_SIZE,
+    MAGIC,
+    CorpusFormatError,
+    PackedCorpus,
+    compile_corpus,
+    open_corpus,
+    write_packed_corpus,
+)
+
+
+@pytest.fixture
+def packed_corpus(tmp_path, mock_jokes, mock_facts):
+    """Write the mock jokes and facts to a packed corpus file"""
+    path = tmp_path / "corpus.jpk"
+    write_packed_corpus(str(path), mock_jokes, mock_facts)
+    with PackedCorpus(str(path)) as corpus:
+        yield corpus
+
+
+@pytest.fixture
+def active_corpus(packed_corpus):
+    """Serve jokes from the packed corpus for the duration of a test"""
+    previous = app.use_corpus(packed_corpus)
+    yield packed_corpus
+    app.use_corpus(previous)
+
+
+def test_packed_corpus_round_trip(packed_corpus, mock_jokes, mock_facts):
+    """Test that every record decodes back to the original text"""
+    records = mock_jokes["test"] + mock_jokes["programming"] + mock_facts
+
+    assert [packed_corpus.text(i) for i in range(len(records))] == records
+    assert packed_corpus.categories == ["test", "programming"]
+    assert packed_corpus.count("test") == 3
+    assert packed_corpus.count("missing") == 0
+    assert len(packed_corpus) == 4
+
+
+def test_packed_corpus_unicode(tmp_path):
+    """Test that non-ASCII records keep their byte boundaries"""
+    path = str(tmp_path / "corpus.jpk")
+    write_packed_corpus(path, {"puns": ["Café? Olé!", "naïve ☕"]})
+
+    with PackedCorpus(path) as corpus:
+        assert [corpus.text(0), corpus.text(1)] == ["Café? Olé!", "naïve ☕"]
+        with pytest.raises(IndexError):
+            corpus.text(2)
+
+
+def test_packed_corpus_draws(packed_corpus, mock_jokes, mock_facts):
+    """Test random draws by category and across categories"""
+    rng = random.Random(0)
+
+    assert packed_corpus.get_joke("programming", rng) in mock_jokes["programming"]
+    jokes = {packed_corpus.get_joke(rng=rng) for _ in range(200)}
+    assert jokes == set(mock_jokes["test"] + mock_jokes["programming"])
+    assert packed_corpus.get_fun_fact(rng) in mock_facts
+
+
+def test_packed_corpus_empty_facts(tmp_path):
+    """Test that drawing from an empty section raises like random.choice"""
+    path = str(tmp_path / "corpus.jpk")
+    write_packed_corpus(path, {"dad": ["Joke"]})
+
+    with PackedCorpus(path) as corpus, pytest.raises(IndexError):
+        corpus.get_fun_fact()
+
+
+@pytest.mark.parametrize("content", [b"", b"not a corpus file"])
+def test_packed_corpus_rejects_other_files(tmp_path, content):
+    """Test that invalid files are reported clearly"""
+    path = tmp_path / "corpus.jpk"
+    path.write_bytes(content)
+
+    with pytest.raises(CorpusFormatError):
+        PackedCorpus(str(path))
+
+
+def test_packed_corpus_rejects_damaged_headers(packed_corpus, tmp_path):
+    """Test that truncated or garbled headers raise CorpusFormatError"""
+    content = open(packed_corpus.path, "rb").read()
+    header_end = len(MAGIC) + _HEADER_SIZE.size
+    header_end += _HEADER_SIZE.unpack_from(content, len(MAGIC))[0]
+    damaged = [
+        content[: len(MAGIC) + 1],  # cut inside the header size
+        content[: header_end - 5],  # cut inside the JSON header
+        content[:header_end],  # cut before the offsets
+        content.replace(b'"count"', b'"c0unt"', 1),
+    ]
+    for i, data in enumerate(damaged):
+        path = tmp_path / f"damaged-{i}.jpk"
+        path.write_bytes(data)
+        with pytest.raises(CorpusFormatError):
+            PackedCorpus(str(path))
+
+
+def test_app_serves_from_corpus(active_corpus, mock_jokes, mock_facts):
+    """Test that the app API draws from the active corpus"""
+    assert app.get_joke("test") in mock_jokes["test"]
+    assert app.get_fun_fact() in mock_facts
+    assert set(app.get_jokes(20, category="programming")) == set(
+        mock_jokes["programming"]
+    )
+    assert sorted(app.get_fun_facts(2, unique=True)) == sorted(mock_facts)
+    assert app.get_categories() == {"test": 3, "programming": 1}
+
+
+@patch("time.sleep")
+def test_main_with_corpus(mock_sleep, packed_corpus, capsys):
+    """Test the --corpus command-line option"""
+    argv = ["joke_machine", "--corpus", packed_corpus.path, "--category", "test"]
+    with patch.object(sys, "argv", argv):
+        try:
+            app.main()
+        finally:
+            app.use_corpus(None).close()
+
+    assert "Test joke" in capsys.readouterr().out
+
+
+def test_main_rejects_unknown_category(capsys):
+    """Test that unknown categories are rejected by the parser"""
+    with patch.object(sys, "argv", ["joke_machine", "--category", "nope"]):
+        with pytest.raises(SystemExit):
+            app.main()
+
+    assert "invalid choice: 'nope'" in capsys.readouterr().err
+
+
+def test_json_corpus_is_compiled_once(tmp_path, monkeypatch, mock_jokes):
+    """Test that a JSON corpus is cached and rebuilt only when it changes"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    source = tmp_path / "jokes.json"
+    source.write_text(json.dumps(mock_jokes))
+
+    with open_corpus(str(source), ["A fact"], "1.0") as corpus:
+        assert corpus.categories == list(mock_jokes)
+        cached = corpus.path
+    assert os.path.dirname(cached) == str(tmp_path / "cache" / "joke_machine")
+
+    with patch("joke_machine.corpus.write_packed_corpus") as mock_write:
+        with open_corpus(str(source), ["A fact"], "1.0") as corpus:
+            assert corpus.get_fun_fact() == "A fact"
+    mock_write.assert_not_called()
+
+    source.write_text(json.dumps({"new": ["Fresh joke"]}))
+    os.utime(source, ns=(0, 10**9))
+    with open_corpus(str(source), ["A fact"], "1.0") as corpus:
+        assert corpus.categories == ["new"]
+    with open_corpus(str(source), ["A fact"], "2.0") as corpus:
+        assert corpus.meta["version"] == "2.0"
+
+
+def test_json_corpus_format_errors(tmp_path):
+    """Test that malformed JSON corpora are reported clearly"""
+    source = tmp_path / "jokes.json"
+    source.write_text('{"dad": "not a list"}')
+
+    with pytest.raises(CorpusFormatError, match="list of joke strings"):
+        compile_corpus(str(source), directory=str(tmp_path))
@@ -0,0 +1,89 @@
+import json
+import zlib
+
+from joke_machine.dedup import (
+    MinHasher,
+    dedupe_corpus,
+    jaccard,
+    main,
+    normalize_joke,
+    shingles,
+)
+
+
+def test_exact_duplicates_ignore_case_and_punctuation():
+    """Test that normalized copies are removed and the first one is kept"""
+    corpus = {
+        "dad": ["Why did the scarecrow win? He was outstanding!"],
+        "puns": ["why did the SCARECROW win -- he was outstanding", "A new pun."],
+    }
+
+    clean, report = dedupe_corpus(corpus, near=False)
+
+    assert clean == {"dad": corpus["dad"], "puns": ["A new pun."]}
+    assert report.exact_count == 1
+    assert report.removed_by_category == {"puns": 1}
+    assert report.exact[0][2:] == ("dad", corpus["dad"][0])
+
+
+def test_near_duplicates_are_removed():
+    """Test that small edits are caught and distinct jokes survive"""
+    original = "I used to be a banker but I lost interest in the whole thing"
+    corpus = {
+        "a": [original, "Time flies like an arrow and fruit flies like a banana"],
+        "b": [original + " entirely", "I used to be a baker but I lost my dough"],
+    }
+
+    clean, report = dedupe_corpus(corpus)
+
+    assert clean["b"] == ["I used to be a baker but I lost my dough"]
+    assert report.near_count == 1
+    assert report.near[0][4] >= 0.8
+    assert "Near duplicates:" in report.format()
+
+
+def test_minhash_agreement_tracks_jaccard():
+    """Test that signature agreement estimates the Jaccard similarity"""
+    hasher = MinHasher(num_perm=32)
+    estimates = []
+    for trial in range(300):
+        base = [zlib.crc32(f"{trial}-{i}".encode()) for i in range(26)]
+        # 14 shared out of 26 hashes in total
+        a, b = set(base[:20]), set(base[6:])
+        signatures = zip(hasher.signature(a), hasher.signature(b))
+        estimates.append(sum(x == y for x, y in signatures) / 32)
+
+    assert jaccard(a, b) == 14 / 26
+    assert abs(sum(estimates) / len(estimates) - 14 / 26) < 0.03
+
+
+def test_dedupe_scales_linearly():
+    """Test a large corpus of similar-looking jokes without false positives"""
+    jokes = {
+        "gen": [
+            f"Why did robot {i} cross the road? To reboot {i}." for i in range(20_000)
+        ]
+    }
+
+    clean, report = dedupe_corpus(jokes)
+
+    assert len(clean["gen"]) == 20_000
+    assert report.near_count == 0
+
+
+def test_shingles_of_short_jokes():
+    """Test that one-word jokes still get a shingle"""
+    assert len(shingles(normalize_joke("Boo!"))) == 1
+
+
+def test_main_writes_clean_corpus(tmp_path, capsys):
+    """Test the command-line entry point"""
+    first, second = tmp_path / "a.json", tmp_path / "b.json"
+    first.write_text(json.dumps({"dad": ["Hi dad!"]}))
+    second.write_text(json.dumps({"dad": ["hi, dad"], "puns": ["A pun"]}))
+    output = tmp_path / "clean.json"
+
+    main([str(first), str(second), "-o", str(output)])
+
+    assert json.loads(output.read_text()) == {"dad": ["Hi dad!"], "puns": ["A pun"]}
+    assert "Read 3 jokes, kept 2." in capsys.readouterr().out
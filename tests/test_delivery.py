@@ -0,0 +1,146 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine.app import _tell_joke, deliver_joke
+from joke_machine.catalog import JokeCatalog
+from joke_machine.delivery import deliver, plan_delivery, split_joke, tell
+
+
+@pytest.mark.parametrize(
+    "joke, texts",
+    [
+        ("Why? Because.", ["Why?", " Because."]),
+        ("One. Two. Three.", ["One.", "Two. Three."]),
+        ("Simple joke", ["Simple joke"]),
+    ],
+)
+def test_plan_delivery_matches_sync_split(joke, texts):
+    """Test that planned lines match the classic delivery"""
+    assert [event.text for event in plan_delivery(joke)] == texts
+
+
+@pytest.mark.parametrize(
+    "joke, parts",
+    [
+        ("Why?! Because.", ("Why?!", " Because.")),
+        (
+            "Mr. Smith sat down. The chair broke.",
+            ("Mr. Smith sat down.", "The chair broke."),
+        ),
+        ("Wait for it... Gotcha.", ("Wait for it...", "Gotcha.")),
+        ("Wait for it\u2026 Gotcha.", ("Wait for it\u2026", "Gotcha.")),
+        ('He said "Stop." Then left.', ('He said "Stop."', "Then left.")),
+        ("A riddle. What has keys?", ("A riddle.", "What has keys?")),
+        ("What has keys?", ("What has keys?", None)),
+        ("Version 3.14 is out", ("Version 3.14 is out", None)),
+        ("He said no. She cried.", ("He said no.", "She cried.")),
+        ("Room no. 5 was haunted. Boo.", ("Room no. 5 was haunted.", "Boo.")),
+    ],
+)
+def test_split_joke_rules(joke, parts):
+    """Test break points the old heuristic got wrong"""
+    assert split_joke(joke) == parts
+
+
+def test_split_joke_interns_and_caches():
+    """Test that splits are cached and share interned strings"""
+    split_joke.cache_clear()
+    first = split_joke("Knock knock? " + "Who's there?")
+    second = split_joke("Knock knock? Who's there?")
+
+    assert first is second
+    assert split_joke.cache_info().hits == 1
+    assert first[0] is split_joke("Knock knock? Nobody.")[0]
+
+
+def test_catalog_splits_are_precomputed():
+    """Test that catalog jokes are split once and looked up afterwards"""
+    catalog = JokeCatalog({"a": ["One. Two.", "Three? Four"]})
+    split_joke.cache_clear()
+
+    assert catalog.split("One. Two.") == ("One.", "Two.")
+    assert catalog.split("Three? Four") == ("Three?", " Four")
+    assert split_joke.cache_info().currsize == 0
+
+    catalog.source["a"].append("Five. Six.")
+    assert catalog.find("Five. Six.").parts == ("Five.", "Six.")
+
+
+def test_plan_delivery_uses_given_parts():
+    """Test that a precomputed split is used as is"""
+    events = plan_delivery("ignored", 0.5, parts=("Set", "Punch"))
+
+    assert [event.text for event in events] == ["Set", "Punch"]
+
+
+def test_plan_delivery_pauses():
+    """Test that only the punchline and the response are delayed"""
+    events = plan_delivery("Setup? Punchline", 0.3, response="*groans*")
+
+    assert [(event.kind, event.pause) for event in events] == [
+        ("setup", 0),
+        ("punchline", 0.3),
+        ("response", 1),
+    ]
+
+
+def test_deliver_yields_events_in_order():
+    """Test the async generator delivery"""
+
+    async def collect():
+        return [event.kind async for event in deliver("A? B", 0.01, "*sigh*")]
+
+    assert asyncio.run(collect()) == ["setup", "punchline", "response"]
+
+
+def test_tell_writes_lines():
+    """Test that tell() writes each line through the given callable"""
+    lines = []
+
+    asyncio.run(tell("Setup. Punchline.", delay=0, write=lines.append))
+
+    assert lines == ["Setup.", "Punchline."]
+
+
+def test_concurrent_deliveries_share_one_loop(sleep_tracker):
+    """Test that thousands of deliveries overlap instead of queueing"""
+    sleeps = sleep_tracker(5000)
+
+    async def run_all():
+        async def one():
+            return [event async for event in deliver("Setup? Punchline", 0.2)]
+
+        return await asyncio.gather(*(one() for _ in range(5000)))
+
+    results = asyncio.run(run_all())
+
+    assert sleeps.peak == 5000
+    assert all(len(events) == 2 for events in results)
+
+
+@patch("time.sleep")
+def test_deliver_joke_adds_dad_response(mock_sleep):
+    """Test that dad jokes get a response event without sleeping"""
+    jokes = {"dad": ["Why don't eggs tell jokes? They'd crack each other up."]}
+
+    async def collect():
+        return [event async for event in deliver_joke("dad", delay=0)]
+
+    with patch("joke_machine.app.JOKES", jokes):
+        with patch("joke_machine.delivery.RESPONSE_DELAY", 0):
+            events = asyncio.run(collect())
+
+    assert [event.kind for event in events] == ["setup", "punchline", "response"]
+    mock_sleep.assert_not_called()
+
+
+@patch("time.sleep")
+def test_tell_joke_sync_wrapper(mock_sleep, capsys):
+    """Test that the command-line delivery sleeps through the same plan"""
+    with patch("joke_machine.app.JOKES", {"dad": ["Setup? Punchline"]}):
+        _tell_joke("dad")
+
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [1.5, 1]
+    assert "Setup?" in capsys.readouterr().out
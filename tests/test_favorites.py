@@ -1,9 +1,16 @@
 import json
 import os
+import subprocess
+import sys
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 # Import functions from the joke_machine module
-from joke_machine.app import list_favorites, save_favorite
+from joke_machine.app import compact_favorites, list_favorites, save_favorite
+from joke_machine.favorites import FavoritesLog
 
 
 def test_save_favorite_new_file(favorites_path_patch, capsys):
@@ -20,8 +27,7 @@ def test_save_favorite_new_file(favorites_path_patch, capsys):
     # Verify file was created with correct content
     assert os.path.exists(favorites_path_patch)
 
-    with open(favorites_path_patch) as f:
-        data = json.load(f)
+    data = list(FavoritesLog(favorites_path_patch))
 
     assert len(data) == 1
     assert data[0]["joke"] == "This is a new favorite joke"
@@ -42,8 +48,7 @@ def test_save_favorite_append(setup_favorites_file, capsys):
         save_favorite(joke)
 
     # Verify joke was appended
-    with open(setup_favorites_file) as f:
-        data = json.load(f)
+    data = list(FavoritesLog(setup_favorites_file))
 
     assert len(data) == 3  # Original 2 + new one
     assert data[2]["joke"] == "Another favorite joke"
@@ -67,9 +72,8 @@ def test_save_favorite_corrupted_file(favorites_path_patch, capsys):
 
         save_favorite(joke)
 
-    # Verify file was fixed and has the new joke
-    with open(favorites_path_patch) as f:
-        data = json.load(f)
+    # Verify the new joke is the only readable entry
+    data = list(FavoritesLog(favorites_path_patch))
 
     assert len(data) == 1
     assert data[0]["joke"] == "Joke to save after corruption"
@@ -89,3 +93,193 @@ def test_list_favorites_corrupted_file(favorites_path_patch, capsys):
     captured = capsys.readouterr()
     assert "Error reading favorites file" in captured.out
     assert "corrupted" in captured.out
+
+
+def test_save_favorite_migrates_legacy_file(setup_favorites_file, sample_favorites):
+    """Test that a legacy JSON array file is converted to JSON Lines"""
+    save_favorite("Migrated joke")
+
+    with open(setup_favorites_file) as f:
+        lines = [json.loads(line) for line in f]
+
+    assert lines[:2] == sample_favorites
+    assert lines[2]["joke"] == "Migrated joke"
+
+
+def test_save_favorite_only_appends(favorites_path_patch):
+    """Test that saving leaves existing bytes untouched"""
+    save_favorite("First joke")
+    with open(favorites_path_patch, "rb") as f:
+        before = f.read()
+
+    save_favorite("Second joke")
+
+    with open(favorites_path_patch, "rb") as f:
+        after = f.read()
+    assert after.startswith(before)
+    assert after.count(b"\n") == 2
+
+
+def test_save_favorite_after_torn_write(favorites_path_patch):
+    """Test that a line cut short by a crash does not swallow the next save"""
+    with open(favorites_path_patch, "w") as f:
+        f.write(
+            '{"joke": "Complete", "saved_at": "2023-01-01 12:00:00"}\n{"joke": "Cut'
+        )
+
+    save_favorite("After crash")
+
+    log = FavoritesLog(favorites_path_patch)
+    assert [entry["joke"] for entry in log] == ["Complete", "After crash"]
+    assert log.skipped == 1
+
+
+def test_save_favorite_corrupted_legacy_file(favorites_path_patch):
+    """Test that an unreadable legacy file is kept aside, not overwritten"""
+    with open(favorites_path_patch, "w") as f:
+        f.write('[{"joke": "Lost')
+
+    save_favorite("Fresh start")
+
+    assert [entry["joke"] for entry in FavoritesLog(favorites_path_patch)] == [
+        "Fresh start"
+    ]
+    with open(favorites_path_patch + ".corrupt") as f:
+        assert f.read() == '[{"joke": "Lost'
+    os.unlink(favorites_path_patch + ".corrupt")
+
+
+def test_list_favorites_skips_unreadable_lines(favorites_path_patch, capsys):
+    """Test that readable entries are listed around a damaged line"""
+    with open(favorites_path_patch, "w") as f:
+        f.write('{"joke": "Good joke", "saved_at": "2023-01-01 12:00:00"}\n')
+        f.write("garbage\n")
+
+    list_favorites()
+
+    captured = capsys.readouterr()
+    assert "1. Good joke" in captured.out
+    assert "Skipped 1 unreadable entries" in captured.out
+
+
+def test_compact_favorites(favorites_path_patch, capsys):
+    """Test that compaction drops unreadable lines and keeps the rest"""
+    with open(favorites_path_patch, "w") as f:
+        f.write('{"joke": "Keep me", "saved_at": "2023-01-01 12:00:00"}\n')
+        f.write("garbage\n\n")
+        f.write('{"joke": "Me too", "saved_at": "2023-01-02 12:00:00"}')
+
+    compact_favorites()
+
+    captured = capsys.readouterr()
+    assert "kept 2, dropped 1" in captured.out
+    with open(favorites_path_patch) as f:
+        assert [json.loads(line)["joke"] for line in f] == ["Keep me", "Me too"]
+
+
+STRESS_WRITER = """
+import sys, threading
+from joke_machine.favorites import FavoritesLog
+
+path, worker, threads, saves = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+
+def save(thread):
+    for i in range(saves):
+        FavoritesLog(path).append(f"{worker}-{thread}-{i}", "2023-01-01 12:00:00")
+
+workers = [threading.Thread(target=save, args=(t,)) for t in range(threads)]
+for w in workers:
+    w.start()
+for w in workers:
+    w.join()
+"""
+
+STRESS_COMPACTOR = """
+import sys
+from joke_machine.favorites import FavoritesLog
+
+for _ in range(int(sys.argv[2])):
+    FavoritesLog(sys.argv[1]).compact()
+"""
+
+
+def test_concurrent_saves_are_not_lost(tmp_path):
+    """Stress test: many processes and threads saving at once lose nothing"""
+    path = str(tmp_path / "favorites.json")
+    processes, threads, saves = 8, 4, 25
+    FavoritesLog(path).append("seed", "2023-01-01 12:00:00")
+
+    commands = [
+        [sys.executable, "-c", STRESS_WRITER, path, str(p), str(threads), str(saves)]
+        for p in range(processes)
+    ]
+    if os.name == "posix":
+        # Windows cannot replace a file another process has open
+        commands.append([sys.executable, "-c", STRESS_COMPACTOR, path, "20"])
+    running = [subprocess.Popen(command) for command in commands]
+    assert all(proc.wait(timeout=120) == 0 for proc in running)
+
+    log = FavoritesLog(path)
+    jokes = [entry["joke"] for entry in log]
+    expected = {
+        f"{p}-{t}-{i}"
+        for p in range(processes)
+        for t in range(threads)
+        for i in range(saves)
+    }
+    assert len(jokes) == len(expected) + 1
+    assert set(jokes) == expected | {"seed"}
+    assert log.skipped == 0
+
+
+def test_group_commit_batches_concurrent_threads(tmp_path):
+    """Test that threads saving at once share locked writes"""
+    path = str(tmp_path / "favorites.json")
+    log = FavoritesLog(path, fsync=False)
+    writes = []
+    original = log._write_batch
+
+    def slow_write(data):
+        writes.append(data.count(b"\n"))
+        time.sleep(0.05)
+        original(data)
+
+    barrier = threading.Barrier(16)
+
+    def save(i):
+        barrier.wait()
+        log.append(f"joke {i}", "2023-01-01 12:00:00")
+
+    workers = [threading.Thread(target=save, args=(i,)) for i in range(16)]
+    with patch.object(log, "_write_batch", slow_write):
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    assert sum(writes) == 16
+    assert len(writes) < 16
+    assert len(list(log)) == 16
+
+
+def test_group_commit_reports_errors_to_every_writer(tmp_path):
+    """Test that a failed batch raises in the saving thread"""
+    log = FavoritesLog(str(tmp_path / "missing-dir" / "favorites.json"))
+
+    with pytest.raises(OSError):
+        log.append("joke", "2023-01-01 12:00:00")
+
+
+def test_reader_ignores_write_in_progress(tmp_path):
+    """Test that bytes appended after a listing starts are not read"""
+    path = str(tmp_path / "favorites.json")
+    log = FavoritesLog(path)
+    log.append("First", "2023-01-01 12:00:00")
+
+    entries = iter(log)
+    assert next(entries)["joke"] == "First"
+    with open(path, "ab") as f:
+        f.write(b'{"joke": "Half wri')
+
+    assert list(entries) == []
+    assert log.skipped == 0
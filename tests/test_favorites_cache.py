@@ -0,0 +1,180 @@
+import sqlite3
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine.app import main, open_favorites_store
+from joke_machine.favorites import FavoritesLog
+from joke_machine.favorites_cache import CachedFavorites, parse_durability
+
+
+def jokes(store):
+    """Return the jokes of a favorites store"""
+    return [entry["joke"] for entry in store]
+
+
+def test_saves_are_batched(tmp_path):
+    """Test that saves stay in memory until flushed"""
+    path = tmp_path / "favorites.json"
+    with CachedFavorites(str(path), "exit") as cache:
+        for i in range(3):
+            cache.append(f"Joke {i}", "2023-01-01 12:00:00")
+        assert not path.exists()
+        assert jokes(cache.query(limit=1, offset=1)) == ["Joke 1"]
+        assert cache.exists() and len(cache) == 3
+
+        assert cache.flush() == 3
+        assert cache.flush() == 0
+        assert jokes(FavoritesLog(str(path))) == ["Joke 0", "Joke 1", "Joke 2"]
+
+
+def test_close_flushes(tmp_path):
+    """Test that pending saves are written when the cache is closed"""
+    path = tmp_path / "favorites.json"
+    cache = CachedFavorites(str(path), "exit")
+    cache.append("A joke", "2023-01-01 12:00:00")
+    cache.close()
+
+    assert jokes(FavoritesLog(str(path))) == ["A joke"]
+
+
+def test_flush_always(tmp_path):
+    """Test that every save is written before it returns"""
+    path = tmp_path / "favorites.json"
+    with CachedFavorites(str(path), "always") as cache:
+        cache.append("A joke", "2023-01-01 12:00:00")
+        assert jokes(FavoritesLog(str(path))) == ["A joke"]
+
+
+def test_flush_interval(tmp_path):
+    """Test that a background thread writes pending saves"""
+    path = tmp_path / "favorites.json"
+    with CachedFavorites(str(path), "10ms") as cache:
+        cache.append("A joke", "2023-01-01 12:00:00")
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert jokes(FavoritesLog(str(path))) == ["A joke"]
+
+
+def test_reloads_changes_from_other_processes(tmp_path):
+    """Test that a file changed behind the cache's back is read again"""
+    path = str(tmp_path / "favorites.json")
+    other = FavoritesLog(path)
+    other.append("Theirs 1", "2023-01-01 12:00:00")
+    with CachedFavorites(path, "exit") as cache:
+        assert jokes(cache) == ["Theirs 1"]
+        cache.append("Mine", "2023-01-02 12:00:00")
+        other.append("Theirs 2", "2023-01-03 12:00:00")
+
+        assert jokes(cache) == ["Theirs 1", "Theirs 2", "Mine"]
+        cache.flush()
+        assert jokes(cache) == ["Theirs 1", "Theirs 2", "Mine"]
+    assert jokes(other) == ["Theirs 1", "Theirs 2", "Mine"]
+
+
+def test_reload_during_flush_keeps_saves(tmp_path):
+    """Test that saves being written survive a reload made meanwhile"""
+    path = str(tmp_path / "favorites.json")
+    other = FavoritesLog(path)
+    writing, reloaded = threading.Event(), threading.Event()
+    real_extend = FavoritesLog.extend
+
+    def slow_extend(self, entries):
+        writing.set()
+        reloaded.wait(5)
+        return real_extend(self, entries)
+
+    with CachedFavorites(path, "exit") as cache:
+        cache.append("Mine", "2023-01-01 12:00:00")
+        with patch.object(FavoritesLog, "extend", slow_extend):
+            flusher = threading.Thread(target=cache.flush)
+            flusher.start()
+            writing.wait(5)
+            real_extend(other, [{"joke": "Theirs", "saved_at": "2023-01-02"}])
+            assert jokes(cache) == ["Theirs", "Mine"]
+            reloaded.set()
+            flusher.join()
+
+        assert jokes(cache) == ["Theirs", "Mine"]
+    assert jokes(other) == ["Theirs", "Mine"]
+
+
+def test_sqlite_duplicates_are_ignored(tmp_path):
+    """Test that a cached SQLite store ignores duplicates like the store does"""
+    with CachedFavorites(str(tmp_path / "favorites.db"), "exit") as cache:
+        assert cache.append("A joke", "2023-01-01 12:00:00")
+        assert cache.append("a  JOKE", "2023-01-02 12:00:00") is None
+        assert cache.flush() == 1
+        assert len(cache) == 1
+
+
+def test_parse_durability_errors():
+    """Test that unknown durability settings are rejected"""
+    with pytest.raises(ValueError, match="like '250ms'"):
+        parse_durability("sometimes")
+    with pytest.raises(ValueError, match="negative"):
+        parse_durability("-5ms")
+
+
+@patch("time.sleep")
+def test_interactive_favorites_cache(mock_sleep, tmp_path, monkeypatch, capsys):
+    """Test that --favorites-cache keeps saves in memory until exit"""
+    path = tmp_path / "favorites.json"
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES", str(path))
+
+    def answer(prompt):
+        written.append(path.exists())
+        return script.pop(0)
+
+    script, written = ["joke", "save", "favorites", "quit"], []
+    argv = ["joke_machine", "--interactive", "--favorites-cache", "exit"]
+    with patch("builtins.input", side_effect=answer):
+        with patch.object(sys, "argv", argv):
+            main()
+
+    assert written == [False] * 4
+    assert "=== Your Favorite Jokes ===" in capsys.readouterr().out
+    assert len(jokes(FavoritesLog(str(path)))) == 1
+    assert isinstance(open_favorites_store(), FavoritesLog)
+
+
+def test_failed_flush_keeps_saves(tmp_path):
+    """Test that saves are kept when the store cannot be opened"""
+    path = tmp_path / "favorites.json"
+    cache = CachedFavorites(str(path), "exit")
+    cache.append("A joke", "2023-01-01 12:00:00")
+    with patch(
+        "joke_machine.favorites_cache.open_favorites", side_effect=PermissionError
+    ):
+        with pytest.raises(PermissionError):
+            cache.flush()
+    cache.close()
+
+    assert jokes(FavoritesLog(str(path))) == ["A joke"]
+
+
+def test_flush_thread_survives_errors(tmp_path, caplog):
+    """Test that a locked database does not stop the background flushes"""
+    path = tmp_path / "favorites.json"
+    failures = [sqlite3.OperationalError("database is locked")]
+    real_extend = FavoritesLog.extend
+
+    def flaky_extend(self, entries):
+        if failures:
+            raise failures.pop()
+        return real_extend(self, entries)
+
+    with patch.object(FavoritesLog, "extend", flaky_extend):
+        with CachedFavorites(str(path), "10ms") as cache:
+            cache.append("A joke", "2023-01-01 12:00:00")
+            deadline = time.monotonic() + 5
+            while not path.exists() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert cache._thread.is_alive()
+
+    assert jokes(FavoritesLog(str(path))) == ["A joke"]
+    assert "Could not write favorites" in caplog.text
@@ -0,0 +1,236 @@
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine.app import import_favorites, list_favorites, main, save_favorite
+from joke_machine.favorites import FavoritesLog, open_favorites
+from joke_machine.favorites_db import ShardedFavorites, SQLiteFavorites, shard_of
+
+
+@pytest.fixture
+def store(tmp_path):
+    """An SQLite favorites store with a few entries"""
+    with SQLiteFavorites(str(tmp_path / "favorites.db")) as store:
+        store.append("Why did the chicken cross the road?", "2023-01-01 12:00:00")
+        store.append("A pun about dough", "2023-01-02 12:00:00")
+        store.append("Another chicken joke", "2023-01-03 12:00:00")
+        yield store
+
+
+@pytest.fixture
+def sqlite_favorites(tmp_path, monkeypatch):
+    """Point the app at an SQLite favorites store"""
+    path = str(tmp_path / "favorites.db")
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES", path)
+    return path
+
+
+def test_open_favorites_picks_store_by_suffix(tmp_path):
+    """Test that database suffixes select the SQLite store"""
+    assert isinstance(open_favorites(str(tmp_path / "f.sqlite3")), SQLiteFavorites)
+    assert isinstance(open_favorites(str(tmp_path / "f.json")), FavoritesLog)
+
+
+def test_duplicates_are_ignored(store):
+    """Test that saving the same joke twice keeps one entry"""
+    assert store.append("a PUN about  dough ", "2023-02-01 12:00:00") is None
+    assert len(store) == 3
+
+
+def test_query_pagination(store):
+    """Test limit and offset in save order"""
+    jokes = [entry["joke"] for entry in store.query(limit=1, offset=1)]
+
+    assert jokes == ["A pun about dough"]
+    assert len(list(store.query(offset=2))) == 1
+
+
+def test_query_since(store):
+    """Test filtering by save date"""
+    jokes = [entry["joke"] for entry in store.query(since="2023-01-02")]
+
+    assert jokes == ["A pun about dough", "Another chicken joke"]
+
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_query_grep(store, fts):
+    """Test text search with and without the FTS index"""
+    store.has_fts = store.has_fts and fts
+
+    jokes = [entry["joke"] for entry in store.query(grep="CHICK")]
+    assert jokes == ["Why did the chicken cross the road?", "Another chicken joke"]
+    assert list(store.query(grep='"100%_')) == []
+
+
+def test_listing_uses_saved_at_index(store):
+    """Test that paging does not scan the whole table"""
+    plan = store.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT joke, saved_at FROM favorites "
+        "WHERE saved_at >= ? ORDER BY saved_at, id LIMIT 10",
+        ("2023-01-01",),
+    ).fetchall()
+
+    assert any("favorites_saved_at" in row[-1] for row in plan)
+
+
+def test_save_and_list_with_sqlite(sqlite_favorites, capsys):
+    """Test the app functions against the SQLite store"""
+    save_favorite("Database joke")
+    save_favorite("Database joke")
+    list_favorites(grep="database")
+
+    captured = capsys.readouterr()
+    assert "already in your favorites" in captured.out
+    assert "1. Database joke" in captured.out
+
+
+def test_import_favorites(sqlite_favorites, setup_favorites_file, capsys):
+    """Test the one-shot import from the JSON favorites file"""
+    with patch("os.path.expanduser", side_effect=lambda path: path):
+        import_favorites(setup_favorites_file)
+        import_favorites(setup_favorites_file)
+
+    captured = capsys.readouterr()
+    assert "Imported 2 favorites" in captured.out
+    assert "Imported 0 favorites" in captured.out
+    assert "2 duplicates skipped" in captured.out
+    with SQLiteFavorites(sqlite_favorites) as store:
+        assert [entry["joke"] for entry in store] == ["Test joke 1", "Test joke 2"]
+
+
+def test_import_favorites_needs_sqlite(favorites_path_patch, capsys):
+    """Test that importing into the JSON store is refused"""
+    import_favorites()
+
+    assert "needs the SQLite favorites store" in capsys.readouterr().out
+
+
+def test_favorites_flags(sqlite_favorites, capsys):
+    """Test --limit, --offset, --since and --grep on the command line"""
+    with SQLiteFavorites(sqlite_favorites) as store:
+        for day in range(1, 6):
+            store.append(f"Joke number {day}", f"2023-01-0{day} 12:00:00")
+
+    argv = ["joke_machine", "--favorites", "--since", "2023-01-02"]
+    argv += ["--grep", "number", "--limit", "2", "--offset", "1"]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    out = capsys.readouterr().out
+    assert "2. Joke number 3" in out
+    assert "3. Joke number 4" in out
+    assert "Joke number 5" not in out
+    assert "Joke number 2" not in out
+
+
+def test_favorites_flags_no_match(sqlite_favorites, capsys):
+    """Test the message when filters exclude everything"""
+    save_favorite("Only joke")
+    list_favorites(grep="missing")
+
+    assert "No favorites match your filters" in capsys.readouterr().out
+
+
+def test_jsonl_query_filters(favorites_path_patch):
+    """Test that the JSON Lines store supports the same filters"""
+    log = FavoritesLog(favorites_path_patch)
+    for day in range(1, 5):
+        log.append(f"Joke {day}", f"2023-01-0{day} 12:00:00")
+
+    entries = log.query(limit=2, offset=1, since="2023-01-02", grep="JOKE")
+    assert [entry["joke"] for entry in entries] == ["Joke 3", "Joke 4"]
+
+
+def test_sharded_users_are_separate(tmp_path):
+    """Test that users sharing a shard only see their own favorites"""
+    with ShardedFavorites(str(tmp_path), shards=1) as favorites:
+        alice, bob = favorites.user("alice"), favorites.user("bob")
+        assert alice.append("A joke", "2023-01-01 12:00:00")
+        assert alice.append("a JOKE", "2023-01-02 12:00:00") is None
+        assert bob.append("A joke", "2023-01-03 12:00:00")
+        assert bob.extend([{"joke": "Bob's joke", "saved_at": "2023-01-04"}]) == 1
+
+        assert [entry["joke"] for entry in alice] == ["A joke"]
+        assert [entry["joke"] for entry in bob.query(grep="BOB")] == ["Bob's joke"]
+        assert len(bob) == 2
+
+
+def test_sharded_handle_cache_is_bounded(tmp_path):
+    """Test that shards are spread out and only a few stay open"""
+    with ShardedFavorites(str(tmp_path), shards=8, max_open=2) as favorites:
+        for i in range(100):
+            favorites.user(f"user-{i}").append(f"Joke {i}", "2023-01-01")
+            assert len(favorites._open) <= 2
+
+        assert len(list(tmp_path.glob("favorites-*.db"))) == 8
+        assert [e["joke"] for e in favorites.user("user-7")] == ["Joke 7"]
+        assert not favorites.user("nobody").exists()
+
+
+def test_sharded_stores_are_thread_safe(tmp_path):
+    """Test concurrent saves through a cache smaller than the thread count"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def save(i):
+        return favorites.user(f"user-{i % 20}").append(f"Joke {i}", "2023-01-01")
+
+    with ShardedFavorites(str(tmp_path), shards=4, max_open=1) as favorites:
+        with ThreadPoolExecutor(8) as pool:
+            assert all(pool.map(save, range(200)))
+        assert sum(len(favorites.user(f"user-{i}")) for i in range(20)) == 200
+
+
+def test_user_flag(tmp_path, monkeypatch, mock_jokes, capsys):
+    """Test saving and listing favorites for a user from the command line"""
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES", str(tmp_path / "mine.json"))
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES_DIR", str(tmp_path / "users"))
+    argv = ["joke_machine", "-c", "test", "--save", "--no-delay", "--user", "ann"]
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch.object(sys, "argv", argv):
+            main()
+    list_favorites(pager=False)
+    list_favorites(pager=False, user="ann")
+
+    output = capsys.readouterr().out
+    assert "You haven't saved any favorites yet." in output
+    assert "1. Test joke" in output
+    assert not (tmp_path / "mine.json").exists()
+
+
+def test_sharded_eviction_does_not_block_other_shards(tmp_path):
+    """Test that evicting a busy shard only holds up the evicting thread"""
+    favorites = ShardedFavorites(str(tmp_path), shards=2, max_open=1)
+    user = next(f"user-{i}" for i in range(100) if shard_of(f"user-{i}", 2) == 1)
+    busy, done = threading.Event(), threading.Event()
+
+    def hold_shard_0():
+        with favorites.connection(0):
+            busy.set()
+            done.wait()
+
+    def open_shard_1():
+        with favorites.connection(1):
+            pass  # evicts shard 0 and waits for it to be released
+
+    holder = threading.Thread(target=hold_shard_0)
+    holder.start()
+    busy.wait()
+    evictor = threading.Thread(target=open_shard_1)
+    evictor.start()
+    while evictor.is_alive() and 1 not in favorites._open:
+        time.sleep(0.001)
+    saver = threading.Thread(target=favorites.user(user).append, args=("Joke", "2023"))
+    saver.start()
+    saver.join(10)
+    try:
+        assert not saver.is_alive()
+        assert evictor.is_alive()
+    finally:
+        done.set()
+        for thread in (holder, evictor, saver):
+            thread.join()
+    assert len(favorites.user(user)) == 1
+    favorites.close()
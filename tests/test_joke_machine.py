@@ -12,6 +12,7 @@ from joke_machine.app import (
     save_favorite,
     tell_joke_with_delay,
 )
+from joke_machine.favorites import FavoritesLog
 
 
 def test_print_header(capsys):
@@ -124,8 +125,7 @@ def test_save_favorite(mock_datetime, favorites_path_patch, capsys):
     save_favorite(joke)
 
     # Check that the joke was saved to the file
-    with open(favorites_path_patch) as f:
-        saved_data = json.load(f)
+    saved_data = list(FavoritesLog(favorites_path_patch))
 
     assert len(saved_data) == 1
     assert saved_data[0]["joke"] == "Test joke to save"
@@ -0,0 +1,152 @@
+import sys
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine import metrics as metrics_module
+from joke_machine.app import (
+    add_favorite,
+    get_joke,
+    get_jokes,
+    list_favorites,
+    main,
+    tell_joke_with_delay,
+    use_metrics,
+)
+from joke_machine.corpus import write_packed_corpus
+from joke_machine.metrics import Histogram, Metrics
+
+
+@pytest.fixture
+def metrics():
+    """Collect metrics for the duration of a test"""
+    collector = Metrics()
+    use_metrics(collector)
+    yield collector
+    use_metrics(None)
+
+
+def parse(text):
+    """Return the samples of a Prometheus text page by name and labels"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets():
+    """Test that observations land in the first bucket bounding them"""
+    histogram = Histogram([0.001, 0.01])
+    for value in (0.0005, 0.001, 0.002, 5):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.cumulative()[-1] == (float("inf"), 4)
+
+
+def test_draws_counted(mock_jokes, metrics):
+    """Test that single and batch draws are counted by requested category"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        for _ in range(8):
+            get_joke("test")
+        get_joke()
+        get_jokes(5, "programming")
+        get_jokes(2, "test")
+
+    assert metrics.draw_counts() == {"test": 10, None: 1, "programming": 5}
+    samples = parse(metrics.export())
+    assert samples['joke_machine_draws_total{category="test"}'] == 10
+    assert samples['joke_machine_draws_total{category="any"}'] == 1
+
+
+def test_draws_counted_across_threads(mock_jokes, metrics):
+    """Test that draws from many threads are counted exactly, while read"""
+
+    def draw():
+        for i in range(200):
+            get_joke(f"new-{i % 10}")
+
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        threads = [threading.Thread(target=draw) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            metrics.draw_counts()
+        for thread in threads:
+            thread.join()
+
+    assert metrics.draw_counts() == {f"new-{i}": 160 for i in range(10)}
+    assert metrics.draw_counts() == {f"new-{i}": 160 for i in range(10)}
+
+
+def test_category_labels_are_capped(metrics):
+    """Test that unknown categories cannot grow the draw table without bound"""
+    with patch.object(metrics_module, "MAX_LABELS", 2):
+        for category in ("a", "b", "c", "d"):
+            get_joke(category)
+
+    assert metrics.draw_counts() == {"a": 1, "b": 1, "_other": 2}
+
+
+def test_label_escaping(metrics):
+    """Test that category labels are escaped for the text format"""
+    get_joke('say "hi"\\')
+
+    assert 'category="say \\"hi\\"\\\\"' in metrics.export()
+
+
+def test_disabled_by_default(mock_jokes):
+    """Test that nothing is collected without a collector"""
+    collector = Metrics()
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        get_joke("test")
+
+    assert collector.draw_counts() == {}
+
+
+def test_delivery_and_favorites(tmp_path, monkeypatch, metrics, capsys):
+    """Test the delivery and favorites counters and latencies"""
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES", str(tmp_path / "favorites.db"))
+    tell_joke_with_delay("Why? Because.", 0)
+    add_favorite("Why? Because.")
+    add_favorite("Why? Because.")
+    list_favorites(pager=False)
+
+    samples = parse(metrics.export())
+    assert samples["joke_machine_deliveries_total"] == 1
+    assert samples["joke_machine_delivery_seconds_count"] == 1
+    assert samples["joke_machine_favorites_saved_total"] == 1
+    assert samples["joke_machine_favorites_duplicate_total"] == 1
+    assert samples["joke_machine_favorite_save_seconds_count"] == 2
+    assert samples["joke_machine_favorites_listed_total"] == 1
+    assert samples['joke_machine_favorites_list_seconds_bucket{le="+Inf"}'] == 1
+
+
+def test_cli_stats(mock_jokes, capsys):
+    """Test that --stats prints the metrics to stderr after the command"""
+    argv = ["joke_machine", "--category", "test", "--no-delay", "--stats"]
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch.object(sys, "argv", argv):
+            main()
+
+    captured = capsys.readouterr()
+    assert "joke_machine" not in captured.out
+    samples = parse(captured.err)
+    assert samples['joke_machine_draws_total{category="test"}'] == 1
+    assert samples["joke_machine_deliveries_total"] == 1
+
+
+def test_cli_stats_with_corpus(tmp_path, mock_jokes, mock_facts, capsys):
+    """Test that jokes drawn from a packed corpus are counted"""
+    path = tmp_path / "corpus.jpk"
+    write_packed_corpus(str(path), mock_jokes, mock_facts)
+    argv = ["joke_machine", "--corpus", str(path), "-c", "test", "--no-delay"]
+    with patch("joke_machine.app._corpus", None):
+        with patch.object(sys, "argv", argv + ["--stats"]):
+            main()
+
+    samples = parse(capsys.readouterr().err)
+    assert samples['joke_machine_draws_total{category="test"}'] == 1
@@ -0,0 +1,113 @@
+import io
+import json
+import shlex
+import sys
+
+from joke_machine import output
+from joke_machine.app import list_favorites
+from joke_machine.favorites import FavoritesLog, iter_json_array
+from joke_machine.output import OutputBuffer
+
+
+class CountingStream(io.StringIO):
+    """StringIO that counts write calls"""
+
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+    def isatty(self):
+        return False
+
+
+def test_output_buffer_first_write_is_immediate():
+    """Test that output starts without waiting for the buffer to fill"""
+    stream = CountingStream()
+    out = OutputBuffer(pager=False, stream=stream)
+
+    out.write("first\n")
+    assert stream.getvalue() == "first\n"
+
+    out.write("second\n")
+    assert stream.getvalue() == "first\n"
+
+    out.close()
+    assert stream.getvalue() == "first\nsecond\n"
+
+
+def test_output_buffer_writes_in_chunks(monkeypatch):
+    """Test that many small writes become few large ones"""
+    monkeypatch.setattr(output, "BUFFER_SIZE", 100)
+    stream = CountingStream()
+
+    with OutputBuffer(pager=False, stream=stream) as out:
+        for i in range(100):
+            out.write(f"line {i:04d}\n")
+
+    assert stream.getvalue().count("\n") == 100
+    assert stream.writes < 20
+
+
+def test_output_buffer_pager(tmp_path, monkeypatch):
+    """Test that output is piped through $PAGER"""
+    target = tmp_path / "paged.txt"
+    script = f"import sys; open({str(target)!r}, 'w').write(sys.stdin.read())"
+    monkeypatch.setenv("PAGER", shlex.join([sys.executable, "-c", script]))
+
+    with OutputBuffer(pager=True) as out:
+        out.write("through the pager\n")
+
+    assert target.read_text() == "through the pager\n"
+
+
+def test_output_buffer_pager_quit_early(monkeypatch):
+    """Test that a pager exiting early stops output without an error"""
+    monkeypatch.setattr(output, "BUFFER_SIZE", 10)
+    monkeypatch.setenv("PAGER", shlex.join([sys.executable, "-c", "pass"]))
+
+    with OutputBuffer(pager=True) as out:
+        while not out.broken:
+            out.write("more text\n")
+
+
+def test_list_favorites_uses_one_buffered_writer(favorites_path_patch, capsys):
+    """Test that listing does not issue one write per line"""
+    log = FavoritesLog(favorites_path_patch, fsync=False)
+    log.extend(
+        {"joke": f"Joke {i}", "saved_at": "2023-01-01 12:00:00"} for i in range(500)
+    )
+    stream = CountingStream()
+
+    with capsys.disabled():
+        original, sys.stdout = sys.stdout, stream
+        try:
+            list_favorites()
+        finally:
+            sys.stdout = original
+
+    assert "500. Joke 499" in stream.getvalue()
+    assert stream.writes < 10
+
+
+def test_list_favorites_streams_legacy_file(favorites_path_patch, capsys):
+    """Test listing a legacy JSON array without migrating it"""
+    entries = [{"joke": f"Old joke {i}", "saved_at": "2023-01-01"} for i in range(50)]
+    with open(favorites_path_patch, "w") as f:
+        json.dump(entries, f, indent=2)
+
+    list_favorites(pager=False)
+
+    assert "50. Old joke 49" in capsys.readouterr().out
+    assert FavoritesLog(favorites_path_patch).is_legacy()
+
+
+def test_iter_json_array_is_incremental():
+    """Test that items are yielded before the whole file is read"""
+    raw = io.BytesIO(json.dumps([{"joke": str(i)} for i in range(1000)]).encode())
+    items = iter_json_array(raw, chunk_size=64)
+
+    assert next(items) == {"joke": "0"}
+    assert raw.tell() < 1000
+    assert len(list(items)) == 999
@@ -0,0 +1,81 @@
+import io
+import pstats
+import sys
+from unittest.mock import patch
+
+from joke_machine.app import (
+    interactive_mode,
+    main,
+    start_profiling,
+    stop_profiling,
+    tell_joke_with_delay,
+)
+from joke_machine.profiling import Profiler
+
+
+def sleep_time(stats):
+    """Return the time a profile attributes to time.sleep"""
+    for (_, _, name), (_, _, tottime, _, _) in stats.stats.items():
+        if name == "<built-in method time.sleep>":
+            return tottime
+    return 0.0
+
+
+def test_pauses_are_left_out():
+    """Test that sleeping through the profiler does not count as time"""
+    profiler = Profiler()
+    profiler.enable()
+    profiler.sleep(0.05)
+    with profiler.paused():
+        with profiler.paused():
+            profiler.sleep(0.01)
+    profiler.disable()
+
+    assert profiler.waited >= 0.06
+    assert sleep_time(profiler.stats()) < 0.01
+
+
+def test_delivery_pauses_go_through_profiler(tmp_path, capsys):
+    """Test that telling a joke while profiling keeps its pause off the clock"""
+    path = tmp_path / "joke.prof"
+    out = io.StringIO()
+    profiler = start_profiling()
+    tell_joke_with_delay("Why? Because.", 0.05)
+    stop_profiling(profiler, str(path), out)
+
+    assert profiler.waited >= 0.05
+    assert sleep_time(pstats.Stats(str(path))) < 0.01
+    assert "tell_joke_with_delay" in out.getvalue()
+    assert f"Profile written to {path}" in out.getvalue()
+
+
+@patch("time.sleep")
+def test_cli_profile(mock_sleep, tmp_path, capsys):
+    """Test that --profile writes a profile and prints a summary to stderr"""
+    path = tmp_path / "cli.prof"
+    argv = ["joke_machine", "--category", "dad", "--profile", str(path)]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    captured = capsys.readouterr()
+    assert "Profile of" in captured.err
+    assert "_tell_joke" in captured.err
+    assert "Profile of" not in captured.out
+    assert path.exists()
+
+
+@patch("time.sleep")
+def test_interactive_profile(mock_sleep, tmp_path, capsys):
+    """Test the interactive profile on/off command"""
+    path = tmp_path / "Session.prof"
+    commands = ["profile off", "profile on", "profile on", "joke", "profile"]
+    commands += [f"profile off {path}", "quit"]
+    with patch("builtins.input", side_effect=commands):
+        interactive_mode()
+
+    output = capsys.readouterr().out
+    assert "Not profiling" in output
+    assert "Already profiling" in output
+    assert "Usage: profile on|off [file]" in output
+    assert "get_unseen_joke" in output
+    assert path.exists()
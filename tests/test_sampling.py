@@ -0,0 +1,186 @@
+import random
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine import app
+from joke_machine.app import add_favorite, get_popular_joke, get_unseen_joke, main
+from joke_machine.sampling import (
+    NoRepeatSampler,
+    RecentSet,
+    WeightedSampler,
+    fingerprint,
+)
+
+
+def test_recent_set_forgets_oldest():
+    """Test that the ring evicts the oldest key unless it was re-served"""
+    recent = RecentSet(3)
+    for key in (1, 2, 1, 3):
+        recent.add(key)
+
+    assert list(recent.keys()) == [2, 1, 3]
+    assert recent.seen_within(1)
+    assert not recent.seen_within(2, 2)
+
+    recent.add(4)
+    assert not recent.seen_within(2)
+    assert recent.seen_within(1)
+
+
+def test_sampler_never_repeats_within_window():
+    """Test the no-repeat guarantee over many draws"""
+    rng = random.Random(0)
+    jokes = [f"Joke {i}" for i in range(20)]
+    sampler = NoRepeatSampler(window=8)
+
+    draws = [sampler.draw("u", lambda: rng.choice(jokes), 20) for _ in range(500)]
+
+    assert all(len(set(draws[i : i + 9])) == 9 for i in range(len(draws) - 8))
+
+
+def test_sampler_window_capped_by_population():
+    """Test that a category smaller than the window cycles through all jokes"""
+    rng = random.Random(0)
+    jokes = ["a", "b", "c"]
+    sampler = NoRepeatSampler(window=50)
+
+    draws = [sampler.draw("u", lambda: rng.choice(jokes), 3) for _ in range(9)]
+
+    assert [sorted(draws[i : i + 3]) for i in range(0, 9, 3)] == [jokes] * 3
+
+
+def test_sessions_are_independent_and_bounded():
+    """Test per-session memory with LRU eviction of idle sessions"""
+    sampler = NoRepeatSampler(window=5, max_sessions=100)
+
+    for user in range(10_000):
+        sampler.draw(user, lambda: "same", 1)
+
+    assert len(sampler) == 100
+    assert 9_999 in sampler and 0 not in sampler
+
+
+def test_save_and_load(tmp_path):
+    """Test that session state round-trips through the state file"""
+    path = tmp_path / "sessions"
+    sampler = NoRepeatSampler(window=4)
+    for joke in ("a", "b", "c"):
+        sampler.recent("alice").add(fingerprint(joke))
+    sampler.recent("bob").add(fingerprint("z"))
+    sampler.save(path)
+
+    loaded = NoRepeatSampler(window=2)
+    loaded.load(path)
+
+    assert list(loaded.recent("alice").keys()) == [fingerprint("b"), fingerprint("c")]
+    assert loaded.recent("bob").seen_within(fingerprint("z"))
+    assert path.stat().st_size == 8 + 2 * 6 + len("alicebob") + 4 * 4
+
+
+@pytest.mark.parametrize("data", [b"", b"garbage", b"JKSESS1\n\x05\x00\x09"])
+def test_load_ignores_damaged_files(tmp_path, data):
+    """Test that a damaged state file only loses the history"""
+    path = tmp_path / "sessions"
+    path.write_bytes(data)
+    sampler = NoRepeatSampler()
+
+    sampler.load(path)
+
+    assert len(sampler) == 0
+
+
+def test_get_unseen_joke_uses_category_size():
+    """Test no-repeat draws from a small category"""
+    with patch("joke_machine.app.JOKES", {"dad": ["One", "Two"]}):
+        draws = [get_unseen_joke("test-session", "dad") for _ in range(4)]
+
+    assert draws[0] != draws[1] and draws[2] != draws[3]
+
+
+@patch("time.sleep")
+def test_cli_session_persists(mock_sleep, tmp_path, monkeypatch, capsys):
+    """Test that --session avoids repeats across invocations"""
+    monkeypatch.setenv("JOKE_MACHINE_SESSIONS", str(tmp_path / "sessions"))
+    jokes = {"dad": ["First dad joke", "Second dad joke"]}
+    argv = ["joke_machine", "--category", "dad", "--session", "me"]
+
+    told = []
+    with patch("joke_machine.app.JOKES", jokes):
+        for _ in range(2):
+            with patch.object(sys, "argv", argv):
+                main()
+            out = capsys.readouterr().out
+            told.append(next(joke for joke in jokes["dad"] if joke in out))
+
+    assert sorted(told) == jokes["dad"]
+    assert (tmp_path / "sessions").exists()
+
+
+@patch("time.sleep")
+def test_cli_session_from_environment(mock_sleep, tmp_path, monkeypatch, capsys):
+    """Test that $JOKE_MACHINE_SESSION applies to a plain --joke as well"""
+    monkeypatch.setenv("JOKE_MACHINE_SESSIONS", str(tmp_path / "sessions"))
+    monkeypatch.setenv("JOKE_MACHINE_SESSION", "me")
+    jokes = {"dad": ["First dad joke", "Second dad joke"]}
+
+    told = []
+    with patch("joke_machine.app.JOKES", jokes):
+        for _ in range(2):
+            with patch.object(sys, "argv", ["joke_machine", "--joke"]):
+                main()
+            out = capsys.readouterr().out
+            told.append(next(joke for joke in jokes["dad"] if joke in out))
+
+    assert sorted(told) == jokes["dad"]
+    assert (tmp_path / "sessions").exists()
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 8, 33])
+def test_weighted_sampler_matches_prefix_sums(size):
+    """Test the tree against plain prefix sums after updates and appends"""
+    rng = random.Random(size)
+    weights = [rng.randint(0, 5) for _ in range(size)]
+    sampler = WeightedSampler(weights[:-1])
+    sampler.append(weights[-1])
+    for _ in range(20):
+        position = rng.randrange(size)
+        delta = rng.randint(0, 3)
+        weights[position] += delta
+        sampler.add(position, delta)
+
+    for stop in range(size + 1):
+        assert sampler.prefix(stop) == sum(weights[:stop])
+    assert [sampler.weight(i) for i in range(size)] == weights
+
+
+def test_weighted_sampler_draws_by_weight():
+    """Test that draws follow the weights and stay within the range"""
+    sampler = WeightedSampler([1, 0, 3, 0])
+    rng = random.Random(0)
+    draws = [sampler.sample(rng=rng) for _ in range(4000)]
+
+    assert set(draws) == {0, 2}
+    assert 0.7 < draws.count(2) / len(draws) < 0.8
+    assert {sampler.sample(2, 4, rng) for _ in range(50)} == {2}
+    with pytest.raises(ValueError):
+        sampler.sample(3, 4)
+
+
+def test_popular_joke_follows_favorites(tmp_path, monkeypatch):
+    """Test that favorites raise a joke's weight without a rebuild"""
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES", str(tmp_path / "favorites.json"))
+    jokes = {"dad": ["One", "Two"], "puns": ["Three"]}
+    add_favorite("One", "2024-01-01 00:00:00")
+    with patch("joke_machine.app.JOKES", jokes):
+        with patch("joke_machine.app.FAVORITE_BOOST", 9.0):
+            random.seed(0)
+            draws = [get_popular_joke("dad") for _ in range(1000)]
+            assert 0.85 < draws.count("One") / len(draws) < 0.95
+
+            sampler = app._popularity[1]
+            add_favorite("Two", "2024-01-01 00:00:01")
+            assert app._popularity[1] is sampler
+            assert sampler.weight(1) == 10.0
+            assert get_popular_joke("puns") == "Three"
@@ -0,0 +1,125 @@
+import random
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine import search
+from joke_machine.app import load_corpus, main, search_jokes, use_corpus
+from joke_machine.corpus import write_packed_corpus
+from joke_machine.search import SearchIndex, tokenize
+
+
+def brute_force(texts, query, limit):
+    """Rank every text that matches all query terms by the index's scoring"""
+    index = SearchIndex(texts)
+    terms = list(dict.fromkeys(tokenize(query)))
+    results = []
+    for position, text in enumerate(texts):
+        words = set(tokenize(text))
+        score = 0.0
+        for term in terms:
+            weights = dict(index.expand(term))
+            best = max((weights.get(word, 0.0) for word in words), default=0.0)
+            if not best:
+                break
+            score += best
+        else:
+            results.append((position, score * index._norm(position)))
+    results.sort(key=lambda item: (-item[1], item[0]))
+    return [position for position, _ in results[:limit]]
+
+
+def test_prefix_and_ranking():
+    """Test that exact matches outrank prefix matches and shorter texts win"""
+    index = SearchIndex(
+        [
+            "The chicken crossed the road to get to the other side of it.",
+            "Chickens here, chickens there, chickens everywhere.",
+            "A chicken.",
+            "Chickens.",
+            "No poultry here.",
+        ]
+    )
+
+    assert index.search("chicken") == [2, 3, 1, 0]
+    assert index.search("chicken", limit=2) == [2, 3]
+    assert sorted(index.search("CHICK")) == [0, 1, 2, 3]
+    assert index.search("chicken road") == [0]
+    assert index.search("c") == []
+    assert index.search("") == []
+
+
+@pytest.mark.parametrize("query", ["w1", "w2 w3", "w1 w4", "w0 w1 w2", "w"])
+def test_query_plans_agree_with_brute_force(query):
+    """Test both query plans against scoring every text"""
+    rng = random.Random(1)
+    vocab = [f"w{i}" for i in range(6)] + [f"w{i}x" for i in range(3)]
+    texts = [" ".join(rng.choices(vocab, k=rng.randint(1, 6))) for _ in range(300)]
+    expected = brute_force(texts, query, 15)
+    index = SearchIndex(texts)
+
+    assert index.search(query, 15) == expected
+    with patch.object(search, "_EXHAUSTIVE_LIMIT", 0):
+        assert index.search(query, 15) == expected
+    with patch.object(search, "_VERIFY_RATIO", 0):
+        assert index.search(query, 15) == expected
+
+
+def test_search_range_and_labels():
+    """Test restricting a search to a span and labelling results"""
+    index = SearchIndex(["bug one", "bug two", "bug three"], {"a": (0, 2)})
+
+    assert index.search("bug", start=1, stop=3) == [1, 2]
+    assert [index.label(i) for i in range(3)] == ["a", "a", None]
+
+
+def test_search_jokes_and_facts(mock_jokes, mock_facts):
+    """Test searching the built-in jokes and facts by category"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch("joke_machine.app.FUN_FACTS", mock_facts):
+            assert search_jokes("test 2") == [
+                (None, "Test fact 2"),
+                ("test", "Test joke 2?With a punchline"),
+            ]
+            assert search_jokes("bug", category="test") == []
+            assert search_jokes("bug") == [
+                ("programming", mock_jokes["programming"][0])
+            ]
+
+
+def test_search_sees_facts_edited_in_place(mock_jokes, mock_facts):
+    """Test that the index is rebuilt when a fact is replaced in place"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch("joke_machine.app.FUN_FACTS", mock_facts):
+            assert search_jokes("fact 1") == [(None, "Test fact 1")]
+            mock_facts[0] = "Edited trivia"
+
+            assert search_jokes("trivia") == [(None, "Edited trivia")]
+            assert search_jokes("fact 1") == []
+
+
+def test_search_packed_corpus(tmp_path, mock_jokes, mock_facts):
+    """Test that a loaded corpus is searched instead of the built-in jokes"""
+    path = str(tmp_path / "jokes.jpk")
+    write_packed_corpus(path, mock_jokes, mock_facts)
+    corpus = load_corpus(path)
+    try:
+        assert search_jokes("fact 1") == [(None, "Test fact 1")]
+        assert search_jokes("multi", category="test") == [
+            ("test", "Test joke 3. With multiple sentences.")
+        ]
+    finally:
+        use_corpus(None)
+        corpus.close()
+
+
+def test_cli_search(mock_jokes, capsys):
+    """Test that --search prints the matches with their category"""
+    argv = ["joke_machine", "--search", "dark mode", "--limit", "1"]
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch.object(sys, "argv", argv):
+            main()
+
+    output = capsys.readouterr().out
+    assert f"[programming] {mock_jokes['programming'][0]}" in output
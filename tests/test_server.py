@@ -0,0 +1,272 @@
+import asyncio
+import json
+import sys
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine import app
+from joke_machine.app import main
+from joke_machine.loadtest import main as loadtest_main
+from joke_machine.loadtest import percentile, run_load_test
+from joke_machine.metrics import Metrics
+from joke_machine.server import JokeServer, parse_address
+
+
+async def exchange(raw, responses=1):
+    """Send raw bytes to a fresh server and return the parsed responses"""
+    server = JokeServer(port=0, workers=2)
+    await server.start()
+    try:
+        reader, writer = await asyncio.open_connection(*server.address)
+        writer.write(raw)
+        results = []
+        for _ in range(responses):
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode().split("\r\n")
+            headers = dict(line.split(": ", 1) for line in lines[1:] if line)
+            body = await reader.readexactly(int(headers["Content-Length"]))
+            if headers["Content-Type"] == "application/json":
+                body = json.loads(body)
+            else:
+                body = body.decode()
+            results.append((int(lines[0].split()[1]), headers, body))
+        writer.close()
+        return results
+    finally:
+        await server.stop()
+
+
+def request(method, path, body=b"", close=False):
+    """Build a raw HTTP/1.1 request"""
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\n"
+    if body:
+        head += f"Content-Length: {len(body)}\r\n"
+    if close:
+        head += "Connection: close\r\n"
+    return head.encode() + b"\r\n" + body
+
+
+def test_get_joke(mock_jokes):
+    """Test the joke endpoint with a category"""
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        [(status, headers, payload)] = asyncio.run(
+            exchange(request("GET", "/joke?category=programming"))
+        )
+
+    assert status == 200
+    assert headers["Content-Type"] == "application/json"
+    assert payload == {"joke": mock_jokes["programming"][0]}
+
+
+def test_get_fact(mock_facts):
+    """Test the fun fact endpoint"""
+    with patch("joke_machine.app.FUN_FACTS", mock_facts):
+        [(status, _, payload)] = asyncio.run(exchange(request("GET", "/fact")))
+
+    assert status == 200
+    assert payload["fact"] in mock_facts
+
+
+def test_pipelined_requests_answered_in_order(mock_jokes, mock_facts):
+    """Test that pipelined requests on one connection keep their order"""
+    raw = (
+        request("GET", "/health")
+        + request("GET", "/fact")
+        + request("GET", "/jokes?n=3&category=test&unique=1")
+        + request("GET", "/nope", close=True)
+    )
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        with patch("joke_machine.app.FUN_FACTS", mock_facts):
+            results = asyncio.run(exchange(raw, responses=4))
+
+    assert [status for status, _, _ in results] == [200, 200, 200, 404]
+    assert results[0][1]["Connection"] == "keep-alive"
+    assert results[3][1]["Connection"] == "close"
+    assert sorted(results[2][2]["jokes"]) == sorted(mock_jokes["test"])
+
+
+@pytest.mark.parametrize(
+    "raw, status",
+    [
+        (request("GET", "/joke?category=missing"), 404),
+        (request("GET", "/jokes?n=abc"), 400),
+        (request("DELETE", "/favorites"), 405),
+        (request("POST", "/favorites", b"not json"), 400),
+    ],
+)
+def test_errors(raw, status):
+    """Test that bad requests get a JSON error with the right status"""
+    [(got, _, payload)] = asyncio.run(exchange(raw))
+
+    assert got == status
+    assert "error" in payload
+
+
+def test_handler_errors_are_logged(caplog):
+    """Test that a failing handler answers 500 and logs the traceback"""
+    with patch("joke_machine.app.get_fun_fact", side_effect=RuntimeError("boom")):
+        [(status, _, payload)] = asyncio.run(exchange(request("GET", "/fact")))
+
+    assert status == 500
+    assert payload == {"error": "internal server error"}
+    assert "error handling GET /fact" in caplog.text
+    assert "RuntimeError: boom" in caplog.text
+
+
+def test_favorites_round_trip(favorites_env):
+    """Test saving favorites and paging through them"""
+    raw = b"".join(
+        request("POST", "/favorites", json.dumps({"joke": f"Joke {i}"}).encode())
+        for i in range(3)
+    )
+    raw += request("POST", "/favorites", b'{"joke": "Joke 0"}')
+    raw += request("GET", "/favorites?limit=2&offset=1&grep=joke")
+
+    results = asyncio.run(exchange(raw, responses=5))
+
+    assert [status for status, _, _ in results[:3]] == [201, 201, 201]
+    assert results[0][2]["favorite"]["joke"] == "Joke 0"
+    jokes = [entry["joke"] for entry in results[4][2]["favorites"]]
+    assert jokes == ["Joke 1", "Joke 2"]
+
+
+def test_chunked_body_is_rejected(favorites_env):
+    """Test that a chunked body closes the connection instead of being parsed"""
+    smuggled = request("POST", "/favorites", b'{"joke": "Sneaky"}')
+    raw = (
+        b"POST /favorites HTTP/1.1\r\nHost: test\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n" + smuggled
+    )
+
+    [(status, headers, _)] = asyncio.run(exchange(raw))
+
+    assert status == 501
+    assert headers["Connection"] == "close"
+    assert not favorites_env.exists()
+
+
+def test_favorites_per_user(tmp_path, monkeypatch):
+    """Test that favorites saved for one user are only listed for that user"""
+    monkeypatch.setenv("JOKE_MACHINE_FAVORITES_DIR", str(tmp_path / "users"))
+    raw = b"".join(
+        request("POST", "/favorites", json.dumps(body).encode())
+        for body in (
+            {"joke": "Joke A", "user": "alice"},
+            {"joke": "Joke B", "user": "bob"},
+            {"joke": "joke a", "user": "alice"},
+            {"joke": "Joke C", "user": 42},
+        )
+    )
+    raw += request("GET", "/favorites?user=alice")
+    raw += request("GET", "/favorites?user=carol")
+
+    results = asyncio.run(exchange(raw, responses=6))
+
+    assert [status for status, _, _ in results] == [201, 201, 200, 400, 200, 200]
+    assert [entry["joke"] for entry in results[4][2]["favorites"]] == ["Joke A"]
+    assert results[5][2] == {"favorites": []}
+
+
+def test_favorites_empty(favorites_env):
+    """Test listing favorites before any were saved"""
+    [(status, _, payload)] = asyncio.run(exchange(request("GET", "/favorites")))
+
+    assert status == 200
+    assert payload == {"favorites": []}
+
+
+def test_metrics_endpoint(mock_jokes):
+    """Test that /metrics serves the collector's text page, if there is one"""
+    raw = request("GET", "/joke?category=test") + request("GET", "/metrics")
+    [(status, _, _)] = asyncio.run(exchange(request("GET", "/metrics")))
+    assert status == 404
+
+    app.use_metrics(Metrics())
+    try:
+        with patch("joke_machine.app.JOKES", mock_jokes):
+            [_, (status, headers, text)] = asyncio.run(exchange(raw, responses=2))
+    finally:
+        app.use_metrics(None)
+
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/plain")
+    assert 'joke_machine_draws_total{category="test"} 1\n' in text
+
+
+def test_load_test_reports_latency():
+    """Test that the load test reports throughput and percentiles"""
+    result = run_load_test(path="/fact", requests=200, connections=5, pipeline=4)
+
+    assert result["requests"] == 200
+    assert result["errors"] == 0
+    assert result["rps"] > 0
+    assert 0 < result["p50_ms"] <= result["p99_ms"] <= result["max_ms"]
+
+
+@pytest.mark.parametrize(
+    "argv, message",
+    [
+        (["--pipeline", "0"], "pipeline must be at least 1"),
+        (["--connections", "0"], "connections must be at least 1"),
+    ],
+)
+def test_load_test_rejects_empty_settings(argv, message, capsys):
+    """Test that settings which would never send a request are rejected"""
+    with pytest.raises(SystemExit):
+        loadtest_main(argv)
+
+    assert message in capsys.readouterr().err
+
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+
+def test_parse_address():
+    """Test listen address parsing"""
+    assert parse_address("[::1]:8080") == ("::1", 8080)
+    with pytest.raises(ValueError):
+        parse_address("localhost:http")
+
+
+@patch("joke_machine.server.serve")
+def test_main_serve(mock_serve):
+    """Test that --serve starts the service on the given address"""
+    with patch.object(sys, "argv", ["joke_machine", "--serve", "0.0.0.0:9000"]):
+        main()
+
+    mock_serve.assert_called_once_with("0.0.0.0", 9000, 8)
+
+
+def test_get_joke_session_does_not_repeat():
+    """Test that a session query parameter avoids repeats"""
+    raw = request("GET", "/joke?category=dad&session=bot-1") * 2
+    with patch("joke_machine.app.JOKES", {"dad": ["One", "Two"]}):
+        results = asyncio.run(exchange(raw, responses=2))
+
+    assert {payload["joke"] for _, _, payload in results} == {"One", "Two"}
+
+
+def test_popular_joke_runs_on_thread_pool(favorites_env):
+    """Test that popular draws, which may read favorites, leave the event loop"""
+    threads = []
+
+    def draw(category=None):
+        threads.append(threading.current_thread().name)
+        return "A joke"
+
+    raw = request("GET", "/joke?popular=1") + request("GET", "/joke")
+    with patch("joke_machine.app.get_popular_joke", draw):
+        with patch("joke_machine.app.get_joke", draw):
+            results = asyncio.run(exchange(raw, responses=2))
+
+    assert [status for status, _, _ in results] == [200, 200]
+    assert threads[0].startswith("joke-server")
+    assert threads[1] == threading.current_thread().name
@@ -0,0 +1,137 @@
+import asyncio
+from unittest.mock import patch
+
+
+from joke_machine.app import interactive_mode
+from joke_machine.session import COMMANDS, Session, SessionServer
+
+
+def texts(events):
+    """Return the text shown by a list of events"""
+    return "\n".join(event.text for event in events)
+
+
+async def converse(server, script):
+    """Send a script to a session server and return the transcript"""
+    reader, writer = await asyncio.open_connection(*server.address)
+    writer.write(script)
+    transcript = await reader.read()
+    writer.close()
+    return transcript.decode()
+
+
+def test_help_lists_every_command():
+    """Test that help is generated from the command table"""
+    output = texts(Session().handle("help"))
+
+    for cmd in COMMANDS.values():
+        assert cmd.usage in output
+    assert COMMANDS["quit"] is COMMANDS["exit"]
+
+
+def test_scripted_session(mock_jokes, favorites_env):
+    """Test a session driven without a terminal"""
+    session = Session(delay=0)
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        assert texts(session.handle("save")) == "No joke to save. Tell a joke first!"
+        events = session.handle("JOKE programming extra words")
+        assert [event.kind for event in events] == ["setup", "punchline"]
+        assert session.last_joke == mock_jokes["programming"][0]
+        assert "Joke saved" in texts(session.handle("save"))
+        assert session.last_joke in texts(session.handle("favorites"))
+        assert "test (3 jokes)" in texts(session.handle("categories"))
+        assert "[programming]" in texts(session.handle("search dark mode"))
+        assert texts(session.handle("search")) == "Usage: search <words>"
+        assert "didn't understand" in texts(session.handle("dance"))
+        assert "didn't understand" in texts(session.handle(""))
+    assert not session.closed
+
+
+def test_window_without_saved_history(mock_jokes):
+    """Test that an in-memory session remembers its own window of jokes"""
+    session = Session(window=2, delay=0)
+    with patch("joke_machine.app.JOKES", mock_jokes):
+        for _ in range(4):
+            session.handle("joke")
+
+    assert len(session.sampler.recent(session.name)) == 2
+    assert Session().sampler is None  # the shared default sampler
+
+
+def test_interactive_mode_ends_on_eof(capsys):
+    """Test that the terminal wrapper stops at the end of its input"""
+    with patch("builtins.input", side_effect=["fact", EOFError]):
+        interactive_mode()
+
+    assert "Welcome to Interactive Mode!" in capsys.readouterr().out
+
+
+@patch("joke_machine.app.list_favorites")
+def test_interactive_favorites_are_paged(mock_list_favorites, capsys):
+    """Test that the terminal REPL lists favorites through list_favorites"""
+    with patch("builtins.input", side_effect=["favorites", "quit"]):
+        interactive_mode()
+
+    mock_list_favorites.assert_called_once_with()
+
+
+def test_server_sessions_are_concurrent(mock_jokes, sleep_tracker):
+    """Test that punchline pauses of many sessions overlap"""
+    jokes = {"test": [mock_jokes["test"][1]]}
+    sleeps = sleep_tracker(50)
+
+    async def run():
+        server = SessionServer(port=0, delay=0.5)
+        await server.start()
+        try:
+            return await asyncio.gather(
+                *(converse(server, b"joke test\nquit\n") for _ in range(50))
+            )
+        finally:
+            await server.stop()
+
+    with patch("joke_machine.app.JOKES", jokes):
+        transcripts = asyncio.run(run())
+
+    assert sleeps.peak == 50
+    assert sleeps.delays == [0.5] * 50
+    for transcript in transcripts:
+        assert "Test joke 2?\nWith a punchline\n" in transcript
+        assert transcript.rstrip().endswith("Goodbye!")
+
+
+def test_server_hides_local_commands(favorites_env):
+    """Test that remote sessions cannot profile and do get disk commands"""
+
+    async def run():
+        server = SessionServer(port=0, delay=0)
+        await server.start()
+        try:
+            return await converse(server, b"profile on\nhelp\nfavorites\nquit\n")
+        finally:
+            await server.stop()
+
+    transcript = asyncio.run(run())
+
+    assert "didn't understand" in transcript
+    assert "profile on|off" not in transcript
+    assert "You haven't saved any favorites yet." in transcript
+
+
+def test_server_drops_long_lines():
+    """Test that a line over the limit closes the connection"""
+
+    async def run():
+        server = SessionServer(port=0, delay=0)
+        await server.start()
+        try:
+            transcript = await converse(server, b"x" * 10_000 + b"\n")
+            return transcript, server.sessions
+        finally:
+            await server.stop()
+
+    transcript, sessions = asyncio.run(run())
+
+    assert "Welcome to Interactive Mode!" in transcript
+    assert "didn't understand" not in transcript
+    assert sessions == 0
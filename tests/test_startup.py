@@ -0,0 +1,107 @@
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from joke_machine.app import _fast_main, main
+
+# Cold-start budget for importing joke_machine.app, as a multiple of the time
+# `import json` takes on the same machine in the same run
+IMPORT_BUDGET_RATIO = float(os.environ.get("JOKE_MACHINE_IMPORT_BUDGET_RATIO", 5))
+
+# Modules the fast path must not import
+HEAVY_MODULES = [
+    "argparse",
+    "datetime",
+    "json",
+    "mmap",
+    "sqlite3",
+    "subprocess",
+    "tempfile",
+    "textwrap",
+]
+
+
+def importtime(*args):
+    """Run Python with -X importtime and return {module: cumulative us}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@pytest.mark.parametrize("flag", ["--version", "--fact"])
+def test_fast_path_skips_heavy_imports(flag):
+    """Test that common invocations do not import feature modules"""
+    preloaded = importtime("-c", "pass")
+    imported = importtime("-m", "joke_machine", flag)
+
+    assert "joke_machine.app" in imported
+    heavy = [name for name in HEAVY_MODULES if name in imported]
+    assert [name for name in heavy if name not in preloaded] == []
+
+
+def best_import_time(module):
+    """Return the fastest of three cold imports of a module, in us"""
+    return min(importtime("-c", f"import {module}")[module] for _ in range(3))
+
+
+def test_import_time_budget():
+    """Test that importing the app stays within the cold-start budget"""
+    baseline = best_import_time("json")
+    best = best_import_time("joke_machine.app")
+
+    assert best < IMPORT_BUDGET_RATIO * baseline, (
+        f"import took {best} us, {best / baseline:.1f}x import json"
+    )
+
+
+@patch("time.sleep")
+def test_fast_path_tells_joke(mock_sleep, capsys):
+    """Test that --joke is handled by the fast path"""
+    assert _fast_main(["--joke"])
+
+    captured = capsys.readouterr()
+    assert "JokeMachine" in captured.out
+
+
+def test_fast_path_fact(capsys):
+    """Test that --fact is handled by the fast path"""
+    with patch("joke_machine.app.FUN_FACTS", ["Only fact"]):
+        assert _fast_main(["-f"])
+
+    assert "Only fact" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "argv", [[], ["--joke", "--save"], ["--category", "dad"], ["--favorites"]]
+)
+def test_fast_path_defers_other_invocations(argv):
+    """Test that anything else goes through the full parser"""
+    assert not _fast_main(argv)
+
+
+def test_main_version_matches_parser(capsys):
+    """Test that the fast --version output matches argparse's"""
+    with patch.object(sys, "argv", ["joke_machine", "--version"]):
+        main()
+    fast = capsys.readouterr().out
+
+    with patch.object(sys, "argv", ["joke_machine", "--version", "--joke"]):
+        with pytest.raises(SystemExit):
+            main()
+    slow = capsys.readouterr().out
+
+    assert fast == slow